@@ -0,0 +1,215 @@
+import os
+import queue
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+import model
+from model import DQN, n_observations, n_actions
+from regicideAI import RegicideGame_AI
+from replay import ReplayBuffer, Batch
+from results_log import ResultsWriter
+
+# NUM_ACTORS is the number of processes playing games, the learner takes the remaining core
+# PUBLISH_INTERVAL is the number of learner optimizations between weight publishes
+# ACTOR_SYNC_STEPS is the number of env steps an actor plays between checks for new weights
+# ACTOR_EPS_BASE and ACTOR_EPS_ALPHA spread the actors' fixed epsilons, actor i of K uses
+#     ACTOR_EPS_BASE ** (1 + ACTOR_EPS_ALPHA * i / (K - 1)), so a few explore a lot and most play near greedy
+# SAVE_INTERVAL is the number of learner optimizations between saves of policy_net and the Trainer checkpoint
+# CHECKPOINT_PATH and RESULTS_PATH are the actor-learner's own, apart from model.py's, since its checkpoints
+#     hold no replay memory and count only its own games
+NUM_ACTORS = max(1, (os.cpu_count() or 2) - 1)
+PUBLISH_INTERVAL = 100
+ACTOR_SYNC_STEPS = 200
+ACTOR_EPS_BASE = 0.4
+ACTOR_EPS_ALPHA = 7
+SAVE_INTERVAL = 10_000
+CHECKPOINT_PATH = './' + model.MODEL_NAME + '_actor_learner_checkpoint.pt'
+RESULTS_PATH = './' + model.MODEL_NAME + '_actor_learner_scores.bin'
+
+
+class SharedReplay:
+    """
+    Replay ring in shared memory, written by the actors and sampled by the learner.
+    The ring is split into one segment per actor, so actors never write the same slot and need no lock.
+    counts[actor] is how many transitions the actor has written, the learner reads it to know which slots are filled.
+    A slot being overwritten while the learner gathers it can be sampled half written, like any lock free
+    replay, the rare torn transition is accepted.
+    """
+
+    def __init__(self, capacity:int, actors:int, device=model.device):
+        self.segment = capacity // actors
+        self.buffer = ReplayBuffer(self.segment * actors, n_observations, n_actions).share_memory()
+        self.counts = torch.zeros(actors, dtype=torch.int64).share_memory_()
+        self.device = device
+
+    def __len__(self):
+        return int(self.counts.clamp(max=self.segment).sum())
+
+    def push(self, actor:int, state, action, next_state, reward, next_mask=None):
+        count = int(self.counts[actor])
+        self.buffer.write(actor * self.segment + count % self.segment, state, action, next_state, reward, next_mask)
+        self.counts[actor] = count + 1
+
+    def sample(self, batch_size:int)->Batch:
+        """Uniform sample over every filled slot, with replacement, moved to device."""
+        filled = self.counts.clamp(max=self.segment)
+        ends = filled.cumsum(0)
+        draws = torch.randint(0, int(ends[-1]), (batch_size,))
+        actors = torch.searchsorted(ends, draws, right=True)
+        slots = actors * self.segment + draws - (ends[actors] - filled[actors])
+        batch = self.buffer.gather(slots)
+        return Batch(*(None if tensor is None else tensor.to(self.device) for tensor in batch))
+
+
+class SharedWeights:
+    """
+    Copy of policy_net in shared memory.
+    The learner publish()es its weights, actors pull() them into their own net when version has moved on.
+    """
+
+    def __init__(self, ctx):
+        self.net = DQN(n_observations, n_actions).share_memory()
+        self.version = torch.zeros(1, dtype=torch.int64).share_memory_()
+        self.lock = ctx.Lock()
+
+    def publish(self, policy_net:DQN):
+        with self.lock, torch.no_grad():
+            for shared, weights in zip(self.net.state_dict().values(), policy_net.state_dict().values()):
+                shared.copy_(weights)
+            self.version += 1
+
+    def pull(self, net:DQN, version:int)->int:
+        """Loads the shared weights into net if they are newer than version, returns the version net has."""
+        if int(self.version) == version:
+            return version
+        with self.lock:
+            net.load_state_dict(self.net.state_dict())
+            return int(self.version)
+
+
+def actor_epsilon(index:int, actors:int)->float:
+    if actors == 1:
+        return ACTOR_EPS_BASE
+    return ACTOR_EPS_BASE ** (1 + ACTOR_EPS_ALPHA * index / (actors - 1))
+
+def run_actor(index:int, actors:int, replay:SharedReplay, weights:SharedWeights, stop, results):
+    """Actor process, plays games with a CPU copy of policy_net and writes every transition to replay."""
+    torch.set_num_threads(1)
+    env = RegicideGame_AI()
+    net = DQN(n_observations, n_actions)
+    version = weights.pull(net, -1)
+    eps = actor_epsilon(index, actors)
+    steps = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        env.reset()
+        state = model.state_tensor(env, 'cpu')
+        legal_mask = model.legal_mask_tensor(env, 'cpu')
+        invalid_action = False
+        done = False
+        for t in range(model.CYCLE_LIMIT):
+            action = model.greedy_action(net, state, legal_mask, eps, invalid_action)
+            observation, reward, done, invalid_action = env.step(action)
+
+            next_state = None
+            legal_mask = None
+            if not done:
+                next_state = model.state_tensor(env, 'cpu')
+                legal_mask = model.legal_mask_tensor(env, 'cpu')
+            replay.push(index, state, action, next_state, reward, legal_mask)
+            state = next_state
+
+            steps += 1
+            if steps % ACTOR_SYNC_STEPS == 0:
+                version = weights.pull(net, version)
+            if done or stop.is_set():
+                break
+        if done:
+            results.put((env.game_result, len(env.enemies), env.steps_taken, env.invalid_steps_taken,
+                         time.perf_counter() - start))
+
+
+def train(num_actors:int=NUM_ACTORS, gradient_steps:int|None=None, duration:float|None=None,
+          resume:bool=model.RESUME)->int:
+    """
+    Trains policy_net with num_actors actor processes and this process as the learner.
+    The learner optimizes continuously once the replay holds a batch, until gradient_steps optimizations,
+    duration seconds or a KeyboardInterrupt. Finished games are logged like model.Trainer.train().
+    Returns the number of games the actors finished.
+    With resume, the nets, optimizer and counters continue from CHECKPOINT_PATH, and RESULTS_PATH is cut back
+    to the games that checkpoint counted. The replay starts empty, it lives in shared memory and isn't saved.
+
+    Each optimization is Trainer.optimize_model(), so target_net follows policy_net after every gradient step
+    (TAU or HARD_UPDATE_EVERY) as in Trainer.train(). Unlike Trainer.train() the learner isn't paced by env steps
+    (TRAIN_EVERY, GRADIENT_STEPS) or episodes (episode_target): the actors play as fast as they can, so saves
+    come every SAVE_INTERVAL optimizations instead of every CHECKPOINT_EVERY episodes.
+    """
+    ctx = mp.get_context('spawn')
+    replay = SharedReplay(model.MAX_MEM, num_actors)
+    trainer = model.Trainer(memory=replay, resume=resume, checkpoint_path=CHECKPOINT_PATH)
+    policy_net = trainer.policy_net
+    weights = SharedWeights(ctx)
+    weights.publish(policy_net)
+    stop = ctx.Event()
+    results = ctx.Queue()
+    actors = [
+        ctx.Process(target=run_actor, args=(index, num_actors, replay, weights, stop, results), daemon=True)
+        for index in range(num_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    # checkpoints count the games logged here, as episodes and as rows
+    results_log = ResultsWriter(RESULTS_PATH, rows=trainer.result_rows)
+    trainer.results = results_log
+    games = 0
+    def log_results():
+        nonlocal games
+        while True:
+            try:
+                info = results.get_nowait()
+            except queue.Empty:
+                return
+            games += 1
+            trainer.episodes += 1
+            results_log.append(*info)
+            game_result, castle_size, steps, invalid_steps, wall_time = info
+            trainer.metrics.on_step(steps)
+            trainer.metrics.on_episode(game_result, castle_size, steps, invalid_steps)
+            trainer.metrics.maybe_report()
+
+    deadline = time.perf_counter() + duration if duration else None
+    step = 0
+    try:
+        while (gradient_steps is None or step < gradient_steps) and \
+                (deadline is None or time.perf_counter() < deadline):
+            log_results()
+            if len(replay) < trainer.batch_size:
+                time.sleep(0.01)
+                continue
+            trainer.optimize_model()
+            step += 1
+            if step % PUBLISH_INTERVAL == 0:
+                weights.publish(policy_net)
+            if step % SAVE_INTERVAL == 0:
+                print(f'Learner step {step}, {games} games, {int(replay.counts.sum())} transitions')
+                torch.save(policy_net.state_dict(), model.MODEL_PKL_PATH)
+                trainer.save_checkpoint()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=5)
+        log_results()
+        results_log.close()
+    torch.save(policy_net.state_dict(), model.MODEL_PKL_PATH)
+    trainer.save_checkpoint()
+    trainer.wait_for_checkpoint()
+    return games
+
+
+if __name__ == "__main__":
+    train()
@@ -0,0 +1,16 @@
+from regicideAI import RegicideGame_AI
+
+# settings shared by training (model.py) and the torch free evaluation path (evaluate.py, numpy_policy.py)
+# MODEL_PKL_PATH is where policy_net's weights are saved
+# CYCLE_LIMIT is the number of steps after which a game is abandoned
+MODEL_NAME = 'model3'
+MODEL_PKL_PATH = './' + MODEL_NAME + '_.pkl'
+CYCLE_LIMIT = 5_000
+
+# on defend turns only offer the agent the minimal discards, see RegicideGame_AI.candidate_action_mask()
+REDUCED_DEFENSE_ACTIONS = True
+
+
+def agent_action_mask(env:RegicideGame_AI)->tuple[bool, ...]:
+    """Mask of the actions the agent may choose in env's current state."""
+    return env.candidate_action_mask() if REDUCED_DEFENSE_ACTIONS else env.legal_action_mask()
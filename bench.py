@@ -0,0 +1,290 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+import torch
+
+import model
+from model import DQN, n_observations, n_actions
+from numpy_policy import NumpyDQN
+from regicideAI import RegicideGame_AI
+from vector_env import VectorRegicideEnv
+
+# every workload is seeded with SEED, so runs time the same games and batches
+SEED = 0
+# a metric regresses if it is more than TOLERANCE worse than the baseline
+TOLERANCE = 0.10
+
+
+class Result(NamedTuple):
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool
+
+
+def seed_all(seed:int=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+def median_ns(samples:list[int])->float:
+    return statistics.median(samples) if samples else 0.0
+
+def random_legal_step(env:RegicideGame_AI):
+    legal = env.legal_actions()
+    return env.step(legal[random.randrange(len(legal))])
+
+
+def bench_engine_games(games:int)->list[Result]:
+    """Whole games of RegicideGame_AI under a random legal policy."""
+    seed_all()
+    env = RegicideGame_AI()
+    steps = 0
+    start = time.perf_counter()
+    for _ in range(games):
+        env.reset()
+        while env.running:
+            random_legal_step(env)
+            steps += 1
+    elapsed = time.perf_counter() - start
+    return [
+        Result('engine_games_per_sec', games / elapsed, 'games/s', True),
+        Result('engine_steps_per_sec', steps / elapsed, 'steps/s', True),
+    ]
+
+def bench_env_latency(games:int)->list[Result]:
+    """Per call latency of RegicideGame_AI.step, reset, get_state and observe, medians over every call."""
+    seed_all()
+    env = RegicideGame_AI()
+    step_ns, reset_ns, state_ns, observe_ns = [], [], [], []
+    clock = time.perf_counter_ns
+    for _ in range(games):
+        start = clock()
+        env.reset()
+        reset_ns.append(clock() - start)
+        while env.running:
+            start = clock()
+            env.get_state()
+            state_ns.append(clock() - start)
+            env.observation_dirty = True
+            start = clock()
+            env.observe()
+            observe_ns.append(clock() - start)
+            legal = env.legal_actions()
+            action = legal[random.randrange(len(legal))]
+            start = clock()
+            env.step(action)
+            step_ns.append(clock() - start)
+    return [
+        Result('env_step_latency', median_ns(step_ns) / 1000, 'us', False),
+        Result('env_reset_latency', median_ns(reset_ns) / 1000, 'us', False),
+        Result('env_get_state_latency', median_ns(state_ns) / 1000, 'us', False),
+        Result('env_observe_latency', median_ns(observe_ns) / 1000, 'us', False),
+    ]
+
+def validation_workload(games:int)->tuple[list, list]:
+    """(player, command) attack pairs and (player, command, damage) defend pairs met in random games."""
+    seed_all()
+    env = RegicideGame_AI()
+    attacks, defends = [], []
+    for _ in range(games):
+        env.reset()
+        while env.running:
+            player = env.active_player
+            hand_player = type(player)(player.name, player.hand_limit)
+            for card in player.hand:
+                hand_player.add_to_hand(card)
+            for action in env.legal_actions():
+                command = hand_player.icmd_to_command(env.int_to_icmd[action])
+                if env.is_player_turn:
+                    attacks.append((hand_player, command))
+                else:
+                    defends.append((hand_player, command, env.current_enemy.attack))
+            random_legal_step(env)
+    return attacks, defends
+
+def bench_validation(games:int, repeats:int)->list[Result]:
+    """Player.validate_attack_command and validate_defend_command on legal commands of real positions."""
+    attacks, defends = validation_workload(games)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for player, command in attacks:
+            player.validate_attack_command(command)
+    attack_rate = len(attacks) * repeats / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for player, command, damage in defends:
+            player.validate_defend_command(command, damage)
+    defend_rate = len(defends) * repeats / (time.perf_counter() - start)
+    return [
+        Result('validate_attack_per_sec', attack_rate, 'calls/s', True),
+        Result('validate_defend_per_sec', defend_rate, 'calls/s', True),
+    ]
+
+def filled_trainer(batch_size:int, transitions:int)->model.Trainer:
+    """Trainer with fresh nets (no files read) and memory holding transitions of random games."""
+    seed_all()
+    trainer = model.Trainer(policy_net=DQN(n_observations, n_actions).to(model.device),
+                            batch_size=batch_size, resume=False)
+    env = RegicideGame_AI()
+    while len(trainer.memory) < transitions:
+        state, info = env.reset()
+        while env.running:
+            legal = env.legal_actions()
+            action = legal[random.randrange(len(legal))]
+            next_state, reward, done, invalid_action = env.step(action)
+            trainer.memory.push(state, action, None if done else next_state, reward,
+                                None if done else model.agent_action_mask(env))
+            state = next_state
+    return trainer
+
+def bench_optimize(batch_sizes:tuple[int, ...], steps:int)->list[Result]:
+    """Replay sample plus one optimize_model step, median time at each batch size."""
+    results = []
+    for batch_size in batch_sizes:
+        trainer = filled_trainer(batch_size, max(batch_size, 4096))
+        trainer.optimize_model()
+        samples = []
+        for _ in range(steps):
+            start = time.perf_counter_ns()
+            trainer.optimize_model()
+            samples.append(time.perf_counter_ns() - start)
+        results.append(Result(f'optimize_step_b{batch_size}', median_ns(samples) / 1e6, 'ms', False))
+    return results
+
+def bench_training_loop(episodes:int)->list[Result]:
+    """End to end Trainer.play_episode, acting, storing and learning every env step."""
+    trainer = filled_trainer(model.BATCH_SIZE, model.BATCH_SIZE)
+    env = RegicideGame_AI()
+    steps = trainer.env_steps
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for episode in range(1, episodes + 1):
+            trainer.play_episode(env, episode)
+    elapsed = time.perf_counter() - start
+    return [Result('train_env_steps_per_sec', (trainer.env_steps - steps) / elapsed, 'steps/s', True)]
+
+def bench_policy_latency(decisions:int)->list[Result]:
+    """Per decision latency of a masked greedy action from one state, torch DQN against the NumPy forwards."""
+    seed_all()
+    env = RegicideGame_AI()
+    env.reset()
+    net = DQN(n_observations, n_actions).eval()
+    state = env.observe().astype(np.float32)
+    legal = np.array(model.agent_action_mask(env))
+    tensor = torch.from_numpy(state).unsqueeze(0)
+    legal_tensor = torch.from_numpy(legal).unsqueeze(0)
+
+    def torch_act():
+        with torch.no_grad():
+            return net(tensor).masked_fill(~legal_tensor, -np.inf).argmax().item()
+
+    results = []
+    policies = (
+        ('torch', torch_act),
+        ('numpy', lambda numpy_net=NumpyDQN.from_state_dict(net.state_dict()): numpy_net.act(state, legal)),
+        ('int8', lambda int8_net=NumpyDQN.from_state_dict(net.state_dict(), True): int8_net.act(state, legal)),
+    )
+    for name, act in policies:
+        samples = []
+        for _ in range(decisions):
+            start = time.perf_counter_ns()
+            act()
+            samples.append(time.perf_counter_ns() - start)
+        results.append(Result(f'policy_{name}_latency', median_ns(samples) / 1000, 'us', False))
+    return results
+
+def bench_vector_env(num_envs:int, steps:int)->list[Result]:
+    """VectorRegicideEnv steps with random legal actions."""
+    env = VectorRegicideEnv(num_envs, seed=SEED)
+    rng = np.random.default_rng(SEED)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        actions = (rng.random((num_envs, env.action_space)) * env.legal_action_mask()).argmax(1)
+        env.step(actions)
+    return [Result('vector_env_steps_per_sec', num_envs * steps / (time.perf_counter() - start), 'steps/s', True)]
+
+
+def run_benchmarks(quick:bool=False)->list[Result]:
+    torch.set_num_threads(1)
+    scale = 1 if quick else 5
+    results = []
+    results += bench_engine_games(40 * scale)
+    results += bench_env_latency(20 * scale)
+    results += bench_validation(10 * scale, 3)
+    results += bench_optimize((32, 128, 512), 10 * scale)
+    results += bench_training_loop(4 * scale)
+    results += bench_policy_latency(1000 * scale)
+    results += bench_vector_env(256, 40 * scale)
+    return results
+
+def git_commit()->str|None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def results_to_json(results:list[Result], quick:bool)->dict:
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'quick': quick,
+            'seed': SEED,
+        },
+        'results': {result.name: result._asdict() for result in results},
+    }
+
+def compare(results:list[Result], baseline:dict, tolerance:float=TOLERANCE)->list[str]:
+    """Lines describing every metric more than tolerance worse than baseline, empty if none regressed."""
+    regressions = []
+    for result in results:
+        base = baseline['results'].get(result.name)
+        if not base or not base['value']:
+            continue
+        change = result.value / base['value'] - 1
+        worse = -change if result.higher_is_better else change
+        if worse > tolerance:
+            regressions.append(f'{result.name}: {result.value:.4g} {result.unit} vs baseline '
+                               f'{base["value"]:.4g} ({change:+.1%})')
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Engine, env and learner throughput benchmarks.')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads, for a fast check')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against this results JSON, exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown, 0.1 is 10%%')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick)
+    for result in results:
+        print(f'{result.name:28} {result.value:12.4g} {result.unit}')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results_to_json(results, args.quick), file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:')
+            print('\n'.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions against the baseline')
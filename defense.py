@@ -0,0 +1,75 @@
+from functools import lru_cache
+from typing import NamedTuple
+from materials import Card
+
+
+class DefensePreference(NamedTuple):
+    """
+    How to rank sufficient discards, see ranked_defenses().
+    order lists the criteria compared first to last, all of them prefer smaller numbers:
+    - 'aces': aces discarded, only counted if keep_aces
+    - 'suits': cards of keep_suits discarded, the first suit in keep_suits matters most
+    - 'value': total attack value discarded
+    - 'cards': number of cards discarded
+    """
+    keep_suits: tuple[int, ...] = ()
+    keep_aces: bool = False
+    order: tuple[str, ...] = ('aces', 'suits', 'value', 'cards')
+
+DEFAULT_PREFERENCE = DefensePreference()
+
+
+@lru_cache(maxsize=1 << 16)
+def minimal_defenses(hand_attacks:tuple[int, ...], incoming_damage:int)->tuple[int, ...]:
+    """
+    Every minimal discard that blocks incoming_damage, as bitmasks of positions in the hand.
+    Minimal means no card of the discard could be kept, so no proper subset is also enough.
+
+    One subset-sum DP pass, adding cards from highest to lowest attack. A discard is closed the
+    moment its total reaches incoming_damage, the card added last is its lowest, so the total
+    before it was short and the discard is minimal. Only totals below incoming_damage are kept.
+    """
+    if incoming_damage <= 0:
+        return tuple(1 << position for position in range(len(hand_attacks)))
+
+    by_attack = sorted(range(len(hand_attacks)), key=lambda position: -hand_attacks[position])
+    # partial[total] = position masks of discards with that total, all short of incoming_damage
+    partial: dict[int, list[int]] = {0: [0]}
+    defenses = []
+    for position in by_attack:
+        attack = hand_attacks[position]
+        bit = 1 << position
+        added = []
+        for total, masks in partial.items():
+            new_total = total + attack
+            if new_total >= incoming_damage:
+                defenses += [mask | bit for mask in masks]
+            else:
+                added.append((new_total, [mask | bit for mask in masks]))
+        for new_total, masks in added:
+            partial.setdefault(new_total, []).extend(masks)
+    return tuple(defenses)
+
+def defense_key(hand:tuple[int, ...], mask:int, preference:DefensePreference)->tuple:
+    """Sort key of the discard mask (positions in hand, a tuple of card indices), smaller is better."""
+    cards = [hand[position] for position in range(len(hand)) if mask >> position & 1]
+    criteria = {
+        'aces': sum(Card.VALUE_ORDER[card] == 1 for card in cards) if preference.keep_aces else 0,
+        'suits': tuple(sum(Card.SUIT[card] == suit for card in cards) for suit in preference.keep_suits),
+        'value': sum(Card.ATTACK[card] for card in cards),
+        'cards': len(cards),
+    }
+    return tuple(criteria[name] for name in preference.order) + (mask,)
+
+@lru_cache(maxsize=1 << 16)
+def ranked_defenses(hand:tuple[int, ...], incoming_damage:int,
+                    preference:DefensePreference=DEFAULT_PREFERENCE)->tuple[int, ...]:
+    """
+    The minimal discards of hand (sorted card indices) that block incoming_damage, best first.
+    Discards are bitmasks of positions in hand. Empty if the hand can't block the damage.
+    """
+    hand_attacks = tuple(Card.ATTACK[card] for card in hand)
+    return tuple(sorted(
+        minimal_defenses(hand_attacks, incoming_damage),
+        key=lambda mask: defense_key(hand, mask, preference)
+    ))
@@ -0,0 +1,300 @@
+import itertools
+import math
+import random
+import time
+from typing import NamedTuple
+
+from materials import Card
+from regicideAI import RegicideGame_AI, AIGameSnapshot
+from transposition import TranspositionTable, EXACT, LOWER
+
+# positions with at most this many cards left in the castle deck count as endgames, 3 is the kings phase
+ENDGAME_ENEMIES = 3
+# a chance event with up to CHANCE_OUTCOMES equally likely deck arrangements is enumerated,
+# one with more is estimated from CHANCE_SAMPLES random arrangements
+CHANCE_OUTCOMES = 256
+CHANCE_SAMPLES = 32
+# depth stored for positions solved to the end of the game, deeper than any search
+SOLVED_DEPTH = 1 << 30
+
+
+class SolveResult(NamedTuple):
+    """
+    win_probability is exact when exact, otherwise a lower bound (the chance of winning within depth moves)
+    or, when some chance events were sampled, an estimate of one.
+    """
+    win_probability: float
+    best_move: int
+    exact: bool
+    depth: int
+    nodes: int
+    elapsed: float
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class NoShuffle:
+    """Stands in for the discard's generator, so a heart refill takes the cards the solver put on top."""
+
+    @staticmethod
+    def shuffle(cards):
+        pass
+
+
+class EndgameSolver:
+    """
+    Memoized expectimax over RegicideGame_AI positions, on a private env so the game being played isn't touched.
+
+    The player doesn't know the order of the tavern deck, nor which suit of the next castle rank comes next.
+    The solver takes every order as equally likely: a move that draws from the tavern deck, refills it with
+    hearts or reveals a new enemy is a chance node over the arrangements of the cards it takes, the same
+    positions reached through different arrangements are merged by RegicideGame.position_hash().
+    Values are win probabilities, memoized in a TranspositionTable. Defend turns only consider the minimal
+    discards of RegicideGame_AI.defense_actions(), discarding more never helps.
+    solve() deepens one move at a time until the position is solved or the time budget runs out.
+    """
+
+    def __init__(self, player_names=['ai_a','ai_b'], table:TranspositionTable=None,
+                 chance_outcomes:int=CHANCE_OUTCOMES, chance_samples:int=CHANCE_SAMPLES, seed:int=None):
+        self.env = RegicideGame_AI(player_names)
+        self.env.discard.rng = NoShuffle
+        self.table = table if table is not None else TranspositionTable(1 << 20, 'depth')
+        self.chance_outcomes = chance_outcomes
+        self.chance_samples = chance_samples
+        self.rng = random.Random(seed)
+        self.deadline = None
+        self.nodes = 0
+        # set when the search stopped at its depth limit somewhere, deeper searches can only change the result then
+        self.cut_off = False
+        # cards each pile handed out during the last step, counted by count_draws()
+        self.draws = {'tavern': 0, 'discard': 0, 'castle': 0}
+        for name, deck in (('tavern', self.env.deck), ('discard', self.env.discard), ('castle', self.env.enemies)):
+            self.count_draws(name, deck)
+
+    def count_draws(self, name:str, deck):
+        draw = deck.draw_card
+        def draw_card():
+            card = draw()
+            if card is not None:
+                self.draws[name] += 1
+            return card
+        deck.draw_card = draw_card
+
+    def step(self, snapshot:AIGameSnapshot, action:int)->tuple[int, int, int]:
+        """Plays action from snapshot, returns the cards drawn from the tavern, the discard and the castle."""
+        draws = self.draws
+        draws['tavern'] = draws['discard'] = draws['castle'] = 0
+        self.env.restore(snapshot)
+        self.env.step(action)
+        return draws['tavern'], draws['discard'], draws['castle']
+
+    def actions(self)->tuple[int, ...]:
+        env = self.env
+        actions = env.legal_actions() if env.is_player_turn else env.defense_actions()
+        first = self.table.best_move(env.position_hash())
+        if first in actions:
+            actions = (first,) + tuple(action for action in actions if action != first)
+        return actions
+
+    def chance_outcomes_of(self, snapshot:AIGameSnapshot, action:int, draws:tuple[int, int, int])->tuple[dict, bool]:
+        """
+        Positions action can lead to from snapshot, as {position hash: [probability, snapshot]}, and whether they
+        are exact. The top cards of the tavern, discard and castle piles are rearranged before each step, in every
+        order (or chance_samples random ones) of as many cards as the step drew from each pile.
+        """
+        tavern_draws, refilled, castle_draws = draws
+        game = snapshot.game
+        # a heart refill puts its cards on top of the tavern deck, the tavern's own cards are drawn after them
+        tavern_draws = min(max(tavern_draws - refilled, 0), len(game.deck))
+        castle = game.enemies
+        # only the suits of the top castle rank are hidden, the ranks come jacks, queens, then kings
+        group = 0
+        while group < len(castle) and \
+                Card.VALUE_ORDER[castle[-1 - group].index] == Card.VALUE_ORDER[castle[-1].index]:
+            group += 1
+        castle_draws = min(castle_draws, group)
+        piles = ((game.deck, tavern_draws), (game.discard, refilled), (castle[len(castle) - group:], castle_draws))
+
+        arrangements = math.prod(math.perm(len(cards), count) for cards, count in piles)
+        exact = arrangements <= self.chance_outcomes
+        if exact:
+            tops = itertools.product(*(itertools.permutations(cards, count) for cards, count in piles))
+            probability = 1 / arrangements
+        else:
+            tops = (
+                tuple(tuple(self.rng.sample(cards, count)) for cards, count in piles)
+                for _ in range(self.chance_samples)
+            )
+            probability = 1 / self.chance_samples
+
+        env = self.env
+        outcomes = {}
+        for top in tops:
+            self.check_time()
+            env.restore(snapshot)
+            for deck, drawn in zip((env.deck, env.discard, env.enemies), top):
+                # the drawn cards go on top in draw order, the pile's other cards keep their order below them
+                # only the order changes, so the pile's hash stays valid
+                rest = [card for card in deck.cards if card not in drawn]
+                deck.cards[:] = rest + list(reversed(drawn))
+            arranged = env.snapshot()
+            if self.step(arranged, action) != draws:
+                # the arrangement changed how many cards the move drew, the piles past the arranged cards
+                # are in one fixed order, so the probabilities are no longer exact
+                exact = False
+            key = env.position_hash()
+            if key in outcomes:
+                outcomes[key][0] += probability
+            else:
+                outcomes[key] = [probability, env.snapshot()]
+        return outcomes, exact
+
+    def action_value(self, snapshot:AIGameSnapshot, action:int, depth:int)->tuple[float, bool]:
+        """Expected win probability of action from snapshot searched depth - 1 moves past it, and whether exact."""
+        draws = self.step(snapshot, action)
+        if not any(draws):
+            return self.value(depth - 1)
+        outcomes, exact = self.chance_outcomes_of(snapshot, action, draws)
+        total = 0.0
+        for probability, outcome in outcomes.values():
+            self.env.restore(outcome)
+            value, value_exact = self.value(depth - 1)
+            total += probability * value
+            exact = exact and value_exact
+        return total, exact
+
+    def value(self, depth:int)->tuple[float, bool]:
+        """Win probability of the private env's position with depth moves left, and whether it's exact."""
+        env = self.env
+        if not env.running:
+            return (1.0 if env.game_result == 'Win' else 0.0), True
+        key = env.position_hash()
+        entry = self.table.get(key, depth)
+        if entry is not None:
+            if entry.depth != SOLVED_DEPTH:
+                self.cut_off = True
+            return entry.value, entry.bound == EXACT
+        if depth == 0:
+            self.cut_off = True
+            return 0.0, False
+        self.nodes += 1
+        self.check_time()
+
+        snapshot = env.snapshot()
+        outer_cut_off, self.cut_off = self.cut_off, False
+        best_value, best_move, all_exact = -1.0, -1, True
+        for action in self.actions():
+            value, exact = self.action_value(snapshot, action, depth)
+            all_exact = all_exact and exact
+            if value > best_value:
+                best_value, best_move = value, action
+            if value >= 1.0 and exact:
+                # nothing beats a sure win
+                all_exact = True
+                self.cut_off = False
+                break
+        env.restore(snapshot)
+        # a value searched to the end of the game everywhere is final, even if sampled chance makes it inexact
+        self.table.store(key, best_value, depth if self.cut_off else SOLVED_DEPTH, best_move,
+                         EXACT if all_exact else LOWER)
+        self.cut_off = self.cut_off or outer_cut_off
+        return best_value, all_exact
+
+    def check_time(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+    def solve(self, env:RegicideGame_AI, time_limit:float|None=1.0, max_depth:int=200)->SolveResult:
+        """
+        Win probability and best move of env's position, deepening the search one move at a time until it's
+        solved, max_depth is reached or time_limit seconds have passed. The last completed depth is returned.
+        """
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit else None
+        self.nodes = 0
+        root = env.snapshot()
+        self.env.restore(root)
+        actions = self.actions()
+        result = SolveResult(0.0, actions[0], False, 0, 0, 0.0)
+        try:
+            for depth in range(1, max_depth + 1):
+                self.cut_off = False
+                values = []
+                for action in actions:
+                    values.append(self.action_value(root, action, depth))
+                best = max(range(len(actions)), key=lambda i: values[i][0])
+                exact = all(value_exact for value, value_exact in values)
+                result = SolveResult(values[best][0], actions[best], exact, depth,
+                                     self.nodes, time.perf_counter() - start)
+                if exact or not self.cut_off:
+                    break
+                # the next depth searches the best move first
+                actions = (actions[best],) + actions[:best] + actions[best + 1:]
+        except SearchTimeout:
+            result = result._replace(nodes=self.nodes, elapsed=time.perf_counter() - start)
+        self.deadline = None
+        return result
+
+
+class EndgameAgent:
+    """
+    Plays the endgame (at most endgame_enemies castle cards left) with EndgameSolver and the rest of the game
+    with fallback(env), so a game is played with env.step(agent.select_action(env)).
+    """
+
+    def __init__(self, fallback, endgame_enemies:int=ENDGAME_ENEMIES, time_limit:float=1.0,
+                 solver:EndgameSolver=None):
+        self.fallback = fallback
+        self.endgame_enemies = endgame_enemies
+        self.time_limit = time_limit
+        self.solver = solver
+        self.last_result: SolveResult | None = None
+
+    def select_action(self, env:RegicideGame_AI)->int:
+        if len(env.enemies) > self.endgame_enemies:
+            return self.fallback(env)
+        if self.solver is None:
+            self.solver = EndgameSolver(env.player_names)
+        self.last_result = self.solver.solve(env, self.time_limit)
+        return self.last_result.best_move
+
+
+if __name__ == "__main__":
+    from heuristic import heuristic_action
+
+    # plays heuristic games and hands the ones reaching the endgame to the solver, then compares the two
+    # on the same endgame deals
+    GAMES = 300
+    env = RegicideGame_AI()
+    solver = EndgameSolver(env.player_names, seed=0)
+    agent = EndgameAgent(heuristic_action, time_limit=0.5, solver=solver)
+    endgames, heuristic_wins, solver_wins, exact, predicted = 0, 0, 0, 0, 0.0
+    start = time.perf_counter()
+    for seed in range(GAMES):
+        env.reset(seed)
+        while env.running and len(env.enemies) > ENDGAME_ENEMIES:
+            env.step(heuristic_action(env))
+        if not env.running:
+            continue
+        endgames += 1
+        position, rng_state = env.snapshot(), env.rng.getstate()
+        while env.running:
+            env.step(heuristic_action(env))
+        heuristic_wins += env.game_result == 'Win'
+
+        env.restore(position)
+        env.rng.setstate(rng_state)
+        result = solver.solve(env, agent.time_limit)
+        exact += result.exact
+        predicted += result.win_probability
+        while env.running:
+            env.step(agent.select_action(env))
+        solver_wins += env.game_result == 'Win'
+
+    print(f'{endgames} of {GAMES} heuristic games reached {ENDGAME_ENEMIES} castle cards, '
+          f'{time.perf_counter() - start:.1f}s')
+    if endgames:
+        print(f'Heuristic won {heuristic_wins}, the solver won {solver_wins}, '
+              f'solved exactly {exact}, mean predicted win probability {predicted / endgames:.3f}')
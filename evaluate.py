@@ -0,0 +1,229 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agent_settings import MODEL_PKL_PATH, CYCLE_LIMIT, agent_action_mask
+from numpy_policy import NumpyDQN
+from regicideAI import RegicideGame_AI
+
+# games each worker task plays, in lockstep with one batched forward per move
+EVAL_CHUNK = 500
+# z of the two sided 95% confidence intervals
+Z_95 = 1.959964
+
+# columns of the per game results array
+RESULT, DEFEATED, STEPS, INVALID = range(4)
+
+
+def load_net(path:str, backend:str='torch'):
+    """
+    The net saved at path, a policy_net state_dict or a numpy_policy export (.npz).
+    backend 'numpy' or 'int8' runs it as a NumpyDQN, 'torch' as a model.DQN.
+    torch is only imported to read a state_dict, a .npz is evaluated without it.
+    """
+    if path.endswith('.npz'):
+        assert backend != 'torch', 'a NumPy export needs the numpy or int8 backend'
+        return NumpyDQN.load(path)
+    import torch
+    state_dict = torch.load(path, weights_only=True, map_location='cpu')
+    if backend != 'torch':
+        return NumpyDQN.from_state_dict(state_dict, quantize=backend == 'int8')
+    from model import DQN, n_observations, n_actions
+    net = DQN(n_observations, n_actions)
+    net.load_state_dict(state_dict)
+    net.eval()
+    return net
+
+def play_games(net, seeds, masked:bool=True, cycle_limit:int=CYCLE_LIMIT)->np.ndarray:
+    """
+    Plays one greedy game per seed with net (a model.DQN or NumpyDQN), all at once so each move is a single
+    batched forward. masked chooses among agent_action_mask() like training, otherwise the raw argmax is played
+    and a game stuck on invalid moves is abandoned after cycle_limit steps.
+    Returns an int32 array with a row per seed: result (1 win, -1 loss, 0 abandoned), enemies defeated,
+    steps and invalid steps.
+    """
+    envs = [RegicideGame_AI() for _ in seeds]
+    for env, seed in zip(envs, seeds):
+        env.reset(seed)
+    running = [index for index, env in enumerate(envs) if env.running]
+    while running:
+        states = np.stack([envs[index].observe() for index in running])
+        if isinstance(net, NumpyDQN):
+            q_values = net(states)
+        else:
+            import torch
+            with torch.no_grad():
+                q_values = net(torch.from_numpy(states).float()).numpy()
+        if masked:
+            legal = np.array([agent_action_mask(envs[index]) for index in running])
+            q_values = np.where(legal, q_values, -math.inf)
+        actions = q_values.argmax(1).tolist()
+        still_running = []
+        for index, action in zip(running, actions):
+            env = envs[index]
+            env.step(action)
+            if env.running and env.steps_taken < cycle_limit:
+                still_running.append(index)
+        running = still_running
+
+    return game_results(envs)
+
+def play_agent_games(agent, seeds, cycle_limit:int=CYCLE_LIMIT)->np.ndarray:
+    """
+    Plays one game per seed with agent.select_action(env), such as mcts.MCTSAgent, one game after the other.
+    The same seeds deal the same games as play_games(), results are in the same format.
+    """
+    envs = []
+    for seed in seeds:
+        env = RegicideGame_AI()
+        env.reset(seed)
+        while env.running and env.steps_taken < cycle_limit:
+            env.step(agent.select_action(env))
+        envs.append(env)
+    return game_results(envs)
+
+def game_results(envs)->np.ndarray:
+    """The results row of each finished or abandoned game, see play_games()."""
+    results = np.zeros((len(envs), 4), dtype=np.int32)
+    for row, env in zip(results, envs):
+        won = env.game_result == 'Win'
+        row[RESULT] = 1 if won else -1 if env.game_result == 'Lose' else 0
+        # unless the castle fell the current enemy is still alive besides the castle deck
+        row[DEFEATED] = 12 if won else 11 - len(env.enemies)
+        row[STEPS] = env.steps_taken
+        row[INVALID] = env.invalid_steps_taken
+    return results
+
+
+# net of each pool process, loaded once by _init_worker
+_worker_net = None
+
+def _init_worker(net, backend:str='torch'):
+    """net is a NumpyDQN, or for the torch backend the path to load."""
+    global _worker_net
+    if isinstance(net, NumpyDQN):
+        _worker_net = net
+        return
+    import torch
+    torch.set_num_threads(1)
+    _worker_net = load_net(net, backend)
+
+def _play_task(seeds, masked):
+    return play_games(_worker_net, seeds, masked)
+
+
+def evaluate(path:str, games:int, seed:int=0, workers:int|None=None, masked:bool=True,
+             backend:str='torch')->np.ndarray:
+    """
+    Plays games seeded seed .. seed + games - 1 greedily with the net saved at path, over workers processes.
+    See load_net() for backend.
+    """
+    seeds = range(seed, seed + games)
+    chunks = [seeds[start:start + EVAL_CHUNK] for start in range(0, games, EVAL_CHUNK)]
+    workers = workers or os.cpu_count()
+    # the NumPy backends load the net once here, so the workers never import torch
+    net = path if backend == 'torch' else load_net(path, backend)
+    if workers == 1:
+        _init_worker(net, backend)
+        return np.concatenate([_play_task(chunk, masked) for chunk in chunks])
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(net, backend)) as pool:
+        return np.concatenate(list(pool.map(_play_task, chunks, [masked] * len(chunks))))
+
+def evaluate_mcts(iterations:int, games:int, seed:int=0, workers:int|None=None)->np.ndarray:
+    """
+    Plays games seeded seed .. seed + games - 1 with mcts.MCTSAgent at iterations per move, on the same deals
+    as evaluate() with the same seed. Each move is searched over workers processes.
+    """
+    from mcts import MCTSAgent
+
+    with MCTSAgent(iterations=iterations, workers=workers, seed=seed) as agent:
+        return play_agent_games(agent, range(seed, seed + games))
+
+
+def wilson_interval(successes:int, n:int, z:float=Z_95)->tuple[float, float]:
+    """Wilson score interval of a binomial proportion."""
+    if n == 0:
+        return (math.nan, math.nan)
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return (center - half, center + half)
+
+def mean_interval(values:np.ndarray, z:float=Z_95)->tuple[float, float, float]:
+    """Mean with its normal approximation confidence interval."""
+    mean = float(values.mean())
+    half = z * float(values.std(ddof=1)) / math.sqrt(len(values)) if len(values) > 1 else math.nan
+    return (mean, mean - half, mean + half)
+
+def summarize(results:np.ndarray)->dict:
+    """
+    Win rate, the rate of reaching each castle position (defeating at least that many enemies),
+    the distribution of enemies defeated, average steps and invalid moves, with 95% confidence intervals.
+    """
+    n = len(results)
+    wins = int((results[:, RESULT] == 1).sum())
+    defeated = results[:, DEFEATED]
+    return {
+        'games': n,
+        'win_rate': (wins / n, *wilson_interval(wins, n)),
+        'abandoned': int((results[:, RESULT] == 0).sum()),
+        'reached_position': {
+            position: (int((defeated >= position).sum()) / n, *wilson_interval(int((defeated >= position).sum()), n))
+            for position in range(1, 13)
+        },
+        'defeated_histogram': np.bincount(defeated, minlength=13).tolist(),
+        'enemies_defeated': mean_interval(defeated),
+        'steps': mean_interval(results[:, STEPS]),
+        'invalid_steps': mean_interval(results[:, INVALID]),
+        'invalid_total': int(results[:, INVALID].sum()),
+    }
+
+def print_summary(summary:dict):
+    def interval(stat, percent=False):
+        value, low, high = stat
+        return f'{value:.2%} [{low:.2%}, {high:.2%}]' if percent else f'{value:.3f} [{low:.3f}, {high:.3f}]'
+
+    print(f"{summary['games']} games, {summary['abandoned']} abandoned at the cycle limit")
+    print(f"Win rate:         {interval(summary['win_rate'], True)}")
+    print(f"Enemies defeated: {interval(summary['enemies_defeated'])}")
+    print(f"Steps:            {interval(summary['steps'])}")
+    print(f"Invalid steps:    {interval(summary['invalid_steps'])}, {summary['invalid_total']} in total")
+    print('Castle position reached (J 1-4, Q 5-8, K 9-12), games defeating exactly that many enemies:')
+    print(f"  {0:2}: {'':28} {summary['defeated_histogram'][0]}")
+    for position, stat in summary['reached_position'].items():
+        print(f"  {position:2}: {interval(stat, True):28} {summary['defeated_histogram'][position]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Greedy evaluation of a saved policy_net on seeded games.')
+    parser.add_argument('path', nargs='?', default=MODEL_PKL_PATH,
+                        help='policy_net state_dict file, or a numpy_policy export (.npz)')
+    parser.add_argument('--games', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0, help='first game seed, games use seed .. seed + games - 1')
+    parser.add_argument('--workers', type=int, default=None, help='processes, default one per core')
+    parser.add_argument('--unmasked', action='store_true', help='play the raw argmax, illegal actions included')
+    parser.add_argument('--output', help='write the summary as JSON to this file')
+    parser.add_argument('--mcts', type=int, metavar='ITERATIONS',
+                        help='also play MCTSAgent with this many iterations per move on the same seeds')
+    parser.add_argument('--backend', choices=('torch', 'numpy', 'int8'), default='torch',
+                        help='run the net with torch, or with numpy_policy in float32 or int8')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = summarize(evaluate(args.path, args.games, args.seed, args.workers, not args.unmasked, args.backend))
+    print_summary(summary)
+    print(f'{time.perf_counter() - start:.1f}s')
+    if args.mcts:
+        start = time.perf_counter()
+        print(f'\nMCTSAgent, {args.mcts} iterations per move:')
+        summary = {'net': summary, 'mcts': summarize(evaluate_mcts(args.mcts, args.games, args.seed, args.workers))}
+        print_summary(summary['mcts'])
+        print(f'{time.perf_counter() - start:.1f}s')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(summary, file, indent=2)
@@ -0,0 +1,147 @@
+from typing import NamedTuple
+from materials import Card
+
+
+class CardsPlayed(NamedTuple):
+    player: str
+    cards: tuple[Card, ...]
+    damage: int
+
+class EnemyAttackReduced(NamedTuple):
+    amount: int
+    attack: int
+
+class TavernRefilled(NamedTuple):
+    requested: int
+    moved: int
+    discard_size: int
+    deck_size: int
+
+class CardsDealt(NamedTuple):
+    number: int
+
+class DeckEmpty(NamedTuple):
+    player: str
+
+class EnemyDamaged(NamedTuple):
+    enemy: Card
+    health: int
+
+class EnemyDefeated(NamedTuple):
+    enemy: Card
+    exact: bool
+
+class NewEnemy(NamedTuple):
+    enemy: Card
+    health: int
+    attack: int
+
+class AllEnemiesDefeated(NamedTuple):
+    pass
+
+class AutoYield(NamedTuple):
+    player: str
+
+class AutoLastCardAttack(NamedTuple):
+    player: str
+
+class AutoDefend(NamedTuple):
+    player: str
+    all_cards: bool
+
+class OutOfCards(NamedTuple):
+    pass
+
+
+class EventBus(list):
+    """
+    List of subscribers, each called with every event the game emits.
+    The game only builds an event when the bus is truthy, so a game without subscribers
+    does no formatting or event creation at all:
+
+        if self.events:
+            self.events.emit(CardsDealt(number))
+    """
+
+    def subscribe(self, subscriber):
+        self.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.remove(subscriber)
+
+    def emit(self, event):
+        for subscriber in self:
+            subscriber(event)
+
+
+class TextRenderer:
+    """Subscriber that prints game events as text, used by RegicideGame.play_game."""
+
+    def __init__(self):
+        self.handlers = {
+            CardsPlayed: self.cards_played,
+            EnemyAttackReduced: self.enemy_attack_reduced,
+            TavernRefilled: self.tavern_refilled,
+            CardsDealt: self.cards_dealt,
+            DeckEmpty: self.deck_empty,
+            EnemyDamaged: self.enemy_damaged,
+            EnemyDefeated: self.enemy_defeated,
+            NewEnemy: self.new_enemy,
+            AllEnemiesDefeated: self.all_enemies_defeated,
+            AutoYield: self.auto_yield,
+            AutoLastCardAttack: self.auto_last_card_attack,
+            AutoDefend: self.auto_defend,
+            OutOfCards: self.out_of_cards,
+        }
+
+    def __call__(self, event):
+        self.handlers[type(event)](event)
+
+    def cards_played(self, event:CardsPlayed):
+        print(f"\nYou played {', '.join(str(card) for card in event.cards)} for {event.damage} damage.")
+
+    def enemy_attack_reduced(self, event:EnemyAttackReduced):
+        print(f"Enemy attack has been reduced by {event.amount}." )
+        print(f"Enemy attack: {event.attack}")
+
+    def tavern_refilled(self, event:TavernRefilled):
+        print(f"\nRefilling the tavern with {event.requested} cards.")
+        if event.moved < event.requested:
+            print("No more cards in the discard pile.")
+        print(f"There are {event.discard_size} cards in the discard pile.")
+        print(f"There are {event.deck_size} cards in the tavern deck.")
+
+    def cards_dealt(self, event:CardsDealt):
+        print(f"\nDealing {event.number} cards to players.")
+
+    def deck_empty(self, event:DeckEmpty):
+        print("No more cards in the deck.")
+
+    def enemy_damaged(self, event:EnemyDamaged):
+        print(f"{event.enemy} has {event.health} health remaining.")
+
+    def enemy_defeated(self, event:EnemyDefeated):
+        print(f"You defeated {event.enemy}!")
+        if event.exact:
+            print("Exact damage! Defeated Enemy added to the top of Tavern Deck")
+        else:
+            print("Defeated enemy will go to the discard pile!")
+
+    def new_enemy(self, event:NewEnemy):
+        print(f"\nNew enemy: {event.enemy} \n(Health: {event.health})\n(Attack: {event.attack})")
+
+    def all_enemies_defeated(self, event:AllEnemiesDefeated):
+        print("Congratulations! You've defeated all enemies!")
+
+    def auto_yield(self, event:AutoYield):
+        print('Auto yield')
+
+    def auto_last_card_attack(self, event:AutoLastCardAttack):
+        print('Attack with last card')
+
+    def auto_defend(self, event:AutoDefend):
+        print('Auto defend all card(s)' if event.all_cards else 'Auto defend no attack')
+
+    def out_of_cards(self, event:OutOfCards):
+        print('All players have run out of cards')
@@ -0,0 +1,170 @@
+import struct
+import time
+from typing import NamedTuple, Iterator
+
+from regicideAI import RegicideGame_AI, AIGameSnapshot
+
+# file layout: MAGIC, then records back to back
+# record: GAME_HEADER (seed, number of players, hand limit, number of moves), DEAL_SIZE deal bytes, one byte per move
+MAGIC = b'RGR1'
+GAME_HEADER = struct.Struct('<QBBI')
+DEAL_SIZE = 52
+
+
+class GameRecord(NamedTuple):
+    """
+    A played game: its seed and the actions given to RegicideGame_AI.step().
+    deal is the position after setup as 52 card indices: the tavern deck bottom to top, each player's hand,
+    the current enemy, then the castle deck bottom to top. The seed alone reproduces the deal and every later
+    shuffle, the deal is kept to check a replay and to study deals without replaying.
+    """
+    seed: int
+    num_players: int
+    hand_limit: int
+    deal: bytes
+    actions: bytes
+
+    def to_bytes(self)->bytes:
+        return GAME_HEADER.pack(self.seed, self.num_players, self.hand_limit, len(self.actions)) \
+            + self.deal + self.actions
+
+
+def deal_bytes(env:RegicideGame_AI)->bytes:
+    cards = [card.index for card in env.deck.cards]
+    for player in env.players:
+        cards += [card.index for card in player.hand]
+    cards.append(env.current_enemy.card.index)
+    cards += [card.index for card in env.enemies.cards]
+    return bytes(cards)
+
+
+class GameRecorder:
+    """
+    Records the games played on env. Start each game with reset(seed) and play it with step(action)
+    instead of calling env directly, then take the GameRecord with record().
+    """
+
+    def __init__(self, env:RegicideGame_AI):
+        assert env.action_space <= 256, 'actions are recorded in one byte each, env has too many'
+        self.env = env
+        self.seed = None
+        self.deal = b''
+        self.actions = bytearray()
+
+    def reset(self, seed:int):
+        result = self.env.reset(seed)
+        self.seed = seed
+        self.deal = deal_bytes(self.env)
+        self.actions.clear()
+        return result
+
+    def step(self, action:int):
+        action = int(action)
+        self.actions.append(action)
+        return self.env.step(action)
+
+    def record(self)->GameRecord:
+        return GameRecord(self.seed, len(self.env.players), self.env.active_player.hand_limit,
+                          self.deal, bytes(self.actions))
+
+
+def write_records(path:str, records, append:bool=False):
+    """Writes GameRecords to path, append adds them to an existing file."""
+    with open(path, 'ab' if append else 'wb') as file:
+        if not append or file.tell() == 0:
+            file.write(MAGIC)
+        for record in records:
+            file.write(record.to_bytes())
+
+def read_records(path:str)->Iterator[GameRecord]:
+    """GameRecords of path in order, raises ValueError at a record cut short (a write that didn't finish)."""
+    with open(path, 'rb') as file:
+        data = memoryview(file.read())
+    assert bytes(data[:len(MAGIC)]) == MAGIC, f'{path} is not a game record file'
+    offset = len(MAGIC)
+    while offset < len(data):
+        if offset + GAME_HEADER.size > len(data):
+            raise ValueError(f'{path} ends in a truncated record header at byte {offset}')
+        seed, num_players, hand_limit, moves = GAME_HEADER.unpack_from(data, offset)
+        if offset + GAME_HEADER.size + DEAL_SIZE + moves > len(data):
+            raise ValueError(f'{path} ends in a truncated record at byte {offset}')
+        offset += GAME_HEADER.size
+        deal = bytes(data[offset:offset + DEAL_SIZE])
+        offset += DEAL_SIZE
+        actions = bytes(data[offset:offset + moves])
+        offset += moves
+        yield GameRecord(seed, num_players, hand_limit, deal, actions)
+
+
+class GameReplayer:
+    """
+    Rebuilds the positions of a GameRecord on an env.
+    position(move) leaves env as it was after the first move actions. Every interval moves the replayer
+    keeps a snapshot and the game's generator state, so going back or jumping ahead replays at most
+    interval - 1 moves from the nearest one.
+    """
+
+    def __init__(self, record:GameRecord, env:RegicideGame_AI=None, interval:int=32):
+        self.record = record
+        self.env = env or RegicideGame_AI([f'ai_{n}' for n in range(record.num_players)])
+        assert len(self.env.players) == record.num_players, 'env has a different number of players'
+        assert self.env.active_player.hand_limit == record.hand_limit, 'env has a different hand limit'
+        self.interval = interval
+        self.env.reset(record.seed)
+        assert deal_bytes(self.env) == record.deal, 'the seed did not reproduce the recorded deal'
+        self.checkpoints: list[tuple[AIGameSnapshot, tuple]] = [(self.env.snapshot(), self.env.rng.getstate())]
+        self.move = 0
+
+    def __len__(self):
+        return len(self.record.actions)
+
+    def position(self, move:int)->RegicideGame_AI:
+        assert 0 <= move <= len(self), f'move {move} is outside the game'
+        env = self.env
+        nearest = min(move // self.interval, len(self.checkpoints) - 1)
+        if move < self.move or nearest * self.interval > self.move:
+            snapshot, rng_state = self.checkpoints[nearest]
+            env.restore(snapshot)
+            env.rng.setstate(rng_state)
+            self.move = nearest * self.interval
+
+        actions = self.record.actions
+        while self.move < move:
+            env.step(actions[self.move])
+            self.move += 1
+            if self.move % self.interval == 0 and self.move // self.interval == len(self.checkpoints):
+                self.checkpoints.append((env.snapshot(), env.rng.getstate()))
+        return env
+
+    def final_position(self)->RegicideGame_AI:
+        return self.position(len(self))
+
+
+if __name__ == "__main__":
+    import os
+    import random
+
+    PATH = 'games.rgr'
+    env = RegicideGame_AI()
+    recorder = GameRecorder(env)
+    policy = random.Random(0)
+    results = []
+    records = []
+    for seed in range(1000):
+        recorder.reset(seed)
+        while env.running:
+            legal = env.legal_actions()
+            recorder.step(legal[policy.randrange(len(legal))])
+        records.append(recorder.record())
+        results.append((env.game_result, len(env.enemies)))
+    write_records(PATH, records)
+
+    start = time.perf_counter()
+    replayed = [
+        (replay.game_result, len(replay.enemies))
+        for replay in (GameReplayer(record, env).final_position() for record in read_records(PATH))
+    ]
+    elapsed = time.perf_counter() - start
+    moves = sum(len(record.actions) for record in records)
+    print(f'{len(records)} games, {moves} moves, {os.path.getsize(PATH)} bytes')
+    print(f'Replayed in {elapsed:.2f}s ({moves / elapsed:.0f} moves/s), identical: {replayed == results}')
@@ -0,0 +1,198 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+import model
+from model import DQN, n_observations, n_actions
+from defense import DefensePreference
+from materials import Card, CLUBS, DIAMONDS, HEARTS, SPADES
+from regicideAI import RegicideGame_AI
+
+# hands are short when all players together hold at most this many cards, diamonds are then worth their draw
+SHORT_HANDS = 7
+# the tavern deck is low below this many cards, hearts are then worth their refill
+LOW_TAVERN = 10
+# defend by discarding low cards, aces last since they pair with anything
+HEURISTIC_DEFENSE = DefensePreference(keep_aces=True)
+# games each worker task plays
+DEMO_CHUNK = 200
+
+
+def attack_key(env:RegicideGame_AI, action:int)->tuple:
+    """
+    Sort key of an attack action, larger is better:
+    1. attacks that leave enough defense for the enemy's counter attack (or kill it)
+    2. attacks that kill, exact kills first (the enemy goes on the tavern deck), then the lowest sufficient value
+    3. otherwise the most damage plus the value of diamond draws on short hands and heart refills on a low tavern
+    Clubs count double, so against high health enemies they come first and against weak ones they're saved.
+    """
+    player = env.active_player
+    enemy = env.current_enemy
+    enemy_suit = Card.SUIT[enemy.card.index]
+    cards = [player.hand[position].index for position in env.int_to_positions[action]]
+    value = sum(Card.ATTACK[card] for card in cards)
+    suits = {Card.SUIT[card] for card in cards}
+
+    damage = value * 2 if CLUBS in suits and enemy_suit != CLUBS else value
+    kills = damage >= enemy.health
+    counter_attack = enemy.attack
+    if SPADES in suits and enemy_suit != SPADES:
+        counter_attack = max(counter_attack - value, 0)
+    survives = kills or player.calc_max_defense() - value >= counter_attack
+
+    effect = 0
+    if DIAMONDS in suits and enemy_suit != DIAMONDS and sum(len(p.hand) for p in env.players) <= SHORT_HANDS:
+        effect += value
+    if HEARTS in suits and enemy_suit != HEARTS and len(env.deck) < LOW_TAVERN:
+        effect += value / 2
+    return (survives, kills, kills and damage == enemy.health, -value if kills else damage + effect, -len(cards))
+
+def heuristic_action(env:RegicideGame_AI)->int:
+    """Rule based action for env's current decision, always legal."""
+    if not env.is_player_turn:
+        return env.best_defense_action(HEURISTIC_DEFENSE)
+    return max(env.legal_actions(), key=lambda action: attack_key(env, action))
+
+
+class Demonstrations(NamedTuple):
+    """Transitions of heuristic games, legal masks packed with np.packbits along axis 1."""
+    states: np.ndarray       # (n, n_observations) int16
+    actions: np.ndarray      # (n,) int16
+    rewards: np.ndarray      # (n,) float32
+    next_states: np.ndarray  # (n, n_observations) int16
+    dones: np.ndarray        # (n,) bool
+    masks: np.ndarray        # (n, n_actions / 8) uint8, model.agent_action_mask() of states
+    next_masks: np.ndarray   # (n, n_actions / 8) uint8, of next_states
+
+    def save(self, path:str):
+        np.savez(path, **self._asdict())
+
+    @classmethod
+    def load(cls, path:str)->'Demonstrations':
+        with np.load(path) as data:
+            return cls(*(data[field] for field in cls._fields))
+
+
+def play_demo_games(seeds)->Demonstrations:
+    """Plays a heuristic game per seed and records every transition."""
+    env = RegicideGame_AI()
+    states, actions, rewards, next_states, dones, masks = [], [], [], [], [], []
+    for seed in seeds:
+        state, info = env.reset(seed)
+        mask = model.agent_action_mask(env)
+        while env.running:
+            action = heuristic_action(env)
+            next_state, reward, done, invalid_action = env.step(action)
+            states.append(state)
+            actions.append(action)
+            rewards.append(reward)
+            next_states.append(next_state)
+            dones.append(done)
+            masks.append(mask)
+            state = next_state
+            mask = model.agent_action_mask(env)
+        masks.append(mask)
+
+    # masks holds one more mask per game, the one of its final position
+    masks = np.packbits(np.array(masks, dtype=bool), axis=1)
+    steps = np.arange(len(dones)) + np.cumsum(np.concatenate(([False], dones[:-1])), dtype=np.int64)
+    return Demonstrations(
+        np.array(states, dtype=np.int16).reshape(-1, n_observations),
+        np.array(actions, dtype=np.int16),
+        np.array(rewards, dtype=np.float32),
+        np.array(next_states, dtype=np.int16).reshape(-1, n_observations),
+        np.array(dones, dtype=bool),
+        masks[steps],
+        masks[steps + 1],
+    )
+
+def generate_demonstrations(games:int, seed:int=0, workers:int|None=None)->Demonstrations:
+    """Heuristic transitions of games seeded seed .. seed + games - 1, played over workers processes."""
+    seeds = range(seed, seed + games)
+    chunks = [seeds[start:start + DEMO_CHUNK] for start in range(0, games, DEMO_CHUNK)]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        parts = [play_demo_games(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(play_demo_games, chunks))
+    return Demonstrations(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+def fill_replay(memory, demos:Demonstrations):
+    """Pushes the demonstration transitions into a replay.ReplayBuffer, the newest last."""
+    unpack = lambda masks: torch.from_numpy(np.unpackbits(masks, axis=1, count=n_actions).astype(bool))
+    for start in range(0, len(demos.actions), memory.capacity):
+        part = slice(start, start + memory.capacity)
+        memory.push_batch(torch.from_numpy(demos.states[part]), torch.from_numpy(demos.actions[part]),
+                          torch.from_numpy(demos.next_states[part]), torch.from_numpy(demos.rewards[part]),
+                          torch.from_numpy(demos.dones[part]), unpack(demos.next_masks[part]))
+
+def pretrain(policy_net:DQN, demos:Demonstrations, epochs:int=5, batch_size:int=1024, lr:float=1e-3)->float:
+    """
+    Fits policy_net to the heuristic's actions before RL: cross entropy of the Q values over the legal actions,
+    so the greedy policy copies the heuristic. Returns the final accuracy on the demonstrations.
+    """
+    device = next(policy_net.parameters()).device
+    states = torch.from_numpy(demos.states).float().to(device)
+    actions = torch.from_numpy(demos.actions).long().to(device)
+    masks = torch.from_numpy(np.unpackbits(demos.masks, axis=1, count=n_actions).astype(bool)).to(device)
+    optimizer = torch.optim.AdamW(policy_net.parameters(), lr=lr)
+    policy_net.train()
+    for epoch in range(epochs):
+        order = torch.randperm(len(actions), device=device)
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            logits = policy_net(states[batch]).masked_fill(~masks[batch], -1e9)
+            loss = F.cross_entropy(logits, actions[batch])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+        print(f'Pretrain epoch {epoch + 1}: loss {total / len(order):.4f}')
+
+    policy_net.eval()
+    with torch.no_grad():
+        correct = 0
+        for start in range(0, len(actions), batch_size):
+            part = slice(start, start + batch_size)
+            logits = policy_net(states[part]).masked_fill(~masks[part], -1e9)
+            correct += (logits.argmax(1) == actions[part]).sum().item()
+    return correct / len(actions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Heuristic demonstrations and supervised DQN pretraining.')
+    parser.add_argument('--games', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=1_000_000, help='first game seed, away from evaluation seeds')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--demos', default=model.DEMOS_PATH,
+                        help='save the demonstrations to this .npz, or load them if it exists, '
+                             'model.Trainer fills a fresh replay memory from the default path')
+    parser.add_argument('--output', default=model.PRETRAINED_PKL_PATH, help='where to save the pretrained net')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.demos and os.path.exists(args.demos):
+        demos = Demonstrations.load(args.demos)
+    else:
+        demos = generate_demonstrations(args.games, args.seed, args.workers)
+        if args.demos:
+            demos.save(args.demos)
+    games = int(demos.dones.sum())
+    wins = int((demos.rewards[demos.dones] > 0).sum())
+    print(f'{len(demos.actions)} transitions from {games} heuristic games, {wins / games:.1%} won, '
+          f'{time.perf_counter() - start:.1f}s')
+
+    policy_net = DQN(n_observations, n_actions).to(model.device)
+    accuracy = pretrain(policy_net, demos, args.epochs)
+    torch.save(policy_net.state_dict(), args.output)
+    print(f'Matches the heuristic on {accuracy:.1%} of its moves, saved to {args.output}')
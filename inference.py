@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple
+
+import torch
+
+import model
+from model import DQN
+from regicideAI import RegicideGame_AI
+
+
+class Request(NamedTuple):
+    state: tuple[int, ...]
+    legal_mask: tuple[bool, ...]
+    eps: float
+    reply: Future
+
+
+class InferenceServer:
+    """
+    Chooses actions for many envs with one batched policy_net forward.
+    Client threads call act(state, legal_mask, eps), which blocks until the action is chosen.
+    A server thread takes the first pending request, then keeps collecting until max_batch requests are
+    pending or max_wait seconds have passed, evaluates them all at once and replies to each.
+    With one client thread per env, max_batch equal to the number of envs flushes as soon as every env waits.
+    Each row is epsilon-greedy on its own eps, random actions are uniform over the row's legal actions.
+    After close() submit raises RuntimeError, and any request the server didn't get to fails with it.
+    """
+
+    def __init__(self, policy_net:DQN, max_batch:int=256, max_wait:float=0.002, device=model.device):
+        self.policy_net = policy_net
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.device = device
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        # held while queueing, so no request gets in behind the shutdown sentinel
+        self.submit_lock = threading.Lock()
+        self.closed = False
+        self.batches = 0
+        self.decisions = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self.submit_lock:
+            if not self.closed:
+                self.closed = True
+                self.requests.put(None)
+        self.thread.join()
+
+    def load_state_dict(self, state_dict):
+        """Swaps in new weights between batches, for example from a Trainer's policy_net."""
+        with self.lock:
+            self.policy_net.load_state_dict(state_dict)
+
+    def submit(self, state, legal_mask, eps:float=0.0)->Future:
+        reply = Future()
+        with self.submit_lock:
+            if self.closed:
+                raise RuntimeError('InferenceServer is closed')
+            self.requests.put(Request(state, legal_mask, eps, reply))
+        return reply
+
+    def act(self, state, legal_mask, eps:float=0.0)->int:
+        """Action for state (env.get_state()), chosen among legal_mask (model.agent_action_mask(env))."""
+        return self.submit(state, legal_mask, eps).result()
+
+    def serve(self):
+        running = True
+        while running:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+            try:
+                actions = self.evaluate(batch)
+            except Exception as e:
+                for request in batch:
+                    request.reply.set_exception(e)
+                continue
+            for request, action in zip(batch, actions):
+                request.reply.set_result(action)
+        # whatever is still queued would wait forever
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.reply.set_exception(RuntimeError('InferenceServer closed before serving the request'))
+
+    def evaluate(self, batch:list[Request])->list[int]:
+        states = torch.tensor([request.state for request in batch], dtype=torch.float32, device=self.device)
+        legal_masks = torch.tensor([request.legal_mask for request in batch], dtype=torch.bool, device=self.device)
+        eps = torch.tensor([request.eps for request in batch], device=self.device)
+        with self.lock, torch.no_grad():
+            q_values = self.policy_net(states)
+        greedy = q_values.masked_fill(~legal_masks, -torch.inf).argmax(1)
+        # argmax of uniform noise over the legal actions is a uniform random legal action
+        random_actions = torch.rand(legal_masks.shape, device=self.device).masked_fill(~legal_masks, -1).argmax(1)
+        explore = torch.rand(len(batch), device=self.device) < eps
+        self.batches += 1
+        self.decisions += len(batch)
+        return torch.where(explore, random_actions, greedy).tolist()
+
+
+def play_games(server:InferenceServer, num_envs:int, games_per_env:int, eps:float=0.0)->list[tuple]:
+    """
+    Plays num_envs * games_per_env games, one thread per env, every decision through server.
+    Returns each game's (game_result, enemies left, steps_taken, invalid_steps_taken).
+    """
+    results = []
+    def run_env():
+        env = RegicideGame_AI()
+        for _ in range(games_per_env):
+            state, info = env.reset()
+            done = False
+            for t in range(model.CYCLE_LIMIT):
+                action = server.act(state, model.agent_action_mask(env), eps)
+                state, reward, done, invalid_action = env.step(action)
+                if done:
+                    break
+            results.append((env.game_result, len(env.enemies), env.steps_taken, env.invalid_steps_taken))
+
+    threads = [threading.Thread(target=run_env) for _ in range(num_envs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+    NUM_ENVS = 128
+    with InferenceServer(model.load_policy_net(), max_batch=NUM_ENVS) as server:
+        start = time.perf_counter()
+        results = play_games(server, NUM_ENVS, 4, eps=0.05)
+        elapsed = time.perf_counter() - start
+    wins = sum(result[0] == 'Win' for result in results)
+    print(f'{len(results)} games, {wins} wins, {server.decisions} decisions in {elapsed:.1f}s, '
+          f'{server.decisions / elapsed:.0f} decisions/s, average batch {server.decisions / server.batches:.1f}')
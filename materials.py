@@ -1,71 +1,133 @@
 import random
 
+# suit indexes, in the order used by Card_Commands.int_to_cmd
+CLUBS, DIAMONDS, HEARTS, SPADES = range(4)
+
+# Zobrist keys, ZOBRIST_KEYS[zone][card index] is a random 64 bit key. A pile's hash is the XOR of the keys of its
+# cards in its zone, so it doesn't depend on their order and moving a card updates it with an XOR on each side.
+# Fixed seed so every process hashes a position the same way.
+# zones: the tavern deck, the castle deck, the discard, the play area, then one per player hand
+TAVERN_ZONE, CASTLE_ZONE, DISCARD_ZONE, PLAY_AREA_ZONE, HAND_ZONE = range(5)
+MAX_PLAYERS = 8
+ZOBRIST_SEED = 0x5EED
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+ZOBRIST_KEYS = tuple(
+    tuple(_zobrist_rng.getrandbits(64) for _ in range(52))
+    for _ in range(HAND_ZONE + MAX_PLAYERS)
+    )
+# keys of the rest of a position: the current enemy card, its health and attack (modulo 64), the active player,
+# a defend turn and a finished game's result
+ZOBRIST_ENEMY = tuple(_zobrist_rng.getrandbits(64) for _ in range(52))
+ZOBRIST_HEALTH = tuple(_zobrist_rng.getrandbits(64) for _ in range(64))
+ZOBRIST_ATTACK = tuple(_zobrist_rng.getrandbits(64) for _ in range(64))
+ZOBRIST_PLAYER = tuple(_zobrist_rng.getrandbits(64) for _ in range(MAX_PLAYERS))
+ZOBRIST_DEFENDING = _zobrist_rng.getrandbits(64)
+ZOBRIST_RESULT = {None: 0, 'Win': _zobrist_rng.getrandbits(64), 'Lose': _zobrist_rng.getrandbits(64)}
+
+def zobrist_hash(cards, zone:int)->int:
+    """Hash of cards in zone, computed from scratch."""
+    keys = ZOBRIST_KEYS[zone]
+    result = 0
+    for card in cards:
+        result ^= keys[card.index]
+    return result
+
+
 class Card_Commands:
     int_to_cmd = ['ac', '2c', '3c', '4c', '5c', '6c', '7c', '8c', '9c', '10c', 'jc', 'qc', 'kc', 'ad', '2d', '3d', '4d', '5d', '6d', '7d', '8d', '9d', '10d', 'jd', 'qd', 'kd', 'ah', '2h', '3h', '4h', '5h', '6h', '7h', '8h', '9h', '10h', 'jh', 'qh', 'kh', 'as', '2s', '3s', '4s', '5s', '6s', '7s', '8s', '9s', '10s', 'js', 'qs', 'ks',]
     cmd_to_int = {cmd:index for index, cmd in enumerate(int_to_cmd)}
         
 
 class Card:
-    def __init__(self, suit:str, value):
-        self.suit = suit.title()
-        self.value = value.upper()
-        self.health = self.get_card_health()
-        self.attack = self.get_card_attack()
+    """
+    Immutable flyweight card. Only 52 instances exist, one per index of
+    Card_Commands.int_to_cmd, so Card(suit, value) always returns the shared instance.
+    Every attribute is a lookup into the class level tables below.
+    """
+    __slots__ = ('index',)
+
+    SUIT_NAMES = ('Clubs', 'Diamonds', 'Hearts', 'Spades')
+    VALUE_NAMES = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K')
+    SUIT_INDEX = {suit:index for index, suit in enumerate(SUIT_NAMES)}
+    VALUE_INDEX = {value:index for index, value in enumerate(VALUE_NAMES)}
+
+    # lookup tables indexed by card index (0..51)
+    SUIT = tuple(index // 13 for index in range(52))
+    VALUE_ORDER = tuple(index % 13 + 1 for index in range(52)) # A=1 ... K=13
+    ATTACK = tuple(
+        (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 15, 20)[index % 13]
+        for index in range(52)
+        )
+    HEALTH = tuple(
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 20, 30, 40)[index % 13]
+        for index in range(52)
+        )
+    # suit major, value minor. Matches the index order of Card_Commands.int_to_cmd
+    SORT_KEY = tuple(range(52))
+
+    ALL: tuple['Card', ...] = ()
+
+    def __new__(cls, suit:str, value):
+        return cls.ALL[cls.index_of(suit, value)]
+
+    @classmethod
+    def index_of(cls, suit:str, value)->int:
+        return cls.SUIT_INDEX[suit.title()] * 13 + cls.VALUE_INDEX[str(value).upper()]
+
+    @classmethod
+    def from_int(cls, index:int)->'Card':
+        return cls.ALL[index]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Card is immutable')
+
+    def __reduce__(self):
+        return (Card.from_int, (self.index,))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __str__(self):
         return f"{self.value} of {self.suit}"
 
-    def __lt__(self, other, sort_type='suit'):
-        # Define the order of suits
-        suit_order = {'Clubs': 0, 'Diamonds': 1, 'Hearts': 2, 'Spades': 3}
-        
-        # Define the order of values
-        value_order = {'K': 13, 'Q': 12, 'J': 11, '10': 10, '9': 9, '8': 8, 
-                       '7': 7, '6': 6, '5': 5, '4': 4, '3': 3, '2': 2, 'A': 1}
+    def __repr__(self):
+        return f"Card({self.get_cmd()!r})"
 
+    def __lt__(self, other, sort_type='suit'):
         if sort_type == 'suit':
-            if self.suit != other.suit:
-                return suit_order[self.suit] < suit_order[other.suit]
+            return Card.SORT_KEY[self.index] < Card.SORT_KEY[other.index]
+
+        return Card.VALUE_ORDER[self.index] < Card.VALUE_ORDER[other.index]
+
+    @property
+    def suit(self)->str:
+        return Card.SUIT_NAMES[Card.SUIT[self.index]]
+
+    @property
+    def value(self)->str:
+        return Card.VALUE_NAMES[self.index % 13]
 
-        return value_order[self.value] < value_order[other.value]
+    @property
+    def health(self)->int:
+        return Card.HEALTH[self.index]
+
+    @property
+    def attack(self)->int:
+        return Card.ATTACK[self.index]
     
     def get_card_health(self)->int:
-        if self.value == 'J':
-            return 20
-        elif self.value == 'Q':
-            return 30
-        elif self.value == 'K':
-            return 40
-        else:
-            return 0
+        return Card.HEALTH[self.index]
     
     def get_card_attack(self)->int:
-        if self.value == 'J':
-            return 10
-        elif self.value == 'Q':
-            return 15
-        elif self.value == 'K':
-            return 20
-        elif self.value == 'A':
-            return 1
-        else:
-            return int(self.value)
+        return Card.ATTACK[self.index]
         
     @staticmethod
     def get_cmd_attack(command):
         """assumes command is properly formatted"""
-        cmd_value = command[:-1].lower()
-        match cmd_value:
-            case 'j':
-                return 10
-            case 'q':
-                return 15
-            case 'k':
-                return 20
-            case 'a':
-                return 1
-            case _:
-                return int(cmd_value)
+        return Card.ATTACK[Card_Commands.cmd_to_int[command.lower()]]
         
     def check_card_command(self, command:str)->bool:
         command = command.upper()
@@ -80,13 +142,63 @@ class Card:
         return False
     
     def get_cmd(self):
-        return (str(self.value) + self.suit[0]).lower()
+        return Card_Commands.int_to_cmd[self.index]
     
     def get_int_value(self):
-        return Card_Commands.cmd_to_int[self.get_cmd()]
+        return self.index
+
+
+def _build_cards()->tuple[Card, ...]:
+    cards = []
+    for index in range(52):
+        card = object.__new__(Card)
+        object.__setattr__(card, 'index', index)
+        cards.append(card)
+    return tuple(cards)
+
+Card.ALL = _build_cards()
+
+
+class Enemy:
+    """
+    The castle card currently being fought.
+    Health and attack change during the fight, so they live here instead of on the shared Card.
+    """
+    __slots__ = ('card', 'health', 'attack')
+
+    def __init__(self, card:Card):
+        self.card = card
+        self.health = Card.HEALTH[card.index]
+        self.attack = Card.ATTACK[card.index]
+
+    def __str__(self):
+        return str(self.card)
+
+    @property
+    def suit(self)->str:
+        return self.card.suit
+
+    @property
+    def value(self)->str:
+        return self.card.value
+
+    def get_int_value(self):
+        return self.card.index
 
 class Deck:
-    def __init__(self, deck_type:str='Normal', shuffle:bool=True):
+    # cards of each deck type, in the order they are created before shuffling
+    NORMAL_CARDS = tuple(
+        Card(suit, value)
+        for suit in ['Hearts', 'Diamonds', 'Clubs', 'Spades']
+        for value in ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+        )
+    TAVERN_CARDS = tuple(
+        Card(suit, value)
+        for suit in ['Hearts', 'Diamonds', 'Clubs', 'Spades']
+        for value in ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'A']
+        )
+
+    def __init__(self, deck_type:str='Normal', shuffle:bool=True, rng:random.Random=None, zone:int=TAVERN_ZONE):
         """
         Create a deck of cards based on the specified type.
 
@@ -96,48 +208,70 @@ class Deck:
         - 'Tavern': 40-card deck with values 2-10 and A.
         - 'Castle': 12-card deck with J, Q, K.  
         - 'Empty': An empty deck.
+        rng (random.Random): Shuffles with this generator, by default the global random module.
+        zone (int): Zobrist zone of the deck's cards. self.hash is kept up to date by the methods that add and
+        remove cards, call rehash() after changing self.cards directly.
         """
         self.cards = []
+        self.rng = rng if rng is not None else random
+        self.zone = zone
+        self.keys = ZOBRIST_KEYS[zone]
+        self.hash = 0
+        self.fill(deck_type, shuffle)
+
+    def fill(self, deck_type:str='Normal', shuffle:bool=True):
+        """
+        Replaces the cards of this deck, in place, with a new deck of deck_type.
+        Same deck types as Deck().
+        """
+        cards = self.cards
+        cards.clear()
         if deck_type == 'Normal':
-            suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
-            values = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-            self.cards = [Card(suit, value) for suit in suits for value in values]
+            cards.extend(Deck.NORMAL_CARDS)
         if deck_type == 'Tavern':
-            suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
-            values = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'A']
-            self.cards = [Card(suit, value) for suit in suits for value in values]
+            cards.extend(Deck.TAVERN_CARDS)
         if deck_type == 'Castle':
             suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
             values = ['K', 'Q', 'J',]
             for value in values:
-                random.shuffle(suits)
+                self.rng.shuffle(suits)
                 for suit in suits:
-                    self.cards.append(Card(suit, value))
+                    cards.append(Card(suit, value))
             shuffle = False
-        if deck_type == 'Empty':
-            self.cards = []
         if shuffle:
             self.shuffle()
+        self.rehash()
+
+    def rehash(self):
+        """Recomputes self.hash from self.cards."""
+        self.hash = zobrist_hash(self.cards, self.zone)
 
     def __len__(self):
         return len(self.cards)
 
     def draw_card(self):
-        return self.cards.pop() if self.cards else None
+        if not self.cards:
+            return None
+        card = self.cards.pop()
+        self.hash ^= self.keys[card.index]
+        return card
     
     def add_card(self, card:Card | list[Card]):
         """Adds a card or list of cards to the deck."""
         if isinstance(card, list):
             for c in card:
                 self.cards.append(c)
+                self.hash ^= self.keys[c.index]
         elif isinstance(card, Card):
             self.cards.append(card)
+            self.hash ^= self.keys[card.index]
 
     def add_card_on_top(self, card):
         self.cards.insert(0, card) 
+        self.hash ^= self.keys[card.index]
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
 
     def __str__(self):
         return ', '.join(str(card) for card in self.cards)
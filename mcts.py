@@ -0,0 +1,208 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from materials import Card
+from regicideAI import RegicideGame_AI, AIGameSnapshot
+
+
+class Node:
+    """
+    Node of the search tree, one per sequence of actions from the root.
+    available counts the iterations where the node's action was legal, used by UCB instead of the parent visits.
+    """
+    __slots__ = ('children', 'visits', 'total', 'available')
+
+    def __init__(self):
+        self.children: dict[int, Node] = {}
+        self.visits = 0
+        self.total = 0.0
+        self.available = 0
+
+    def ucb(self, exploration:float)->float:
+        return self.total / self.visits + exploration * math.sqrt(math.log(self.available) / self.visits)
+
+
+def position_value(env:RegicideGame_AI)->float:
+    """
+    Score of a position between 0 and 1.
+    1 for a win, otherwise the fraction of the 12 castle cards defeated, counting damage on the current enemy.
+    """
+    if env.game_result == 'Win':
+        return 1.0
+    enemy = env.current_enemy
+    defeated = 12 - len(env.enemies) - 1
+    damage = 1 - max(enemy.health, 0) / enemy.card.health
+    return (defeated + damage) / 12
+
+def determinize(env:RegicideGame_AI, rng:random.Random):
+    """
+    Resamples the hidden order of the tavern and castle decks.
+    The castle deck keeps its ranks in place (jacks, then queens, then kings), only the suits within a rank move.
+    """
+    rng.shuffle(env.deck.cards)
+    castle = env.enemies.cards
+    start = 0
+    while start < len(castle):
+        rank = Card.VALUE_ORDER[castle[start].index]
+        end = start + 1
+        while end < len(castle) and Card.VALUE_ORDER[castle[end].index] == rank:
+            end += 1
+        castle[start:end] = rng.sample(castle[start:end], end - start)
+        start = end
+
+def rollout(env:RegicideGame_AI, rng:random.Random, max_depth:int)->float:
+    """Default policy, random legal actions until the game ends or max_depth steps are played."""
+    for _ in range(max_depth):
+        if not env.running:
+            break
+        legal = env.legal_actions()
+        env.step(legal[rng.randrange(len(legal))])
+    return position_value(env)
+
+def search(env:RegicideGame_AI, root:AIGameSnapshot, iterations:int|None, time_limit:float|None,
+           exploration:float, rollout_depth:int, rng:random.Random)->dict[int, tuple[int, float]]:
+    """
+    Single observer information set MCTS from the root position.
+    Every iteration restores root, resamples the hidden deck orders, then selects, expands, rolls out and backs up.
+    Stops after iterations or time_limit seconds, whichever comes first.
+    Returns {action: (visits, total value)} for the root's children.
+    """
+    tree = Node()
+    deadline = time.perf_counter() + time_limit if time_limit else None
+    iteration = 0
+    while (iterations is None or iteration < iterations) and \
+            (deadline is None or time.perf_counter() < deadline):
+        iteration += 1
+        env.restore(root)
+        determinize(env, rng)
+
+        node = tree
+        path = [node]
+        while env.running:
+            legal = env.legal_actions()
+            children = node.children
+            untried = [action for action in legal if action not in children]
+            for action in legal:
+                if action in children:
+                    children[action].available += 1
+            if untried:
+                action = untried[rng.randrange(len(untried))]
+                node = children[action] = Node()
+                node.available = 1
+                env.step(action)
+                path.append(node)
+                break
+            action = max(legal, key=lambda a: children[a].ucb(exploration))
+            node = children[action]
+            env.step(action)
+            path.append(node)
+
+        value = rollout(env, rng, rollout_depth)
+        for node in path:
+            node.visits += 1
+            node.total += value
+
+    return {action: (child.visits, child.total) for action, child in tree.children.items()}
+
+
+# env of each pool process, made once by _init_worker
+_worker_env = None
+
+def _init_worker(player_names):
+    global _worker_env
+    _worker_env = RegicideGame_AI(player_names)
+
+def _search_task(root, iterations, time_limit, exploration, rollout_depth, seed):
+    # refills shuffle with the random module, so each task gets its own seed
+    random.seed(seed)
+    return search(_worker_env, root, iterations, time_limit, exploration, rollout_depth, random.Random(seed))
+
+
+class MCTSAgent:
+    """
+    Search based player for RegicideGame_AI, an alternative to the DQN policy_net.
+    select_action(env) returns an action int of env.int_to_icmd, so a game is played with
+        env.step(agent.select_action(env))
+
+    Each move is searched by workers processes in parallel (root parallelization), each running its own
+    tree for iterations / workers iterations, or time_limit seconds. The root statistics are summed and the
+    most visited action is played.
+    workers=1 searches in this process without a pool.
+    """
+
+    def __init__(self, iterations:int|None=2000, time_limit:float|None=None, workers:int|None=None,
+                 exploration:float=0.7, rollout_depth:int=200, seed=None, player_names=['ai_a','ai_b']):
+        assert iterations or time_limit, 'MCTSAgent needs an iteration or time budget'
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.workers = workers or os.cpu_count()
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.rng = random.Random(seed)
+        self.root_stats: dict[int, tuple[int, float]] = {}
+
+        self.pool = None
+        self.env = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(player_names,))
+        else:
+            self.env = RegicideGame_AI(player_names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def select_action(self, env:RegicideGame_AI)->int:
+        legal = env.legal_actions()
+        if len(legal) == 1:
+            return legal[0]
+
+        root = env.snapshot()
+        iterations = -(-self.iterations // self.workers) if self.iterations else None
+        seeds = [self.rng.getrandbits(32) for _ in range(self.workers)]
+        if self.pool:
+            futures = [
+                self.pool.submit(_search_task, root, iterations, self.time_limit,
+                                 self.exploration, self.rollout_depth, seed)
+                for seed in seeds
+            ]
+            results = [future.result() for future in futures]
+        else:
+            results = [search(self.env, root, iterations, self.time_limit,
+                              self.exploration, self.rollout_depth, random.Random(seeds[0]))]
+
+        stats = {}
+        for result in results:
+            for action, (visits, total) in result.items():
+                old_visits, old_total = stats.get(action, (0, 0.0))
+                stats[action] = (old_visits + visits, old_total + total)
+        self.root_stats = stats
+        return max(legal, key=lambda action: stats.get(action, (0, 0.0))[0])
+
+
+def play_game(agent, env:RegicideGame_AI)->RegicideGame_AI:
+    """Plays one game from env's current position with agent.select_action(env)."""
+    while env.running:
+        env.step(agent.select_action(env))
+    return env
+
+
+if __name__ == "__main__":
+    env = RegicideGame_AI()
+    with MCTSAgent(iterations=400) as agent:
+        for game in range(1, 6):
+            env.reset()
+            start = time.perf_counter()
+            play_game(agent, env)
+            print(f'Game {game}: {env.game_result}, {len(env.enemies)} enemies left, '
+                  f'{env.steps_taken} steps, {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,126 @@
+import math
+import time
+
+# METRICS_WINDOW is the number of recent episodes the rolling statistics cover
+# METRICS_REPORT_EVERY prints a report every that many episodes, 0 turns it off
+# METRICS_REPORT_SECONDS also prints one when that many seconds passed since the last, None turns it off
+# METRICS_EWMA_ALPHA is the weight of the newest value in the loss and Q averages
+METRICS_WINDOW = 100
+METRICS_REPORT_EVERY = 20
+METRICS_REPORT_SECONDS = None
+METRICS_EWMA_ALPHA = 0.01
+
+
+class RollingMean:
+    """
+    Mean of the last window values. A ring buffer with a running sum, so add() is O(1).
+    The sum is recomputed once per pass over the buffer, so rounding errors don't pile up.
+    """
+    __slots__ = ('values', 'index', 'count', 'total')
+
+    def __init__(self, window:int):
+        self.values = [0.0] * window
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value:float):
+        values = self.values
+        if self.count == len(values):
+            self.total -= values[self.index]
+        else:
+            self.count += 1
+        values[self.index] = value
+        self.total += value
+        self.index += 1
+        if self.index == len(values):
+            self.index = 0
+            self.total = math.fsum(values)
+
+    @property
+    def mean(self)->float:
+        return self.total / self.count if self.count else math.nan
+
+
+class EWMA:
+    """Exponentially weighted moving average, alpha is the weight of the newest value."""
+    __slots__ = ('alpha', 'mean')
+
+    def __init__(self, alpha:float=METRICS_EWMA_ALPHA):
+        self.alpha = alpha
+        self.mean = math.nan
+
+    def add(self, value:float):
+        self.mean = value if math.isnan(self.mean) else self.mean + self.alpha * (value - self.mean)
+
+
+class TrainingMetrics:
+    """
+    Online training statistics, fed by the training loop:
+    - on_step() for every env step
+    - on_update(loss, q) for every gradient step, q being the mean Q of the batch's chosen actions
+    - on_episode(...) for every finished or abandoned episode
+    Win rate, enemies defeated and invalid move rate cover the last window episodes, loss and Q are EWMAs and
+    steps per second is measured since the last report. maybe_report() prints a report at the cadence set by
+    report_every (episodes) and report_seconds.
+    """
+
+    def __init__(self, window:int=METRICS_WINDOW, report_every:int=METRICS_REPORT_EVERY,
+                 report_seconds:float|None=METRICS_REPORT_SECONDS, alpha:float=METRICS_EWMA_ALPHA):
+        self.wins = RollingMean(window)
+        self.defeated = RollingMean(window)
+        self.steps = RollingMean(window)
+        self.invalid_steps = RollingMean(window)
+        self.loss = EWMA(alpha)
+        self.q = EWMA(alpha)
+        self.report_every = report_every
+        self.report_seconds = report_seconds
+        self.episodes = 0
+        self.total_steps = 0
+        self.report_steps = 0
+        self.report_time = time.perf_counter()
+
+    def on_step(self, count:int=1):
+        self.total_steps += count
+
+    def on_update(self, loss:float, q:float):
+        self.loss.add(loss)
+        self.q.add(q)
+
+    def on_episode(self, game_result:str|None, castle_size:int, steps:int, invalid_steps:int):
+        """castle_size is len(env.enemies) at the end, game_result None for an episode abandoned at CYCLE_LIMIT."""
+        self.episodes += 1
+        self.wins.add(game_result == 'Win')
+        # on a loss the current enemy is still alive besides the castle deck
+        self.defeated.add(12 if game_result == 'Win' else 11 - castle_size)
+        self.steps.add(steps)
+        self.invalid_steps.add(invalid_steps)
+
+    def summary(self)->dict:
+        now = time.perf_counter()
+        elapsed = now - self.report_time
+        return {
+            'episodes': self.episodes,
+            'win_rate': self.wins.mean,
+            'enemies_defeated': self.defeated.mean,
+            'invalid_rate': self.invalid_steps.total / self.steps.total if self.steps.total else math.nan,
+            'loss': self.loss.mean,
+            'q': self.q.mean,
+            'steps_per_sec': (self.total_steps - self.report_steps) / elapsed if elapsed > 0 else math.nan,
+        }
+
+    def report(self)->dict:
+        summary = self.summary()
+        print(f"Episode {summary['episodes']} | win {summary['win_rate']:.1%} | "
+              f"defeated {summary['enemies_defeated']:.2f} | invalid {summary['invalid_rate']:.1%} | "
+              f"loss {summary['loss']:.3g} | Q {summary['q']:.3g} | {summary['steps_per_sec']:.0f} steps/s")
+        self.report_steps = self.total_steps
+        self.report_time = time.perf_counter()
+        return summary
+
+    def maybe_report(self)->dict|None:
+        """Reports if an episode or time cadence is due, call it after on_episode()."""
+        due = self.report_every and self.episodes % self.report_every == 0
+        if self.report_seconds is not None and time.perf_counter() - self.report_time >= self.report_seconds:
+            due = True
+        return self.report() if due else None
@@ -1,7 +1,10 @@
 # import gymnasium as gym
+import copy
 import math
+import os
 import random
-from collections import namedtuple, deque
+import threading
+import time
 from itertools import count
 
 import torch
@@ -10,17 +13,32 @@ import torch.optim as optim
 import torch.nn.functional as F
 
 from regicideAI import RegicideGame_AI
+from replay import ReplayBuffer, PrioritizedReplayBuffer
+from results_log import ResultsWriter
+from metrics import TrainingMetrics
+from agent_settings import MODEL_NAME, MODEL_PKL_PATH, CYCLE_LIMIT, REDUCED_DEFENSE_ACTIONS, agent_action_mask
 
 LOAD_MODEL = True
 num_episodes = None # gets set later if set to none
-CYCLE_LIMIT = 5_000
 MAX_MEM = 20_000
 
-MODEL_NAME = 'model3'
-MODEL_PKL_PATH = './' + MODEL_NAME + '_.pkl'
+# MODEL_NAME, MODEL_PKL_PATH, CYCLE_LIMIT and REDUCED_DEFENSE_ACTIONS are set in agent_settings.py
 CYCLE_LIMIT_LOG_PATH = './' + MODEL_NAME + '_games_hit_cycle_lim.log'
 FINAL_SCORE_LOG_PATH = './' + MODEL_NAME + '_final_scores.log'
-FINAL_SCORE_CSV_PATH = './' + MODEL_NAME + '_final_scores.csv'
+# episode results, see results_log.py
+RESULTS_PATH = './' + MODEL_NAME + '_final_scores.bin'
+CHECKPOINT_PATH = './' + MODEL_NAME + '_checkpoint.pt'
+# policy_net pretrained on heuristic games by heuristic.py, the starting point when MODEL_PKL_PATH doesn't exist yet
+PRETRAINED_PKL_PATH = './' + MODEL_NAME + '_pretrained.pkl'
+# heuristic.py's demonstrations, model.py's Trainer pushes them into its replay memory when it doesn't resume
+DEMOS_PATH = './' + MODEL_NAME + '_demos.npz'
+
+# CHECKPOINT_EVERY is the number of episodes between checkpoints (and saves of MODEL_PKL_PATH)
+# ASYNC_CHECKPOINTS writes checkpoints on a background thread, training only waits while the state is copied
+# RESUME continues from CHECKPOINT_PATH when it exists, LOAD_MODEL only restores policy_net's weights
+CHECKPOINT_EVERY = 20
+ASYNC_CHECKPOINTS = True
+RESUME = True
 
 # BATCH_SIZE is the number of transitions sampled from the replay buffer
 # GAMMA is the discount factor as mentioned in the previous section
@@ -38,6 +56,23 @@ TAU = 0.005
 LR = 1e-5
 # LR = 1e-4
 
+# HARD_UPDATE_EVERY copies policy_net into target_net every that many gradient steps, 0 uses the TAU soft update
+# TRAIN_EVERY is the number of env steps between optimizations
+# GRADIENT_STEPS is the number of gradient steps taken by each optimization
+# COMPILE_LEARNER runs the loss through torch.compile, compiled once up front on a warm-up batch
+HARD_UPDATE_EVERY = 0
+TRAIN_EVERY = 1
+GRADIENT_STEPS = 1
+COMPILE_LEARNER = False
+
+# sample transitions by TD error instead of uniformly (off by default), see replay.PrioritizedReplayBuffer
+# PER_ALPHA is how strongly priorities skew sampling, 0 is uniform
+# PER_BETA_START is the starting importance sampling correction, annealed to 1 over PER_BETA_STEPS optimizations
+PRIORITIZED_REPLAY = False
+PER_ALPHA = 0.6
+PER_BETA_START = 0.4
+PER_BETA_STEPS = 100_000
+
 # increase randomness to avoid deadlocks
 # INVALID_BACKOFF_FACTOR = 1.01
 INVALID_BACKOFF_STATIC = 1
@@ -48,16 +83,7 @@ env = RegicideGame_AI()
 # Get number of actions from gym action space
 n_actions = env.action_space
 # Get the number of state observations
-state, info = env.reset()
-n_observations = len(state)
-
-with open(FINAL_SCORE_CSV_PATH, 'r') as file:
-    if num_episodes == None:
-        num_episodes = len(file.readlines()) * .2
-
-num_episodes = int(max(num_episodes, 40))
-
-episode_final_score = []
+n_observations = len(env.reset()[0])
 
 # if GPU is to be used
 device = torch.device(
@@ -84,66 +110,59 @@ class DQN(nn.Module):
         return self.layer3(x)
 
 
-Transition = namedtuple('Transition',
-                        ('state', 'action', 'next_state', 'reward'))
-
-
-class ReplayMemory(object):
-
-    def __init__(self, capacity):
-        self.memory = deque([], maxlen=capacity)
-
-    def push(self, *args):
-        """Save a transition"""
-        self.memory.append(Transition(*args))
-
-    def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
-
-    def __len__(self):
-        return len(self.memory)
-
-policy_net = DQN(n_observations, n_actions).to(device)
-if LOAD_MODEL:
-    try:
-        policy_net.load_state_dict(torch.load(MODEL_PKL_PATH, weights_only=True))
-        policy_net.eval()
-    except FileNotFoundError as e:
-        print('Model not loaded, file could not be found')
-
-target_net = DQN(n_observations, n_actions).to(device)
-target_net.load_state_dict(policy_net.state_dict())
-
-def save_model_to_file():
-    print('Saving Model')
-    torch.save(policy_net.state_dict(), MODEL_PKL_PATH)
-
-optimizer = optim.AdamW(policy_net.parameters(), lr=LR, amsgrad=True)
-memory = ReplayMemory(MAX_MEM)
-
-steps_done = 0
-    
-def select_action(state, last_act_invalid=False)->int:
+def load_policy_net()->DQN:
+    """policy_net, with the weights of MODEL_PKL_PATH (or else PRETRAINED_PKL_PATH) if LOAD_MODEL and the file exists."""
+    policy_net = DQN(n_observations, n_actions).to(device)
+    if LOAD_MODEL:
+        path = MODEL_PKL_PATH if os.path.exists(MODEL_PKL_PATH) else PRETRAINED_PKL_PATH
+        try:
+            policy_net.load_state_dict(torch.load(path, weights_only=True, map_location=device))
+            policy_net.eval()
+        except FileNotFoundError as e:
+            print('Model not loaded, file could not be found')
+    return policy_net
+
+def make_memory()->ReplayBuffer:
+    if PRIORITIZED_REPLAY:
+        return PrioritizedReplayBuffer(MAX_MEM, n_observations, n_actions, device,
+                                       alpha=PER_ALPHA, beta_start=PER_BETA_START, beta_steps=PER_BETA_STEPS)
+    return ReplayBuffer(MAX_MEM, n_observations, n_actions, device)
+
+def eps_threshold(steps_done:int)->float:
+    return EPS_END + (EPS_START - EPS_END) * math.exp(-1. * steps_done / EPS_DECAY)
+
+def greedy_action(policy_net, state, legal_mask=None, eps=0.0, last_act_invalid=False):
     """
-    Takes game state and predicts best action.
-    If last action was invalid, will choose a random action.
+    Takes game state and predicts best action, a (1, 1) long tensor.
+    If legal_mask is given (a bool tensor from legal_mask_tensor()) only legal actions are considered.
+    With probability eps, or if last action was invalid, will choose a random action.
     """
-    global steps_done
-    sample = random.random()
-    eps_threshold = EPS_END + (EPS_START - EPS_END) * \
-        math.exp(-1. * steps_done / EPS_DECAY)
-    steps_done += 1
-    if not last_act_invalid and sample > eps_threshold:
+    if not last_act_invalid and random.random() > eps:
         with torch.no_grad():
             # t.max(1) will return the largest column value of each row.
             # second column on max result is index of where max element was
             # found, so we pick action with the larger expected reward.
-            return policy_net(state).max(1).indices.view(1, 1)
+            q_values = policy_net(state)
+            if legal_mask is not None:
+                q_values = q_values.masked_fill(~legal_mask, -math.inf)
+            return q_values.max(1).indices.view(1, 1)
     else:
-        rand_index = random.randint(0,env.action_space-1)
-        return torch.tensor([[rand_index]], device=device, dtype=torch.long)
-
-def state_to_str(state)->str:
+        if legal_mask is not None:
+            legal_actions = legal_mask[0].nonzero()
+            rand_index = legal_actions[random.randrange(len(legal_actions))].item()
+        else:
+            rand_index = random.randint(0,n_actions-1)
+        return torch.tensor([[rand_index]], device=state.device, dtype=torch.long)
+
+def state_tensor(env:RegicideGame_AI, device=device)->torch.Tensor:
+    """env's observation as a (1, n_observations) float tensor, converted straight from env.observe()."""
+    return torch.from_numpy(env.observe()).to(device, torch.float32).unsqueeze(0)
+
+def legal_mask_tensor(env:RegicideGame_AI, device=device)->torch.Tensor:
+    """agent_action_mask() as a (1, n_actions) bool tensor."""
+    return torch.tensor(agent_action_mask(env), dtype=torch.bool, device=device).unsqueeze(0)
+
+def state_to_str(env:RegicideGame_AI, state)->str:
     state = state[0].int()
     labels = ['Deck','Discard','Enemies','Current E','E HP','E Att','is_p_turn','p_index']
     for player in env.players:
@@ -157,9 +176,8 @@ def state_to_str(state)->str:
 
     return ', '.join(return_list)
 
-def log_cycle_limit_game(state):
-    global CYCLE_LIMIT_LOG_PATH
-    info = state_to_str(state)
+def log_cycle_limit_game(env:RegicideGame_AI, state, t:int):
+    info = state_to_str(env, state)
     with open(CYCLE_LIMIT_LOG_PATH, 'a') as file:
         file.write('\n\n')
         file.write(f'Abondoning episode because t limit reached. t = {t}')
@@ -168,116 +186,299 @@ def log_cycle_limit_game(state):
         file.write('\n')
         file.write(info)
 
+def write_checkpoint(state:dict, path:str=CHECKPOINT_PATH):
+    """Writes state atomically, to a temporary file first then renamed over path, so a crash keeps the last checkpoint."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        torch.save(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
 
-def optimize_model():
-    if len(memory) < BATCH_SIZE:
-        return
-    transitions = memory.sample(BATCH_SIZE)
-    # Transpose the batch (see https://stackoverflow.com/a/19343/3343043 for
-    # detailed explanation). This converts batch-array of Transitions
-    # to Transition of batch-arrays.
-    batch = Transition(*zip(*transitions))
-
-    # Compute a mask of non-final states and concatenate the batch elements
-    # (a final state would've been the one after which simulation ended)
-    non_final_mask = torch.tensor(tuple(map(lambda s: s is not None,
-                                          batch.next_state)), device=device, dtype=torch.bool)
-    non_final_next_states = torch.cat([s for s in batch.next_state
-                                                if s is not None])
-                                    
-    state_batch = torch.cat(batch.state)
-    action_batch = torch.cat(batch.action)
-    reward_batch = torch.cat(batch.reward)
-
-    # Compute Q(s_t, a) - the model computes Q(s_t), then we select the
-    # columns of actions taken. These are the actions which would've been taken
-    # for each batch state according to policy_net
-    state_action_values = policy_net(state_batch).gather(1, action_batch)
-
-    # Compute V(s_{t+1}) for all next states.
-    # Expected values of actions for non_final_next_states are computed based
-    # on the "older" target_net; selecting their best reward with max(1).values
-    # This is merged based on the mask, such that we'll have either the expected
-    # state value or 0 in case the state was final.
-    next_state_values = torch.zeros(BATCH_SIZE, device=device)
-    with torch.no_grad():
-        next_state_values[non_final_mask] = target_net(non_final_next_states).max(1).values
-    # Compute the expected Q values
-    expected_state_action_values = (next_state_values * GAMMA) + reward_batch
-
-    # Compute Huber loss
-    criterion = nn.SmoothL1Loss()
-    loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
-
-    # Optimize the model
-    optimizer.zero_grad()
-    loss.backward()
-    # In-place gradient clipping
-    torch.nn.utils.clip_grad_value_(policy_net.parameters(), 100)
-    optimizer.step()
-
-for i_episode in range(1, num_episodes+1):
-    print(f'Starting Episode #{i_episode}')
-
-    # start of episode go for 0 randomness
-    steps_done = EPS_DECAY
-
-    # Initialize the environment and get its state
-    state, info = env.reset()
-    state = torch.tensor(state, dtype=torch.float32, device=device).unsqueeze(0)
-    invalid_action = False
-    for t in count():
-        if t % 500 == 0:
-            print (f'Episode: {i_episode} Cycle {t}')
-
-        if t > CYCLE_LIMIT:
-            log_cycle_limit_game(state)
-            break
-
-        action = select_action(state, invalid_action)
-        observation, reward, done, invalid_action = env.step(action)
-
-        # if invalid_action:
-        #     # steps_done /= INVALID_BACKOFF_FACTOR
-        #     steps_done -= INVALID_BACKOFF_STATIC
-        #     steps_done = max(0,int(steps_done))
-        
-        reward = torch.tensor([reward], device=device)
-
-        next_state = None
-        if not done:
-            next_state = torch.tensor(observation, dtype=torch.float32, device=device).unsqueeze(0)
-
-        # Store the transition in memory
-        memory.push(state, action, next_state, reward)
-
-        # Move to the next state
-        state = next_state
-
-        # Perform one step of the optimization (on the policy network)
-        optimize_model()
-
-        # Soft update of the target network's weights
-        # θ′ ← τ θ + (1 −τ )θ′
-        target_net_state_dict = target_net.state_dict()
-        policy_net_state_dict = policy_net.state_dict()
-        for key in policy_net_state_dict:
-            target_net_state_dict[key] = policy_net_state_dict[key]*TAU + target_net_state_dict[key]*(1-TAU)
-        target_net.load_state_dict(target_net_state_dict)
-
-        if done:
-            print(f'Game #{i_episode} has ended')
-            info = (env.game_result, len(env.enemies), env.steps_taken, env.invalid_steps_taken)
-            episode_final_score.append(info )
-            # print to CSV
-            with open(FINAL_SCORE_CSV_PATH, 'a') as csv_file:
-                csv_file.write('\n')
-                csv_file.write(','.join(map(str,info)))
-            break
-
-    if i_episode > 1 and i_episode % 20 == 0:
-        save_model_to_file()
-
-print('\n')
-print('Complete')
-print(f'{len(episode_final_score)} episodes completed')
+class Trainer:
+    """
+    DQN training engine: policy_net, target_net, optimizer and replay memory, plus the update cadence.
+    Call observe() after every env step that was pushed to memory, it optimizes every train_every steps,
+    gradient_steps batches at a time. After each gradient step target_net moves towards policy_net with an
+    in place Polyak update, or is overwritten every hard_update_every gradient steps.
+    memory can be anything with len() and sample(batch_size) returning a replay.Batch on device.
+
+    With resume, training continues from the checkpoint at checkpoint_path if there is one: both nets,
+    AdamW's moments, the replay memory (with its numpy sampling RNG), the step and episode counters and the
+    random and torch RNG states, so a resumed run plays and learns exactly like the uninterrupted one.
+    Otherwise an empty memory starts out with the heuristic demonstrations at demos_path, if it is given and the
+    file exists. model.py's own run passes DEMOS_PATH, other Trainers (bench, actor_learner) start empty.
+    """
+
+    def __init__(self, memory=None, policy_net:DQN|None=None, batch_size:int=BATCH_SIZE, gamma:float=GAMMA,
+                 lr:float=LR, tau:float=TAU, hard_update_every:int=HARD_UPDATE_EVERY, train_every:int=TRAIN_EVERY,
+                 gradient_steps:int=GRADIENT_STEPS, compile:bool=COMPILE_LEARNER, resume:bool=RESUME,
+                 checkpoint_path:str=CHECKPOINT_PATH, demos_path:str|None=None):
+        self.policy_net = policy_net if policy_net is not None else load_policy_net()
+        self.target_net = DQN(n_observations, n_actions).to(device)
+        self.target_net.load_state_dict(self.policy_net.state_dict())
+        self.optimizer = optim.AdamW(self.policy_net.parameters(), lr=lr, amsgrad=True)
+        self.memory = memory if memory is not None else make_memory()
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.tau = tau
+        self.hard_update_every = hard_update_every
+        self.train_every = train_every
+        self.gradient_steps = gradient_steps
+        self.env_steps = 0
+        self.updates = 0
+        self.episodes = 0
+        self.episode_target = 0
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_thread = None
+        self.results: ResultsWriter|None = None
+        # rows of the results log at the checkpoint resumed from
+        self.result_rows = None
+        self.metrics = TrainingMetrics()
+        self.policy_params = list(self.policy_net.parameters())
+        self.target_params = list(self.target_net.parameters())
+
+        self.loss_fn = self.td_loss
+        if compile:
+            self.loss_fn = torch.compile(self.td_loss, dynamic=False)
+            self.warm_up()
+        if resume and os.path.exists(checkpoint_path):
+            self.load_checkpoint(checkpoint_path)
+        elif demos_path and os.path.exists(demos_path) and isinstance(self.memory, ReplayBuffer) \
+                and len(self.memory) == 0:
+            self.fill_from_demos(demos_path)
+
+    def fill_from_demos(self, path:str):
+        from heuristic import Demonstrations, fill_replay
+        fill_replay(self.memory, Demonstrations.load(path))
+        print(f'Replay memory filled with {len(self.memory)} heuristic transitions from {path}')
+
+    def td_loss(self, states, actions, rewards, next_states, dones, next_masks, weights):
+        """Weighted Huber loss of the batch, its TD errors and the mean Q of the actions taken."""
+        # Compute Q(s_t, a) - the model computes Q(s_t), then we select the
+        # columns of actions taken. These are the actions which would've been taken
+        # for each batch state according to policy_net
+        state_action_values = self.policy_net(states).gather(1, actions).squeeze(1)
+
+        # Compute V(s_{t+1}) for all next states.
+        # Expected values of actions for next_states are computed based
+        # on the "older" target_net; selecting their best legal reward with max(1).values
+        # This is merged based on dones, such that we'll have either the expected
+        # state value or 0 in case the state was final.
+        with torch.no_grad():
+            next_q_values = self.target_net(next_states).masked_fill(~next_masks, -math.inf).max(1).values
+            next_state_values = torch.where(dones, 0.0, next_q_values)
+        # Compute the expected Q values
+        expected_state_action_values = (next_state_values * self.gamma) + rewards
+
+        # Compute Huber loss, per transition so prioritized replay can weight it
+        losses = F.smooth_l1_loss(state_action_values, expected_state_action_values, reduction='none')
+        td_errors = (expected_state_action_values - state_action_values).detach()
+        return (losses * weights).mean(), td_errors, state_action_values.detach().mean()
+
+    def warm_up(self):
+        """Runs the compiled loss and its backward on a dummy batch, so compiling doesn't stall training later."""
+        n = self.batch_size
+        loss, _, _ = self.loss_fn(
+            torch.zeros((n, n_observations), device=device),
+            torch.zeros((n, 1), dtype=torch.long, device=device),
+            torch.zeros(n, device=device),
+            torch.zeros((n, n_observations), device=device),
+            torch.zeros(n, dtype=torch.bool, device=device),
+            torch.ones((n, n_actions), dtype=torch.bool, device=device),
+            torch.ones(n, device=device),
+        )
+        loss.backward()
+        self.optimizer.zero_grad()
+
+    def optimize_model(self)->float|None:
+        """One gradient step on a sampled batch, returns the loss, None while memory is short of a batch."""
+        if len(self.memory) < self.batch_size:
+            return None
+        batch = self.memory.sample(self.batch_size)
+        weights = batch.weights if batch.weights is not None else torch.ones(self.batch_size, device=device)
+        loss, td_errors, q = self.loss_fn(batch.states, batch.actions, batch.rewards, batch.next_states,
+                                          batch.dones, batch.next_masks, weights)
+        if batch.weights is not None:
+            self.memory.update_priorities(batch.indices, td_errors)
+
+        # Optimize the model
+        self.optimizer.zero_grad()
+        loss.backward()
+        # In-place gradient clipping
+        torch.nn.utils.clip_grad_value_(self.policy_params, 100)
+        self.optimizer.step()
+        self.updates += 1
+        self.update_target()
+        loss = loss.item()
+        self.metrics.on_update(loss, q.item())
+        return loss
+
+    def update_target(self):
+        with torch.no_grad():
+            if self.hard_update_every:
+                if self.updates % self.hard_update_every == 0:
+                    torch._foreach_copy_(self.target_params, self.policy_params)
+            else:
+                # θ′ ← τ θ + (1 −τ )θ′, fused over every parameter
+                torch._foreach_lerp_(self.target_params, self.policy_params, self.tau)
+
+    def optimize(self):
+        for _ in range(self.gradient_steps):
+            if self.optimize_model() is None:
+                return
+
+    def observe(self):
+        """Counts an env step, optimizes if it is a train_every step."""
+        self.env_steps += 1
+        if self.env_steps % self.train_every == 0:
+            self.optimize()
+
+    def save_model_to_file(self):
+        print('Saving Model')
+        torch.save(self.policy_net.state_dict(), MODEL_PKL_PATH)
+
+    def checkpoint_state(self)->dict:
+        """Copy of all training state, safe to write while training goes on."""
+        return {
+            'policy_net': {key: value.detach().cpu().clone() for key, value in self.policy_net.state_dict().items()},
+            'target_net': {key: value.detach().cpu().clone() for key, value in self.target_net.state_dict().items()},
+            'optimizer': copy.deepcopy(self.optimizer.state_dict()),
+            'memory': self.memory.state_dict() if isinstance(self.memory, ReplayBuffer) else None,
+            'env_steps': self.env_steps,
+            'updates': self.updates,
+            'episodes': self.episodes,
+            'episode_target': self.episode_target,
+            'result_rows': len(self.results) if self.results is not None else self.result_rows,
+            'random': random.getstate(),
+            'torch_rng': torch.get_rng_state(),
+            'cuda_rng': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+        }
+
+    def save_checkpoint(self, blocking:bool=not ASYNC_CHECKPOINTS):
+        if self.results is not None:
+            self.results.flush()
+        state = self.checkpoint_state()
+        self.wait_for_checkpoint()
+        if blocking:
+            write_checkpoint(state, self.checkpoint_path)
+        else:
+            self.checkpoint_thread = threading.Thread(target=write_checkpoint, args=(state, self.checkpoint_path))
+            self.checkpoint_thread.start()
+
+    def wait_for_checkpoint(self):
+        if self.checkpoint_thread is not None:
+            self.checkpoint_thread.join()
+            self.checkpoint_thread = None
+
+    def load_checkpoint(self, path:str):
+        state = torch.load(path, weights_only=True, map_location='cpu')
+        self.policy_net.load_state_dict(state['policy_net'])
+        self.target_net.load_state_dict(state['target_net'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        if state['memory'] is not None and isinstance(self.memory, ReplayBuffer):
+            self.memory.load_state_dict(state['memory'])
+        self.env_steps = state['env_steps']
+        self.updates = state['updates']
+        self.episodes = state['episodes']
+        self.episode_target = state['episode_target']
+        self.result_rows = state['result_rows']
+        random.setstate(state['random'])
+        torch.set_rng_state(state['torch_rng'])
+        if state['cuda_rng'] and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state['cuda_rng'])
+        print(f'Resumed from {path} at episode {self.episodes}')
+
+    def play_episode(self, env:RegicideGame_AI, i_episode:int):
+        """Plays and learns from one game, returns its final score, None if CYCLE_LIMIT was hit."""
+        # start of episode go for 0 randomness
+        steps_done = EPS_DECAY
+
+        # Initialize the environment and get its state
+        env.reset()
+        state = state_tensor(env)
+        legal_mask = legal_mask_tensor(env)
+        invalid_action = False
+        for t in count():
+            if t % 500 == 0:
+                print (f'Episode: {i_episode} Cycle {t}')
+
+            if t > CYCLE_LIMIT:
+                log_cycle_limit_game(env, state, t)
+                return None
+
+            action = greedy_action(self.policy_net, state, legal_mask, eps_threshold(steps_done), invalid_action)
+            steps_done += 1
+            observation, reward, done, invalid_action = env.step(action)
+
+            # if invalid_action:
+            #     # steps_done /= INVALID_BACKOFF_FACTOR
+            #     steps_done -= INVALID_BACKOFF_STATIC
+            #     steps_done = max(0,int(steps_done))
+
+            next_state = None
+            legal_mask = None
+            if not done:
+                next_state = state_tensor(env)
+                legal_mask = legal_mask_tensor(env)
+
+            # Store the transition in memory
+            self.memory.push(state, action, next_state, reward, legal_mask)
+
+            # Move to the next state
+            state = next_state
+
+            self.metrics.on_step()
+            self.observe()
+
+            if done:
+                return (env.game_result, len(env.enemies), env.steps_taken, env.invalid_steps_taken)
+
+    def train(self, num_episodes=num_episodes):
+        """
+        Plays and learns from num_episodes games, by default a fifth of the episodes trained so far, at least 40.
+        A run resumed from a checkpoint first finishes the episodes its interrupted run had left.
+        """
+        if self.episodes >= self.episode_target:
+            if num_episodes == None:
+                num_episodes = int(max(self.episodes * .2, 40))
+            self.episode_target = self.episodes + num_episodes
+
+        # a resumed run drops the results logged after its checkpoint, it plays those episodes again
+        self.results = ResultsWriter(RESULTS_PATH, rows=self.result_rows)
+        episode_final_score = []
+        while self.episodes < self.episode_target:
+            self.episodes += 1
+            i_episode = self.episodes
+            print(f'Starting Episode #{i_episode}')
+            start = time.perf_counter()
+            info = self.play_episode(env, i_episode)
+            wall_time = time.perf_counter() - start
+            if info is not None:
+                print(f'Game #{i_episode} has ended')
+                episode_final_score.append(info )
+                self.results.append(*info, wall_time)
+            else:
+                self.results.append(None, len(env.enemies), env.steps_taken, env.invalid_steps_taken, wall_time)
+            self.metrics.on_episode(env.game_result if info is not None else None, len(env.enemies),
+                                    env.steps_taken, env.invalid_steps_taken)
+            self.metrics.maybe_report()
+
+            if i_episode % CHECKPOINT_EVERY == 0:
+                self.save_model_to_file()
+                self.save_checkpoint()
+
+        self.save_checkpoint()
+        self.wait_for_checkpoint()
+        self.results.close()
+        self.result_rows = len(self.results)
+        self.results = None
+        print('\n')
+        print('Complete')
+        print(f'{len(episode_final_score)} episodes completed')
+        return episode_final_score
+
+
+if __name__ == "__main__":
+    Trainer(demos_path=DEMOS_PATH).train()
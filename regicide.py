@@ -1,15 +1,60 @@
-from materials import Card, Deck, Card_Commands
+import random
+import re
+from bisect import insort
+from typing import NamedTuple
+from operator import attrgetter
+from materials import Card, Deck, Card_Commands, Enemy, CLUBS, DIAMONDS, HEARTS, SPADES, \
+    TAVERN_ZONE, CASTLE_ZONE, DISCARD_ZONE, PLAY_AREA_ZONE, HAND_ZONE, ZOBRIST_KEYS, ZOBRIST_ENEMY, ZOBRIST_HEALTH, ZOBRIST_ATTACK, ZOBRIST_PLAYER, \
+    ZOBRIST_DEFENDING, ZOBRIST_RESULT, zobrist_hash
+from events import EventBus, TextRenderer, CardsPlayed, EnemyAttackReduced, TavernRefilled, CardsDealt, \
+    DeckEmpty, EnemyDamaged, EnemyDefeated, NewEnemy, AllEnemiesDefeated
+
+_card_index = attrgetter('index')
+
+# separators the text parser ignores, e.g. "10 of hearts, 2c."
+_COMMAND_NOISE = re.compile(r'[\s,.]+|of')
+# one card in a cleaned command, e.g. "10h" or "khearts"
+_CARD_TOKEN = re.compile(r'(10|[2-9ajqk])(hearts|diamonds|clubs|spades|[hdcs])')
+
+def follows_multicard_rules(values:list[int])->bool:
+    """Checks the attack multicard rules for a list of card values (A=1 ... K=13)."""
+    # 1 card is always valid play
+    if len(values) == 1:
+        return True
+    # 2 cards when 1 is ace is always valid
+    if len(values) == 2 and 1 in values:
+        return True
+    # all cards same value, must be 2 to 5, with total value less than 10
+    if values and values.count(values[0]) == len(values):
+        return 2 <= values[0] <= 5 and len(values) * values[0] <= 10
+    return False
 
 class Player:
-    def __init__(self, name:str=None, hand_limit:int=7):
+    def __init__(self, name:str=None, hand_limit:int=7, events:EventBus=None, zone:int=HAND_ZONE):
+        # hand is kept sorted by card index, hand_mask has bit i set when card i is held
+        # hand_hash is the Zobrist hash of the hand in zone, see materials.ZOBRIST_KEYS
         self.hand: list[Card] = []
-        if name:
-            self.name:str = name
+        self.hand_mask:int = 0
+        self.zone = zone
+        self.keys = ZOBRIST_KEYS[zone]
+        self.hand_hash:int = 0
+        self.name:str|None = name
         self.hand_limit:int = hand_limit
+        self.events = events if events is not None else EventBus()
 
     def __str__(self):
         return f'{self.name}\n{self.show_hand()}'
 
+    def add_to_hand(self, card:Card):
+        insort(self.hand, card, key=_card_index)
+        self.hand_mask |= 1 << card.index
+        self.hand_hash ^= self.keys[card.index]
+
+    def clear_hand(self):
+        self.hand.clear()
+        self.hand_mask = 0
+        self.hand_hash = 0
+
     def draw_from_deck(self, deck:Deck, number:int=1)->bool:
         """Draws a specified number of cards from the deck and adds them to the player's hand.
         If the player doesn't draw number cards, due to hand limit or empty deck, returns False."""
@@ -19,17 +64,16 @@ class Player:
                 return False
             card = deck.draw_card()
             if card:
-                self.hand.append(card)
+                self.add_to_hand(card)
                 # print(f"{self.name} has drawn: {card}")
             else:
-                print("No more cards in the deck.")
+                if self.events:
+                    self.events.emit(DeckEmpty(self.name))
                 return False
             
         return True
 
     def show_hand(self, sorting=None)->str:
-        self.hand = sorted(self.hand)
-
         if self.hand:
             return "Hand: " + ", ".join(str(card) for card in self.hand)
         else:
@@ -43,24 +87,44 @@ class Player:
 
     @staticmethod
     def parse_command(command:str)->list[str]:
-        command = command.lower()
-        command = command.replace('hearts', 'h').replace('diamonds', 'd').replace('clubs', 'c').replace('spades', 's')
-        command = command.replace(' ', '').replace(',', '').replace('.', '').replace('of', '')
+        """Splits a text command into card commands like ['10h', 'ac'].
+        Text that isn't a card is kept as a 2 or 3 character chunk so validation can report it."""
+        command = _COMMAND_NOISE.sub('', command.lower())
         cmd_list = []
 
-        while len(command) > 0:
-            if command.startswith('10'):
-                cmd_list.append(command[:3])
-                command = command[3:]
+        position = 0
+        while position < len(command):
+            token = _CARD_TOKEN.match(command, position)
+            if token:
+                cmd_list.append(token[1] + token[2][0])
+                position = token.end()
+            elif command.startswith('10', position):
+                cmd_list.append(command[position:position + 3])
+                position += 3
             else:
-                cmd_list.append(command[:2])
-                command = command[2:]
+                cmd_list.append(command[position:position + 2])
+                position += 2
 
         return cmd_list
 
+    @staticmethod
+    def command_to_indices(command:str)->list[int]:
+        """Parses a text command into card indices.
+        Asserts every part of the command is a card."""
+        indices = []
+        for cmd in Player.parse_command(command):
+            index = Card_Commands.cmd_to_int.get(cmd)
+            assert index is not None, f"Invalid command: {cmd}. Incorrect format or card is unavailable."
+            indices.append(index)
+        return indices
+
     def has_card(self, command):
         """Checks if the player has a card that matches the command."""
-        return any(card.check_card_command(command) for card in self.hand)
+        index = Card_Commands.cmd_to_int.get(command.lower())
+        return index is not None and self.has_card_index(index)
+
+    def has_card_index(self, index:int)->bool:
+        return bool(self.hand_mask >> index & 1)
 
     def valid_cmd_list(self, cmd_list):
         return all(self.has_card(cmd) for cmd in cmd_list)
@@ -74,53 +138,61 @@ class Player:
                    ), f"Invalid command: {missing_cmd}. Incorrect format or card is unavailable."
         return True
 
+    def assert_valid_indices(self, indices:list[int]):
+        """
+        Asserts that every card index is in Player's hand, and no card is used twice.
+        """
+        indices_mask = 0
+        for index in indices:
+            assert self.has_card_index(index) and not indices_mask >> index & 1, (
+                f"Invalid command: {Card_Commands.int_to_cmd[index]}. Incorrect format or card is unavailable.")
+            indices_mask |= 1 << index
+        return True
+
+    @staticmethod
+    def follows_multicard_rules(indices:list[int])->bool:
+        """Checks the attack multicard rules for a list of card indices."""
+        return follows_multicard_rules([Card.VALUE_ORDER[index] for index in indices])
+
+    def validate_attack_indices(self, indices:list[int])->list[int]:
+        """Asserts each card index is in the player's hand.
+        Asserts the cards follow attack multicard rules.
+        """
+        self.assert_valid_indices(indices)
+        assert Player.follows_multicard_rules(indices), (
+            "Invalid command: Multicard rules not followed." + f"{[Card_Commands.int_to_cmd[i] for i in indices]}")
+        return indices
+
+    def validate_defend_indices(self, indices:list[int], incoming_damage:int)->list[int]:
+        """Asserts each card index is in the player's hand.
+        Asserts total value of the cards is greater than incoming_damage.
+        """
+        self.assert_valid_indices(indices)
+        total_value = sum(Card.ATTACK[index] for index in indices)
+        assert total_value >= incoming_damage, (f"{total_value} is not enough to block enemy attack of {incoming_damage}")
+        return indices
+
     def validate_attack_command(self, command:str)->list[str]:
         """Takes a command str and parses it into a list of str.
         Asserts each command is for a card in the player's hand.
         Asserts the command follows attack multicard rules.
         """
-        cmd_list = Player.parse_command(command)
-
-        # check if card(s) are in hand
-        self.assert_valid_cmd_list(cmd_list)
-
-        valid_play = False
-        # 1 card is always valid play
-        if len(cmd_list) == 1:
-            valid_play = True
-        # 2 cards when 1 is ace is always valid
-        elif len(cmd_list) == 2 and any(cmd[0] == 'a' for cmd in cmd_list):
-            valid_play = True
-        # all cards same value
-        elif len(set(cmd[:-1] for cmd in cmd_list)) == 1:
-            # must be 2 to 5, with total value less than 10
-            if cmd_list[0][:-1] in ['2','3','4','5'] and len(cmd_list) * int(cmd_list[0][:-1]) <= 10:
-                valid_play = True
-
-        assert valid_play, ("Invalid command: Multicard rules not followed." + f"{cmd_list}")
-            
-        return cmd_list
+        indices = self.validate_attack_indices(Player.command_to_indices(command))
+        return [Card_Commands.int_to_cmd[index] for index in indices]
 
     def validate_defend_command(self, command:str, incoming_damage:int)->list[str]:
         """Takes a command str and parses it into a list of str.
         Asserts each command is for a card in the player's hand.
         Asserts total value of commands is greater than incoming_damage.
         """
-        cmd_list = Player.parse_command(command)
-
-        # check if card(s) are in hand
-        self.assert_valid_cmd_list(cmd_list)
-
-        total_value = sum(Card.get_cmd_attack(cmd) for cmd in cmd_list)
-        assert total_value >= incoming_damage, (f"{total_value} is not enough to block enemy attack of {incoming_damage}")
-
-        return cmd_list
+        indices = self.validate_defend_indices(Player.command_to_indices(command), incoming_damage)
+        return [Card_Commands.int_to_cmd[index] for index in indices]
 
     def calc_max_defense(self)->int:
         """
         Sums total defense of all cards
         """
-        return sum([card.attack for card in self.hand])
+        return sum(Card.ATTACK[card.index] for card in self.hand)
 
     def can_survive_attack(self, incoming_damage:int)->bool:
         """
@@ -132,13 +204,22 @@ class Player:
     def play_cards(self, commands)->list[Card]:
         """Returns list of cards specified in the commands.
         Removes the cards from the player's hand."""
+        return self.play_card_indices([
+            Card_Commands.cmd_to_int[command.lower()]
+            for command in commands
+        ])
+
+    def play_card_indices(self, indices:list[int])->list[Card]:
+        """Returns list of cards for the card indices held in hand.
+        Removes the cards from the player's hand."""
         cards = []
-        for command in commands:
-            for card in self.hand:
-                if card.check_card_command(command):
-                    cards.append(card)
-                    self.hand.remove(card)
-                    break
+        for index in indices:
+            if self.hand_mask >> index & 1:
+                card = Card.ALL[index]
+                cards.append(card)
+                self.hand.remove(card)
+                self.hand_mask &= ~(1 << index)
+                self.hand_hash ^= self.keys[index]
 
         return cards
     
@@ -146,22 +227,27 @@ class Player:
         """
         Removes and returns all cards from hand.
         """
-        cards = []
-        while len(self.hand) > 0:
-            cards.append(self.hand.pop())
+        cards = self.hand[::-1]
+        self.hand.clear()
+        self.hand_mask = 0
+        self.hand_hash = 0
 
         return cards
     
     def get_hand_int_values(self)->list[int]:
-        self.hand.sort() # always give cards in sorted order
-        int_list = [
-            card.get_int_value()
-            for card in self.hand
-        ]
-        while len(int_list) < self.hand_limit:
-            int_list.append(-1)
+        # hand is always in sorted order
+        int_list = [card.index for card in self.hand]
+        int_list += [-1] * (self.hand_limit - len(int_list))
 
         return int_list
+
+    def hand_positions_to_indices(self, positions:tuple[int, ...])->list[int]:
+        """
+        Turns 0-based positions in the sorted hand into card indices.
+        If a position is past the end of the hand an IndexError will occur
+        """
+        hand = self.hand
+        return [hand[position].index for position in positions]
     
     def icmd_to_command(self, icmd:str)->str:
         """
@@ -171,7 +257,6 @@ class Player:
         if icmd == 'yield':
             return 'yield'
         
-        self.hand.sort() # hand should already be sorted, sorting again just in case
         cmd_list = [
             self.hand[int(index)-1].get_cmd()
             for index in icmd
@@ -180,21 +265,148 @@ class Player:
         command = ''.join(cmd_list)
         return command
 
+class GameSnapshot(NamedTuple):
+    """
+    Immutable copy of all mutable state of a RegicideGame, made by RegicideGame.snapshot().
+    Piles are tuples of the shared Card instances, bottom to top.
+    """
+    deck: tuple[Card, ...]
+    enemies: tuple[Card, ...]
+    discard: tuple[Card, ...]
+    play_area: tuple[Card, ...]
+    hands: tuple[tuple[Card, ...], ...]
+    hand_masks: tuple[int, ...]
+    enemy: Card | None
+    enemy_health: int
+    enemy_attack: int
+    active_player_index: int
+    is_player_turn: bool
+    running: bool
+    game_result: str | None
+    turn_number: int
+
 class RegicideGame:
-    def __init__(self, player_names=['a','b']):
+    def __init__(self, player_names=['a','b'], events:EventBus=None, seed:int=None):
+        """
+        events is the EventBus the game reports to, by default an empty one so the game runs silently.
+        seed gives the game its own random.Random, so the same seed deals and shuffles the same cards
+        for the same moves. Without it the game shuffles with the global random module.
+        """
+        self.events = events if events is not None else EventBus()
+        self.rng = random.Random(seed) if seed is not None else random
         self.turn_number = 1
-        self.deck = Deck(deck_type='Tavern', shuffle=True)
-        self.players = [Player(name=n) for n in player_names]
+        self.deck = Deck(deck_type='Tavern', shuffle=True, rng=self.rng, zone=TAVERN_ZONE)
+        self.players = [
+            Player(name=n, events=self.events, zone=HAND_ZONE + i)
+            for i, n in enumerate(player_names)
+            ]
+        self.active_player_index = 0
+        self.active_player = self.players[self.active_player_index]
+        self.enemies = Deck(deck_type='Castle', rng=self.rng, zone=CASTLE_ZONE)
+        self.discard = Deck(deck_type='Empty', rng=self.rng, zone=DISCARD_ZONE)
+        self.play_area = Deck(deck_type='Empty', rng=self.rng, zone=PLAY_AREA_ZONE)
+        self.is_player_turn = True
+        self.running = True
+        self.game_result = None
+        self.setup_game()
+
+    def seed(self, seed:int=None):
+        """Reseeds the game's random.Random, None goes back to the global random module."""
+        self.rng = random.Random(seed) if seed is not None else random
+        for deck in (self.deck, self.enemies, self.discard, self.play_area):
+            deck.rng = self.rng
+
+    def reset_game(self, seed:int=None):
+        """
+        Starts a new game reusing this game's piles and players.
+        The decks are refilled and shuffled in place, same as creating a new game.
+        With a seed the game is reseeded first, otherwise it keeps its current generator.
+        """
+        if seed is not None:
+            self.seed(seed)
+        self.turn_number = 1
+        self.deck.fill(deck_type='Tavern', shuffle=True)
+        for player in self.players:
+            player.clear_hand()
         self.active_player_index = 0
         self.active_player = self.players[self.active_player_index]
-        self.enemies = Deck(deck_type='Castle')
-        self.discard = Deck(deck_type='Empty')
-        self.play_area = Deck(deck_type='Empty')
+        self.enemies.fill(deck_type='Castle')
+        self.discard.fill(deck_type='Empty')
+        self.play_area.fill(deck_type='Empty')
         self.is_player_turn = True
         self.running = True
         self.game_result = None
         self.setup_game()
 
+    def snapshot(self)->GameSnapshot:
+        """Copies the game position into an immutable GameSnapshot, see restore()."""
+        enemy = self.current_enemy
+        return GameSnapshot(
+            tuple(self.deck.cards),
+            tuple(self.enemies.cards),
+            tuple(self.discard.cards),
+            tuple(self.play_area.cards),
+            tuple(tuple(player.hand) for player in self.players),
+            tuple(player.hand_mask for player in self.players),
+            enemy.card if enemy else None,
+            enemy.health if enemy else 0,
+            enemy.attack if enemy else 0,
+            self.active_player_index,
+            self.is_player_turn,
+            self.running,
+            self.game_result,
+            self.turn_number,
+        )
+
+    def restore(self, snapshot:GameSnapshot):
+        """Puts the game back in the position of snapshot, reusing the existing piles and players."""
+        self.deck.cards[:] = snapshot.deck
+        self.enemies.cards[:] = snapshot.enemies
+        self.discard.cards[:] = snapshot.discard
+        self.play_area.cards[:] = snapshot.play_area
+        for deck in (self.deck, self.enemies, self.discard, self.play_area):
+            deck.rehash()
+        for player, hand, hand_mask in zip(self.players, snapshot.hands, snapshot.hand_masks):
+            player.hand[:] = hand
+            player.hand_mask = hand_mask
+            player.hand_hash = zobrist_hash(hand, player.zone)
+
+        if snapshot.enemy is None:
+            self.current_enemy = None
+        else:
+            if self.current_enemy is None:
+                self.current_enemy = Enemy(snapshot.enemy)
+            enemy = self.current_enemy
+            enemy.card = snapshot.enemy
+            enemy.health = snapshot.enemy_health
+            enemy.attack = snapshot.enemy_attack
+
+        self.active_player_index = snapshot.active_player_index
+        self.active_player = self.players[self.active_player_index]
+        self.is_player_turn = snapshot.is_player_turn
+        self.running = snapshot.running
+        self.game_result = snapshot.game_result
+        self.turn_number = snapshot.turn_number
+
+    def position_hash(self)->int:
+        """
+        Canonical 64 bit Zobrist hash of the game position, see materials.ZOBRIST_KEYS.
+        Piles are hashed as sets, so the same position reached through different move orders hashes the same,
+        and so do positions that only differ in the hidden order of the tavern and castle decks.
+        The pile hashes are kept up to date as cards move, so this is a handful of XORs.
+        """
+        result = self.deck.hash ^ self.enemies.hash ^ self.discard.hash ^ self.play_area.hash
+        for player in self.players:
+            result ^= player.hand_hash
+        enemy = self.current_enemy
+        if enemy:
+            result ^= ZOBRIST_ENEMY[enemy.card.index] ^ ZOBRIST_HEALTH[enemy.health % 64] \
+                ^ ZOBRIST_ATTACK[enemy.attack % 64]
+        result ^= ZOBRIST_PLAYER[self.active_player_index] ^ ZOBRIST_RESULT[self.game_result]
+        if not self.is_player_turn:
+            result ^= ZOBRIST_DEFENDING
+        return result
+
     def setup_game(self):
         """
         Players draw cards until hand limit
@@ -210,24 +422,24 @@ class RegicideGame:
     
     def refill_tavern(self, number):
         """Shuffle discard then add specified number of cards from the discard to the bottom of the tavern deck."""
-        print(f"\nRefilling the tavern with {number} cards.")
-        
         self.discard.shuffle()
         
+        moved = 0
         for _ in range(number):
             if self.discard.cards:
                 card = self.discard.draw_card()
                 self.deck.add_card(card)
+                moved += 1
             else:
-                print("No more cards in the discard pile.")
                 break
 
-        print(f"There are {len(self.discard)} cards in the discard pile.")
-        print(f"There are {len(self.deck)} cards in the tavern deck.")
+        if self.events:
+            self.events.emit(TavernRefilled(number, moved, len(self.discard), len(self.deck)))
         
     def deal_to_players(self, number):
         """Deals a specified number of cards, cycling through the recieving player."""
-        print(f"\nDealing {number} cards to players.")
+        if self.events:
+            self.events.emit(CardsDealt(number))
         
         player_index = self.active_player_index
         for _ in range(number):
@@ -238,45 +450,36 @@ class RegicideGame:
         """Takes a list of cards, deals damage to enemy and applies suit effects."""
         assert self.current_enemy, "No enemy to attack!"
 
-        cards_value = sum(card.get_card_attack() for card in cards)
+        cards_value = sum(Card.ATTACK[card.index] for card in cards)
+        card_suits = {Card.SUIT[card.index] for card in cards}
+        enemy_suit = Card.SUIT[self.current_enemy.card.index]
 
         # apply suit effect clubs
-        double_damage = (
-            self.current_enemy.suit != 'Clubs' and
-            any(card.suit == 'Clubs' for card in cards)
-        )
+        double_damage = enemy_suit != CLUBS and CLUBS in card_suits
         # assign damage
         total_damage = cards_value * (2 if double_damage else 1)
-        print(f"\nYou played {', '.join(str(card) for card in cards)} for {total_damage} damage.")
+        if self.events:
+            self.events.emit(CardsPlayed(self.active_player.name, tuple(cards), total_damage))
         
         self.current_enemy.health -= total_damage
 
         # apply suit effect spades
-        reduce_attack = (
-            self.current_enemy.suit != 'Spades' and
-            any(card.suit == 'Spades' for card in cards)
-        )
+        reduce_attack = enemy_suit != SPADES and SPADES in card_suits
         if reduce_attack:
             self.current_enemy.attack -= cards_value
             self.current_enemy.attack = 0 if self.current_enemy.attack < 0 else self.current_enemy.attack
-            print(f"Enemy attack has been reduced by {cards_value}." )
-            print(f"Enemy attack: {self.current_enemy.attack}")
+            if self.events:
+                self.events.emit(EnemyAttackReduced(cards_value, self.current_enemy.attack))
             
         
         # apply suit effect hearts
         # important to apply hearts before diamonds
-        refill_tavern = (
-            self.current_enemy.suit != 'Hearts' and
-            any(card.suit == 'Hearts' for card in cards)
-        )
+        refill_tavern = enemy_suit != HEARTS and HEARTS in card_suits
         if refill_tavern:
             self.refill_tavern(cards_value)
         
         # apply suit effect diamonds
-        draw_cards = (
-            self.current_enemy.suit != 'Diamonds' and
-            any(card.suit == 'Diamonds' for card in cards)
-        )
+        draw_cards = enemy_suit != DIAMONDS and DIAMONDS in card_suits
         if draw_cards:
             self.deal_to_players(cards_value)
 
@@ -297,6 +500,18 @@ class RegicideGame:
         print(f"There are {len(self.enemies)} cards in the Castle deck.")
 
     def play_game(self):
+        """Plays an interactive game in the terminal.
+        Game events are printed by a TextRenderer, subscribed for this game if there isn't one already."""
+        renderer = None
+        if not any(isinstance(subscriber, TextRenderer) for subscriber in self.events):
+            renderer = self.events.subscribe(TextRenderer())
+        try:
+            self._play_game()
+        finally:
+            if renderer:
+                self.events.unsubscribe(renderer)
+
+    def _play_game(self):
         while self.running:
             self.print_game_state()
             self.player_turn()
@@ -387,19 +602,20 @@ class RegicideGame:
         If so, it returns True to allow the player to play again.
         If not, it returns False to end the player's turn."""
         if self.current_enemy.health <= 0:
-            print(f"You defeated {self.current_enemy}!")
+            exact = self.current_enemy.health == 0
+            if self.events:
+                self.events.emit(EnemyDefeated(self.current_enemy.card, exact))
 
-            if self.current_enemy.health == 0:
-                print("Exact damage! Defeated Enemy added to the top of Tavern Deck")
-                self.deck.add_card_on_top(self.current_enemy)
+            if exact:
+                self.deck.add_card_on_top(self.current_enemy.card)
             else:
-                print("Defeated enemy will go to the discard pile!")
-                self.discard.add_card(self.current_enemy)
+                self.discard.add_card(self.current_enemy.card)
 
             self.next_enemy()
             return True
         else:
-            print(f"{self.current_enemy} has {self.current_enemy.health} health remaining.")
+            if self.events:
+                self.events.emit(EnemyDamaged(self.current_enemy.card, self.current_enemy.health))
             return False
 
     def next_enemy(self):
@@ -410,10 +626,12 @@ class RegicideGame:
             while card := self.play_area.draw_card():
                 # print(f'moving {card} from play area to discard')
                 self.discard.add_card(card)
-            self.current_enemy = self.enemies.draw_card()
-            print(f"\nNew enemy: {self.current_enemy} \n(Health: {self.current_enemy.health})\n(Attack: {self.current_enemy.attack})")
+            self.current_enemy = Enemy(self.enemies.draw_card())
+            if self.events:
+                self.events.emit(NewEnemy(self.current_enemy.card, self.current_enemy.health, self.current_enemy.attack))
         else:
-            print("Congratulations! You've defeated all enemies!")
+            if self.events:
+                self.events.emit(AllEnemiesDefeated())
             self.running = False
             self.game_result = 'Win'
             self.current_enemy = None
@@ -428,5 +646,5 @@ class RegicideGame:
 
 
 if __name__ == "__main__":
-    game = RegicideGame(player_names=['Alice','Bob'])
+    game = RegicideGame(player_names=['Alice','Bob'], events=EventBus([TextRenderer()]))
     game.play_game()
\ No newline at end of file
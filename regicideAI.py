@@ -1,9 +1,114 @@
 import itertools
+from functools import lru_cache
+from operator import attrgetter
+from typing import NamedTuple
+import numpy as np
 from materials import Card, Deck, Card_Commands
-from regicide import RegicideGame
+from regicide import RegicideGame, GameSnapshot, Player, follows_multicard_rules
+from events import EventBus, AutoYield, AutoLastCardAttack, AutoDefend, OutOfCards
+from defense import DefensePreference, DEFAULT_PREFERENCE, ranked_defenses
 from enum import Enum
 
 
+@lru_cache(maxsize=None)
+def action_positions(hand_limit:int)->tuple[tuple[int, ...] | None, ...]:
+    """
+    0-based hand positions for each action, None for 'yield'.
+    Same order as RegicideGame_AI.int_to_icmd
+    """
+    all_positions = [None]
+    for k in range(1, hand_limit + 1):
+        all_positions += itertools.combinations(range(hand_limit), k)
+    return tuple(all_positions)
+
+@lru_cache(maxsize=None)
+def action_commands(hand_limit:int)->tuple[tuple[str, ...], dict[str, int]]:
+    """
+    int_to_icmd and icmd_to_int tables for hand_limit, computed once and shared by every env.
+    An icmd is 'yield' or the 1-based positions of the played cards in the sorted hand, like '135'.
+    The returned dict is shared, don't modify it.
+    """
+    int_to_icmd = tuple(
+        'yield' if positions is None else ''.join(str(position + 1) for position in positions)
+        for positions in action_positions(hand_limit)
+    )
+    icmd_to_int = {
+        icmd:i
+        for i, icmd in enumerate(int_to_icmd)
+    }
+    return int_to_icmd, icmd_to_int
+
+@lru_cache(maxsize=None)
+def positions_mask_to_action(hand_limit:int)->dict[int, int]:
+    """Action int for each bitmask of hand positions. The returned dict is shared, don't modify it."""
+    return {
+        sum(1 << position for position in positions): action
+        for action, positions in enumerate(action_positions(hand_limit))
+        if positions is not None
+    }
+
+@lru_cache(maxsize=1 << 16)
+def attack_action_mask(hand_limit:int, hand_values:tuple[int, ...])->tuple[bool, ...]:
+    """
+    Legal attack actions for a sorted hand, keyed by the value (A=1 ... K=13) of each held card.
+    'yield' is never legal for the agent.
+    """
+    hand_size = len(hand_values)
+    return tuple(
+        positions is not None and positions[-1] < hand_size and
+        follows_multicard_rules([hand_values[position] for position in positions])
+        for positions in action_positions(hand_limit)
+    )
+
+@lru_cache(maxsize=1 << 16)
+def defend_action_totals(hand_limit:int, hand_attacks:tuple[int, ...])->tuple[int, ...]:
+    """
+    Total defense of each action for a sorted hand, keyed by the attack value of each held card.
+    Actions using a card past the end of the hand, and 'yield', have a total of -1.
+    """
+    hand_size = len(hand_attacks)
+    return tuple(
+        sum(hand_attacks[position] for position in positions)
+        if positions is not None and positions[-1] < hand_size else -1
+        for positions in action_positions(hand_limit)
+    )
+
+@lru_cache(maxsize=1 << 16)
+def defend_action_mask(hand_limit:int, hand_attacks:tuple[int, ...], incoming_damage:int)->tuple[bool, ...]:
+    """Legal defend actions, every action whose cards add up to at least incoming_damage."""
+    return tuple(
+        total >= 0 and total >= incoming_damage
+        for total in defend_action_totals(hand_limit, hand_attacks)
+    )
+
+@lru_cache(maxsize=1 << 16)
+def attack_actions(hand_limit:int, hand_values:tuple[int, ...])->tuple[int, ...]:
+    """Legal attack action ints, the True entries of attack_action_mask."""
+    return tuple(i for i, legal in enumerate(attack_action_mask(hand_limit, hand_values)) if legal)
+
+@lru_cache(maxsize=1 << 16)
+def defend_actions(hand_limit:int, hand_attacks:tuple[int, ...], incoming_damage:int)->tuple[int, ...]:
+    """Legal defend action ints, the True entries of defend_action_mask."""
+    return tuple(i for i, legal in enumerate(defend_action_mask(hand_limit, hand_attacks, incoming_damage)) if legal)
+
+
+# planes of the optional card encoding, 52 one-hot entries each, see RegicideGame_AI(card_planes=True)
+CARD_PLANES = ('hand', 'discard', 'defeated')
+# BYTE_BITS[b] holds the 8 bits of byte b lowest first, it turns a card bitmask into a plane without a loop over cards
+BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder='little')
+# plane with the J, Q and K of every suit set
+ROYAL_PLANE = np.array([Card.VALUE_NAMES[index % 13] in ('J', 'Q', 'K') for index in range(52)], dtype=np.int16)
+card_index = attrgetter('index')
+
+def card_indices(cards:list[Card])->np.ndarray:
+    return np.fromiter(map(card_index, cards), dtype=np.intp, count=len(cards))
+
+
+class AIGameSnapshot(NamedTuple):
+    """RegicideGame_AI position, the GameSnapshot plus the step counters."""
+    game: GameSnapshot
+    steps_taken: int
+    invalid_steps_taken: int
 
 class PlayerAgent:
     def __init__(self):
@@ -12,31 +117,31 @@ class PlayerAgent:
 class RegicideGame_AI(RegicideGame):
 
 
-    def __init__(self, player_names=['ai_a','ai_b']):
+    def __init__(self, player_names=['ai_a','ai_b'], events:EventBus=None, seed:int=None, card_planes:bool=False):
+        """card_planes adds the CARD_PLANES one-hot planes to the observation, see observe()."""
         self.player_names = player_names
         self.action_space = len(Card_Commands.int_to_cmd)
-        super().__init__(player_names)
+        super().__init__(player_names, events, seed)
         self.build_action_space()
         self.steps_taken = 0
         self.invalid_steps_taken = 0
+        # snapshots taken by apply(), popped by undo()
+        self.move_stack: list[AIGameSnapshot] = []
+
+        self.card_planes = card_planes
+        self.hand_offset = 8 + len(self.players)
+        self.planes_offset = self.hand_offset + self.active_player.hand_limit
+        self.hand_padding = (-1,) * self.active_player.hand_limit
+        self.observation = np.zeros(self.planes_offset + (len(CARD_PLANES) * 52 if card_planes else 0), dtype=np.int16)
+        # set by every change of the game position, observe() only refills self.observation when it's set
+        self.observation_dirty = True
 
     def build_action_space(self):
-        num_str = ''.join(
-            map(str,list(range(1,self.active_player.hand_limit + 1)))
-            )
-        all_actions = []
-        all_actions.append('yield')
-        for k in range(1,len(num_str)+1):
-            comb = itertools.combinations(num_str, k)
-            for c in comb:
-                all_actions.append( ''.join(c))
-
-        self.int_to_icmd = all_actions
-        self.icmd_to_int = {
-            icmd:i
-            for i, icmd in enumerate(self.int_to_icmd)
-        }
-        self.action_space = len(all_actions)
+        """Uses the action tables shared by every env with the same hand limit."""
+        hand_limit = self.active_player.hand_limit
+        self.int_to_icmd, self.icmd_to_int = action_commands(hand_limit)
+        self.int_to_positions = action_positions(hand_limit)
+        self.action_space = len(self.int_to_icmd)
 
     def check_auto_attack(self)->bool:
         """
@@ -47,13 +152,15 @@ class RegicideGame_AI(RegicideGame):
             return False
         
         if len(self.active_player.hand) == 0:
-            print('Auto yield')
+            if self.events:
+                self.events.emit(AutoYield(self.active_player.name))
             self.is_player_turn = False
             return True
         # if active player only has 1 card and no other players have cards, play final card
         elif self.active_player.count_cards_in_hand() == 1 and \
             sum([player.count_cards_in_hand() for player in self.players]) == 1:
-            print('Attack with last card')
+            if self.events:
+                self.events.emit(AutoLastCardAttack(self.active_player.name))
             # play last card
             played_cards = self.active_player.play_all_cards()
             self.play_area.add_card(played_cards)
@@ -68,21 +175,27 @@ class RegicideGame_AI(RegicideGame):
         """
         If enemy turn, checks for 0 attack, checks if attack can be survived, then checks if a player must spend all of their cards to defend.
         Calling self.check_full_defend() sets self.running = False if can't be survived
+        Returns True if the defense was made automatically
         """
         if self.is_player_turn:
-            return None
+            return False
         
         if self.current_enemy.attack <= 0:
-            print('Auto defend no attack')
+            if self.events:
+                self.events.emit(AutoDefend(self.active_player.name, False))
             self.is_player_turn = True
             self.next_player()
+            return True
         elif self.check_full_defend():
             if len(self.active_player.hand) == 1 or \
             self.active_player.calc_max_defense() == self.current_enemy.attack:
-                print('Auto defend all card(s)')
+                if self.events:
+                    self.events.emit(AutoDefend(self.active_player.name, True))
                 self.active_player.play_all_cards()
                 self.is_player_turn = True
                 self.next_player()
+                return True
+        return False
             
 
     def check_full_defend(self):
@@ -100,35 +213,148 @@ class RegicideGame_AI(RegicideGame):
         """
         If no players have any cards, self.running = False and self.game_result = "Lose".
         This is important to check if enemy attack is 0 but all players are out of cards.
+        A game that has already been won stays won.
         """
-        if sum([len(p.hand) for p in self.players]) == 0:
-            print('All players have run out of cards')
+        if self.running and sum([len(p.hand) for p in self.players]) == 0:
+            if self.events:
+                self.events.emit(OutOfCards())
             self.running = False
             self.game_result = "Lose"
 
 
-    def get_state(self):
+    def legal_action_mask(self)->tuple[bool, ...]:
         """
-        get game state as a list of ints
+        Boolean for each action in self.int_to_icmd, True if step() would accept it.
+        Attack turns follow the multicard rules, defend turns must block the enemy attack.
         """
-        game_state = [
+        player = self.active_player
+        if not self.running:
+            return (False,) * self.action_space
+        if self.is_player_turn:
+            return attack_action_mask(
+                player.hand_limit, tuple(Card.VALUE_ORDER[card.index] for card in player.hand)
+                )
+        return defend_action_mask(
+            player.hand_limit, tuple(Card.ATTACK[card.index] for card in player.hand),
+            self.current_enemy.attack
+            )
+
+    def legal_actions(self)->tuple[int, ...]:
+        """Action ints step() would accept, same as the True entries of legal_action_mask()."""
+        player = self.active_player
+        if not self.running:
+            return ()
+        if self.is_player_turn:
+            return attack_actions(
+                player.hand_limit, tuple(Card.VALUE_ORDER[card.index] for card in player.hand)
+                )
+        return defend_actions(
+            player.hand_limit, tuple(Card.ATTACK[card.index] for card in player.hand),
+            self.current_enemy.attack
+            )
+
+    def defense_actions(self, preference:DefensePreference=DEFAULT_PREFERENCE)->tuple[int, ...]:
+        """
+        Action ints of the minimal discards that block the current enemy attack, best first by preference.
+        Only meaningful on the enemy's turn, see defense.ranked_defenses.
+        """
+        player = self.active_player
+        to_action = positions_mask_to_action(player.hand_limit)
+        return tuple(
+            to_action[mask]
+            for mask in ranked_defenses(
+                tuple(card.index for card in player.hand), self.current_enemy.attack, preference
+                )
+        )
+
+    def best_defense_action(self, preference:DefensePreference=DEFAULT_PREFERENCE)->int:
+        """Action int of the best minimal discard, see defense_actions()."""
+        return self.defense_actions(preference)[0]
+
+    def candidate_action_mask(self)->tuple[bool, ...]:
+        """
+        legal_action_mask() with defend turns reduced to the minimal discards.
+        A discard with a card that could be kept is never better, so the agent can skip those.
+        """
+        if not self.running or self.is_player_turn:
+            return self.legal_action_mask()
+        candidates = set(self.defense_actions())
+        return tuple(action in candidates for action in range(self.action_space))
+
+    def observe(self)->np.ndarray:
+        """
+        The game state in self.observation, an int16 array that is filled in place and never reallocated,
+        so torch.from_numpy(env.observation) is a view that shares it. Copy it to keep a state past the next step.
+        Layout: tavern deck size, discard size, castle size, enemy card, health and attack, is_player_turn,
+        active player, each player's hand size and the active player's sorted hand padded with -1.
+        With card_planes, the CARD_PLANES follow: the active player's hand, the discard and the defeated enemies.
+        Once every enemy is defeated the enemy is reported as -1 with 0 health and attack.
+        Unchanged positions, like after an invalid action, return the buffer as it is.
+        """
+        observation = self.observation
+        if not self.observation_dirty:
+            return observation
+        enemy = self.current_enemy
+        hand = self.active_player.hand
+        # one slice assignment, numpy's per element writes cost more than building the values
+        observation[:self.planes_offset] = (
             len(self.deck),
             len(self.discard),
             len(self.enemies),
-            self.current_enemy.get_int_value(),
-            self.current_enemy.health,
-            self.current_enemy.attack,
+            *((enemy.card.index, enemy.health, enemy.attack) if enemy else (-1, 0, 0)),
             self.is_player_turn,
             self.active_player_index,
-            ]
-        game_state += [player.count_cards_in_hand() for player in self.players]
-        game_state += self.active_player.get_hand_int_values()
-        game_state = list(map(int, game_state))
-        return game_state
-
-    def reset(self):
-        self.__init__(self.player_names)
+            *[len(player.hand) for player in self.players],
+            *map(card_index, hand),
+            *self.hand_padding[len(hand):],
+        )
+
+        if self.card_planes:
+            hand_plane, discard_plane, defeated_plane = observation[self.planes_offset:].reshape(len(CARD_PLANES), 52)
+            hand_mask = self.active_player.hand_mask.to_bytes(7, 'little')
+            hand_plane[:] = BYTE_BITS[np.frombuffer(hand_mask, dtype=np.uint8)].reshape(-1)[:52]
+            discard_plane[:] = 0
+            discard_plane[card_indices(self.discard.cards)] = 1
+            defeated_plane[:] = ROYAL_PLANE
+            defeated_plane[card_indices(self.enemies.cards)] = 0
+            if enemy:
+                defeated_plane[enemy.card.index] = 0
+        self.observation_dirty = False
+        return observation
+
+    def get_state(self)->list[int]:
+        """observe() as a list of ints."""
+        return self.observe().tolist()
+
+    def reset(self, seed:int=None):
+        """Starts a new game in place, reusing the piles, players and action tables. See reset_game() for seed."""
+        self.reset_game(seed)
+        self.observation_dirty = True
+        self.steps_taken = 0
+        self.invalid_steps_taken = 0
+        self.move_stack.clear()
         return self.get_state(), 'Info'
+
+    def snapshot(self)->AIGameSnapshot:
+        return AIGameSnapshot(super().snapshot(), self.steps_taken, self.invalid_steps_taken)
+
+    def restore(self, snapshot:AIGameSnapshot):
+        super().restore(snapshot.game)
+        self.observation_dirty = True
+        self.steps_taken = snapshot.steps_taken
+        self.invalid_steps_taken = snapshot.invalid_steps_taken
+
+    def apply(self, action_int:int):
+        """
+        step() that can be taken back with undo(), for lookahead.
+        The position before the step is pushed on self.move_stack.
+        """
+        self.move_stack.append(self.snapshot())
+        return self.step(action_int)
+
+    def undo(self):
+        """Takes back the last apply()."""
+        self.restore(self.move_stack.pop())
     
     def step(self, action_int:int):
         self.steps_taken += 1
@@ -136,9 +362,10 @@ class RegicideGame_AI(RegicideGame):
         reward = 0
         invalid_a = False
 
-        icmd = self.int_to_icmd[action_int]
+        positions = self.int_to_positions[action_int]
         try:
-            command = self.active_player.icmd_to_command(icmd)
+            # yield is never a valid action for the agent, it's rejected like a broken multicard play
+            indices = self.active_player.hand_positions_to_indices(positions) if positions else None
         except IndexError as e:
             # trying to play a card that doesn't exist
             self.invalid_steps_taken += 1
@@ -149,54 +376,44 @@ class RegicideGame_AI(RegicideGame):
 
         # player attacks
         if self.is_player_turn:
-            if command.startswith('yeild'):
-                print('yield command.')
+            if indices and Player.follows_multicard_rules(indices):
+                played_cards = self.active_player.play_card_indices(indices)
+                self.play_area.add_card(played_cards)
+                self.attack_enemy(played_cards)
+                reward = self.active_player.calc_max_defense() # larger reward for keeping larger cards
                 self.is_player_turn = False
-                exit()
+                if self.check_enemy_defeated():
+                    reward += 50
+                    self.is_player_turn = True
             else:
-                try:
-                    cmd_list = self.active_player.validate_attack_command(command) # this line will raise an AssertionError if the command is invalid.
-                    played_cards = self.active_player.play_cards(cmd_list)
-                    self.play_area.add_card(played_cards)
-                    self.attack_enemy(played_cards)
-                    reward = self.active_player.calc_max_defense() # larger reward for keeping larger cards
-                    self.is_player_turn = False
-                    if self.check_enemy_defeated():
-                        reward += 50
-                        self.is_player_turn = True
-                except AssertionError as e:
-                    # return reward of -10 because command was invalid
-                    self.invalid_steps_taken += 1
-                    reward = -10
-                    invalid_a = True
+                # return reward of -10 because command was invalid
+                self.invalid_steps_taken += 1
+                reward = -10
+                invalid_a = True
             
         # player defends
         else:
-            try:
-                cmd_list = self.active_player.validate_defend_command(
-                    command, self.current_enemy.attack
-                    )
-                played_cards = self.active_player.play_cards(cmd_list)
+            if indices and sum(Card.ATTACK[index] for index in indices) >= self.current_enemy.attack:
+                played_cards = self.active_player.play_card_indices(indices)
                 self.discard.add_card(played_cards)
                 self.next_player()
                 self.is_player_turn = True
                 reward = self.active_player.calc_max_defense() # larger reward for keeping larger cards
-            except AssertionError as e:
+            else:
                 # return reward of -10 because command was invalid
                 self.invalid_steps_taken += 1
                 reward = -10
                 invalid_a = True
 
+        # an invalid action leaves the position as it was, the observation stays valid
+        if not invalid_a:
+            self.observation_dirty = True
         # make any forced moved (like player without cards needing to yield)
         self.check_no_cards()
-        # cycles past any players without cards, checking if they can survive and attack
-        while self.running and self.check_auto_attack():
-            self.check_auto_defend()
+        # cycles past any players without cards and forced defenses, until a real decision is needed
+        while self.running and (self.check_auto_attack() or self.check_auto_defend()):
             self.check_no_cards()
-        # one last check of auto defend
-        if self.running:
-            self.check_auto_defend()
-            
+
         # double check for soft lock
         self.check_no_cards()
 
@@ -0,0 +1,249 @@
+from typing import NamedTuple
+
+import numpy as np
+import torch
+
+
+class Batch(NamedTuple):
+    """Sampled transitions, one row per transition."""
+    states: torch.Tensor       # (batch, n_observations) float32
+    actions: torch.Tensor      # (batch, 1) int64, ready for gather
+    rewards: torch.Tensor      # (batch,) float32
+    next_states: torch.Tensor  # (batch, n_observations) float32
+    dones: torch.Tensor        # (batch,) bool, next_states is meaningless where True
+    next_masks: torch.Tensor   # (batch, n_actions) bool, legal actions of next_states
+    indices: torch.Tensor      # (batch,) int64, buffer slots of the transitions
+    weights: torch.Tensor|None = None  # (batch,) float32 importance sampling weights, prioritized replay only
+
+
+class ReplayBuffer:
+    """
+    Fixed capacity ring buffer of transitions, stored in preallocated tensors.
+    States are int16 (every RegicideGame_AI.get_state() value fits), legal action masks are packed 8 per byte.
+    Once full, new transitions overwrite the oldest ones.
+    sample() gathers a whole batch with index tensors, no Python loop over transitions.
+    """
+
+    def __init__(self, capacity:int, n_observations:int, n_actions:int, device='cpu',
+                 state_dtype:torch.dtype=torch.int16):
+        self.capacity = capacity
+        self.n_actions = n_actions
+        self.device = torch.device(device)
+        self.mask_bytes = -(-n_actions // 8)
+        self.states = torch.zeros((capacity, n_observations), dtype=state_dtype, device=device)
+        self.next_states = torch.zeros((capacity, n_observations), dtype=state_dtype, device=device)
+        self.actions = torch.zeros(capacity, dtype=torch.int16, device=device)
+        self.rewards = torch.zeros(capacity, dtype=torch.float32, device=device)
+        self.dones = torch.zeros(capacity, dtype=torch.bool, device=device)
+        self.next_masks = torch.zeros((capacity, self.mask_bytes), dtype=torch.uint8, device=device)
+        self.bit_values = torch.tensor([1 << bit for bit in range(8)], dtype=torch.uint8, device=device)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def pack_masks(self, masks:torch.Tensor)->torch.Tensor:
+        """(n, n_actions) bool to (n, mask_bytes) uint8."""
+        padded = torch.zeros((len(masks), self.mask_bytes * 8), dtype=torch.uint8, device=self.device)
+        padded[:, :self.n_actions] = masks
+        return (padded.view(-1, self.mask_bytes, 8) * self.bit_values).sum(dim=2, dtype=torch.uint8)
+
+    def unpack_masks(self, packed:torch.Tensor)->torch.Tensor:
+        """(n, mask_bytes) uint8 to (n, n_actions) bool."""
+        bits = (packed.unsqueeze(2) & self.bit_values) != 0
+        return bits.view(len(packed), -1)[:, :self.n_actions]
+
+    def push(self, state, action, next_state, reward, next_mask=None):
+        """
+        Save a transition. next_state and next_mask are None when the episode ended.
+        Tensors of any shape with the right number of elements are accepted, like the (1, n) ones model.py uses.
+        """
+        self.write(self.position, state, action, next_state, reward, next_mask)
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def write(self, slot:int, state, action, next_state, reward, next_mask=None):
+        """Stores a transition in slot, without moving position or size."""
+        self.states[slot] = torch.as_tensor(state, device=self.device).view(-1)
+        self.actions[slot] = int(action)
+        self.rewards[slot] = float(reward)
+        self.dones[slot] = next_state is None
+        if next_state is None:
+            self.next_states[slot] = 0
+            self.next_masks[slot] = 0
+        else:
+            self.next_states[slot] = torch.as_tensor(next_state, device=self.device).view(-1)
+            self.next_masks[slot] = self.pack_masks(torch.as_tensor(next_mask, device=self.device).view(1, -1))[0]
+
+    def push_batch(self, states, actions, next_states, rewards, dones, next_masks):
+        """Save a batch of transitions, for example one step of a VectorRegicideEnv. Returns the slots used."""
+        n = len(actions)
+        slots = (self.position + torch.arange(n, device=self.device)) % self.capacity
+        self.states[slots] = torch.as_tensor(states, device=self.device).to(self.states.dtype)
+        self.actions[slots] = torch.as_tensor(actions, device=self.device).to(torch.int16)
+        self.rewards[slots] = torch.as_tensor(rewards, device=self.device, dtype=torch.float32)
+        self.dones[slots] = torch.as_tensor(dones, device=self.device)
+        self.next_states[slots] = torch.as_tensor(next_states, device=self.device).to(self.states.dtype)
+        self.next_masks[slots] = self.pack_masks(torch.as_tensor(next_masks, device=self.device))
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return slots
+
+    def state_dict(self)->dict:
+        """Copy of the filled slots and the ring position, for checkpoints."""
+        filled = slice(0, self.size)
+        return {
+            'position': self.position,
+            'size': self.size,
+            'states': self.states[filled].cpu().clone(),
+            'next_states': self.next_states[filled].cpu().clone(),
+            'actions': self.actions[filled].cpu().clone(),
+            'rewards': self.rewards[filled].cpu().clone(),
+            'dones': self.dones[filled].cpu().clone(),
+            'next_masks': self.next_masks[filled].cpu().clone(),
+        }
+
+    def load_state_dict(self, state:dict):
+        assert state['size'] <= self.capacity, 'replay checkpoint is larger than the buffer'
+        self.position = state['position'] % self.capacity
+        self.size = state['size']
+        filled = slice(0, self.size)
+        for name in ('states', 'next_states', 'actions', 'rewards', 'dones', 'next_masks'):
+            getattr(self, name)[filled] = state[name].to(self.device)
+
+    def share_memory(self):
+        """Moves the storage to shared memory, so processes the buffer is passed to write into the same tensors."""
+        for tensor in (self.states, self.next_states, self.actions, self.rewards, self.dones, self.next_masks):
+            tensor.share_memory_()
+        return self
+
+    def gather(self, indices:torch.Tensor)->Batch:
+        return Batch(
+            self.states[indices].float(),
+            self.actions[indices].long().unsqueeze(1),
+            self.rewards[indices],
+            self.next_states[indices].float(),
+            self.dones[indices],
+            self.unpack_masks(self.next_masks[indices]),
+            indices,
+        )
+
+    def sample(self, batch_size:int)->Batch:
+        """Uniform sample of batch_size transitions, with replacement."""
+        indices = torch.randint(0, self.size, (batch_size,), device=self.device)
+        return self.gather(indices)
+
+
+class SumTree:
+    """
+    Array backed binary tree where every node holds the sum of its two children.
+    tree[1] is the root, the leaves are tree[leaves:leaves + capacity], a leaf's parent is its index // 2.
+    update() and find() work on whole arrays of leaves, one numpy operation per tree level.
+    """
+
+    def __init__(self, capacity:int):
+        self.leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self)->float:
+        return self.tree[1]
+
+    def get(self, indices)->np.ndarray:
+        return self.tree[np.asarray(indices) + self.leaves]
+
+    def update(self, indices, priorities):
+        """Sets the leaves at indices to priorities and recomputes their ancestors."""
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaves
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values:np.ndarray)->np.ndarray:
+        """
+        Index of the leaf each value (between 0 and total()) falls in, walking down from the root.
+        Never descends into an empty subtree, so rounding can't pick a zero priority leaf.
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.tree[left]
+            go_right = (values >= left_sums) & (self.tree[left + 1] > 0)
+            values -= left_sums * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    ReplayBuffer sampling transitions in proportion to priority ** alpha, priority being |TD error| + epsilon.
+    New transitions get the highest priority seen so far, so each is replayed at least about once.
+    sample() is stratified, the batch splits the priority total into batch_size equal ranges and draws one
+    transition from each. Its Batch carries importance sampling weights, (size * P(i)) ** -beta scaled so the
+    batch maximum is 1, with beta annealed from beta_start to 1 over beta_steps samples.
+    After the loss, give the new TD errors back with update_priorities(batch.indices, td_errors).
+    """
+
+    def __init__(self, capacity:int, n_observations:int, n_actions:int, device='cpu',
+                 state_dtype:torch.dtype=torch.int16, alpha:float=0.6, beta_start:float=0.4,
+                 beta_steps:int=100_000, epsilon:float=1e-3):
+        super().__init__(capacity, n_observations, n_actions, device, state_dtype)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta_start = beta_start
+        self.beta_steps = beta_steps
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.samples_taken = 0
+        self.rng = np.random.default_rng()
+
+    @property
+    def beta(self)->float:
+        return self.beta_start + (1 - self.beta_start) * min(1.0, self.samples_taken / self.beta_steps)
+
+    def push(self, state, action, next_state, reward, next_mask=None):
+        slot = self.position
+        super().push(state, action, next_state, reward, next_mask)
+        self.tree.update([slot], self.max_priority ** self.alpha)
+
+    def push_batch(self, states, actions, next_states, rewards, dones, next_masks):
+        slots = super().push_batch(states, actions, next_states, rewards, dones, next_masks)
+        self.tree.update(slots.cpu().numpy(), self.max_priority ** self.alpha)
+        return slots
+
+    def sample(self, batch_size:int)->Batch:
+        total = self.tree.total()
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        slots = np.minimum(self.tree.find(values), self.size - 1)
+
+        probabilities = self.tree.get(slots) / total
+        weights = (self.size * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.samples_taken += 1
+
+        batch = self.gather(torch.from_numpy(slots).to(self.device))
+        return batch._replace(weights=torch.as_tensor(weights, dtype=torch.float32, device=self.device))
+
+    def state_dict(self)->dict:
+        state = super().state_dict()
+        state['priorities'] = torch.from_numpy(self.tree.get(np.arange(self.size)))
+        state['max_priority'] = float(self.max_priority)
+        state['samples_taken'] = self.samples_taken
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def load_state_dict(self, state:dict):
+        super().load_state_dict(state)
+        self.tree = SumTree(self.capacity)
+        self.tree.update(np.arange(self.size), state['priorities'].numpy())
+        self.max_priority = state['max_priority']
+        self.samples_taken = state['samples_taken']
+        self.rng.bit_generator.state = state['rng']
+
+    def update_priorities(self, indices:torch.Tensor, td_errors:torch.Tensor):
+        priorities = td_errors.detach().abs().cpu().double().numpy() + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices.cpu().numpy(), priorities ** self.alpha)
@@ -0,0 +1,101 @@
+import os
+import sys
+
+import numpy as np
+
+# file layout: MAGIC, then one RESULT_DTYPE row per episode
+MAGIC = b'RRL1'
+# column names match the old final scores CSV, Result is RESULT_CODES of env.game_result
+RESULT_DTYPE = np.dtype([
+    ('Result', 'i1'),
+    ('Castle_size', 'u1'),
+    ('Steps', 'u4'),
+    ('Invalid_steps', 'u4'),
+    ('Wall_time', 'f4'),
+])
+# None is an episode abandoned at CYCLE_LIMIT
+RESULT_CODES = {'Win': 1, 'Lose': -1, None: 0}
+FLUSH_EVERY = 1024
+
+
+def row_count(path:str)->int:
+    """Complete rows in the file at path, a row cut short by a crash isn't counted."""
+    return (os.path.getsize(path) - len(MAGIC)) // RESULT_DTYPE.itemsize
+
+
+class ResultsWriter:
+    """
+    Appends episode results to a fixed width binary file.
+    Rows are buffered in a preallocated array and written every flush_every episodes and on flush()/close().
+    rows keeps only the first rows of an existing file, so a run resumed from a checkpoint can drop the
+    episodes it is about to play again.
+    """
+
+    def __init__(self, path:str, flush_every:int=FLUSH_EVERY, rows:int=None):
+        self.path = path
+        self.buffer = np.zeros(flush_every, dtype=RESULT_DTYPE)
+        self.buffered = 0
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as file:
+                file.write(MAGIC)
+        with open(path, 'rb') as file:
+            assert file.read(len(MAGIC)) == MAGIC, f'{path} is not a results log'
+        self.flushed = row_count(path)
+        if rows is not None:
+            self.flushed = min(self.flushed, rows)
+        # drops rows past self.flushed, including a partly written last row
+        os.truncate(path, len(MAGIC) + self.flushed * RESULT_DTYPE.itemsize)
+
+    def __len__(self):
+        return self.flushed + self.buffered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, game_result:str|None, castle_size:int, steps:int, invalid_steps:int, wall_time:float=np.nan):
+        self.buffer[self.buffered] = (RESULT_CODES[game_result], castle_size, steps, invalid_steps, wall_time)
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        with open(self.path, 'ab') as file:
+            file.write(self.buffer[:self.buffered].tobytes())
+        self.flushed += self.buffered
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_results(path:str)->np.ndarray:
+    """Memory mapped RESULT_DTYPE rows of the log at path, read only. Columns by name, e.g. results['Steps']."""
+    rows = row_count(path)
+    if rows <= 0:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    return np.memmap(path, dtype=RESULT_DTYPE, mode='r', offset=len(MAGIC), shape=(rows,))
+
+def results_dataframe(path:str):
+    """load_results() as a pandas DataFrame, one row per episode."""
+    import pandas as pd
+    return pd.DataFrame(load_results(path))
+
+def convert_csv(csv_path:str, path:str):
+    """Appends the rows of an old final scores CSV (result,castle size,steps,invalid steps) to the log at path."""
+    with open(csv_path) as csv_file, ResultsWriter(path) as writer:
+        for line in csv_file:
+            fields = line.strip().split(',')
+            if len(fields) < 4 or fields[0] not in RESULT_CODES:
+                continue
+            writer.append(fields[0], int(fields[1]), int(fields[2]), int(fields[3]))
+
+
+if __name__ == "__main__":
+    # python results_log.py model3_final_scores.csv model3_final_scores.bin
+    convert_csv(sys.argv[1], sys.argv[2])
+    print(f'{len(load_results(sys.argv[2]))} episodes in {sys.argv[2]}')
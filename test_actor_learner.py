@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+
+import torch
+import torch.multiprocessing as mp
+
+import model
+import actor_learner
+from actor_learner import SharedReplay, SharedWeights, run_actor, train
+from model import DQN, n_observations, n_actions
+from results_log import row_count
+
+# smoke test of the actor-learner plumbing with a single actor process
+TRANSITIONS = 200
+TIMEOUT = 120
+
+
+def test_actor_fills_replay():
+    ctx = mp.get_context('spawn')
+    replay = SharedReplay(4096, 1, 'cpu')
+    weights = SharedWeights(ctx)
+    weights.publish(DQN(n_observations, n_actions))
+    stop = ctx.Event()
+    results = ctx.Queue()
+    actor = ctx.Process(target=run_actor, args=(0, 1, replay, weights, stop, results), daemon=True)
+    actor.start()
+    deadline = time.perf_counter() + TIMEOUT
+    while len(replay) < TRANSITIONS and time.perf_counter() < deadline and actor.is_alive():
+        time.sleep(0.1)
+    stop.set()
+    actor.join(timeout=10)
+    assert len(replay) >= TRANSITIONS
+
+    written = int(replay.counts[0])
+    batch = replay.buffer.gather(torch.arange(min(written, replay.segment)))
+    assert ((batch.actions >= 0) & (batch.actions < n_actions)).all()
+    # every transition that didn't end its game has a legal action to go on with
+    assert batch.next_masks[~batch.dones].any(dim=1).all()
+    sample = replay.sample(64)
+    assert sample.states.shape == (64, n_observations)
+
+def test_publish_pull():
+    weights = SharedWeights(mp.get_context('spawn'))
+    learner_net = DQN(n_observations, n_actions)
+    weights.publish(learner_net)
+    actor_net = DQN(n_observations, n_actions)
+    version = weights.pull(actor_net, -1)
+    assert all(torch.equal(a, b) for a, b in zip(actor_net.state_dict().values(), learner_net.state_dict().values()))
+
+    with torch.no_grad():
+        for parameter in learner_net.parameters():
+            parameter.add_(1.0)
+    # nothing new yet
+    assert weights.pull(actor_net, version) == version
+    assert not torch.equal(actor_net.layer1.weight, learner_net.layer1.weight)
+    weights.publish(learner_net)
+    assert weights.pull(actor_net, version) == version + 1
+    assert all(torch.equal(a, b) for a, b in zip(actor_net.state_dict().values(), learner_net.state_dict().values()))
+
+def test_train_smoke():
+    directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as run_directory:
+        os.chdir(run_directory)
+        try:
+            torch.manual_seed(0)
+            initial = DQN(n_observations, n_actions).to(model.device).state_dict()
+            # train() starts from the same random weights, no model file exists here
+            torch.manual_seed(0)
+            games = train(num_actors=1, gradient_steps=3, duration=TIMEOUT)
+            trained = torch.load(model.MODEL_PKL_PATH, weights_only=True, map_location=model.device)
+            assert not torch.equal(trained['layer1.weight'], initial['layer1.weight'])
+
+            # the actor-learner checkpoints apart from model.py, counting its games as episodes and log rows
+            assert not os.path.exists(model.CHECKPOINT_PATH)
+            checkpoint = torch.load(actor_learner.CHECKPOINT_PATH, weights_only=True)
+            assert checkpoint['memory'] is None and checkpoint['updates'] == 3
+            assert checkpoint['episodes'] == checkpoint['result_rows'] == row_count(actor_learner.RESULTS_PATH) == games
+            # a resumed run goes on counting from there
+            more_games = train(num_actors=1, gradient_steps=3, duration=TIMEOUT, resume=True)
+            checkpoint = torch.load(actor_learner.CHECKPOINT_PATH, weights_only=True)
+            assert checkpoint['updates'] == 6
+            assert checkpoint['episodes'] == row_count(actor_learner.RESULTS_PATH) == games + more_games
+        finally:
+            os.chdir(directory)
+
+
+if __name__ == "__main__":
+    test_actor_fills_replay()
+    test_publish_pull()
+    test_train_smoke()
+    print('test passed')
@@ -0,0 +1,80 @@
+import os
+import random
+import tempfile
+
+import torch
+
+import model
+from model import DQN, Trainer, n_observations, n_actions
+from regicideAI import RegicideGame_AI
+from heuristic import generate_demonstrations
+from replay import ReplayBuffer, PrioritizedReplayBuffer
+
+# a Trainer resumed from a checkpoint must learn exactly like the run that wrote it, down to the last bit
+EPISODES_BEFORE = 12
+EPISODES_AFTER = 4
+BATCH_SIZE = 32
+CAPACITY = 2048
+
+
+def make_trainer(checkpoint_path:str, resume:bool)->Trainer:
+    memory = PrioritizedReplayBuffer(CAPACITY, n_observations, n_actions, model.device)
+    return Trainer(memory=memory, policy_net=DQN(n_observations, n_actions).to(model.device), batch_size=BATCH_SIZE,
+                   resume=resume, checkpoint_path=checkpoint_path)
+
+def play(trainer:Trainer, env:RegicideGame_AI, episodes:int):
+    for _ in range(episodes):
+        trainer.episodes += 1
+        trainer.play_episode(env, trainer.episodes)
+
+
+def test_resume_is_exact():
+    # the unseeded env shuffles with the random module, whose state the checkpoint keeps
+    env = RegicideGame_AI()
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint_path = os.path.join(directory, 'checkpoint.pt')
+        random.seed(0)
+        torch.manual_seed(0)
+        trainer = make_trainer(checkpoint_path, resume=False)
+        play(trainer, env, EPISODES_BEFORE)
+        assert trainer.updates > 0
+        trainer.save_checkpoint(blocking=True)
+        play(trainer, env, EPISODES_AFTER)
+
+        # scrambles the RNGs, the checkpoint has to bring them back
+        random.seed(1)
+        torch.manual_seed(1)
+        resumed = make_trainer(checkpoint_path, resume=True)
+        play(resumed, env, EPISODES_AFTER)
+
+    assert resumed.env_steps == trainer.env_steps and resumed.updates == trainer.updates
+    for name, nets in (('policy', (trainer.policy_net, resumed.policy_net)),
+                       ('target', (trainer.target_net, resumed.target_net))):
+        for expected, actual in zip(*(net.state_dict().values() for net in nets)):
+            assert torch.equal(expected, actual), f'{name} net differs after resuming'
+    assert torch.equal(trainer.memory.states[:len(trainer.memory)], resumed.memory.states[:len(resumed.memory)])
+    assert (trainer.memory.tree.get(range(len(trainer.memory))) ==
+            resumed.memory.tree.get(range(len(resumed.memory)))).all()
+
+def test_demos_are_opt_in():
+    with tempfile.TemporaryDirectory() as directory:
+        demos_path = os.path.join(directory, 'demos.npz')
+        demos = generate_demonstrations(2, workers=1)
+        demos.save(demos_path)
+        checkpoint_path = os.path.join(directory, 'checkpoint.pt')
+        def trainer(**kwargs)->Trainer:
+            return Trainer(memory=ReplayBuffer(CAPACITY, n_observations, n_actions, model.device),
+                           policy_net=DQN(n_observations, n_actions).to(model.device),
+                           checkpoint_path=checkpoint_path, **kwargs)
+        # a demos file alone doesn't fill a Trainer's memory, only passing demos_path does
+        assert len(trainer().memory) == 0
+        assert len(trainer(demos_path=demos_path).memory) == min(len(demos.actions), CAPACITY)
+        # a resumed Trainer keeps the memory of its checkpoint
+        trainer().save_checkpoint(blocking=True)
+        assert len(trainer(resume=True, demos_path=demos_path).memory) == 0
+
+
+if __name__ == "__main__":
+    test_resume_is_exact()
+    test_demos_are_opt_in()
+    print('test passed')
@@ -0,0 +1,77 @@
+import itertools
+import random
+
+from defense import minimal_defenses, ranked_defenses, defense_key, DefensePreference
+from materials import Card
+from regicideAI import RegicideGame_AI
+
+# defense.py's subset-sum solver against brute force over every discard
+HANDS = 3000
+ATTACKS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 15, 20)
+GAMES = 200
+
+
+def brute_force_defenses(hand_attacks:tuple[int, ...], incoming_damage:int)->set[int]:
+    """Position masks of the discards that block incoming_damage while every card is needed to do so."""
+    defenses = set()
+    for size in range(1, len(hand_attacks) + 1):
+        for positions in itertools.combinations(range(len(hand_attacks)), size):
+            total = sum(hand_attacks[position] for position in positions)
+            if total >= incoming_damage and all(total - hand_attacks[position] < incoming_damage
+                                                for position in positions):
+                defenses.add(sum(1 << position for position in positions))
+    return defenses
+
+
+def test_minimal_defenses():
+    rng = random.Random(0)
+    for _ in range(HANDS):
+        hand_attacks = tuple(rng.choice(ATTACKS) for _ in range(rng.randint(1, 8)))
+        incoming_damage = rng.randint(1, 45)
+        defenses = minimal_defenses(hand_attacks, incoming_damage)
+        assert len(set(defenses)) == len(defenses)
+        assert set(defenses) == brute_force_defenses(hand_attacks, incoming_damage)
+
+def test_ranked_defenses():
+    rng = random.Random(1)
+    preference = DefensePreference(keep_aces=True)
+    for _ in range(HANDS):
+        hand = tuple(sorted(rng.sample(range(52), rng.randint(1, 8))))
+        incoming_damage = rng.randint(1, 45)
+        ranked = ranked_defenses(hand, incoming_damage, preference)
+        expected = brute_force_defenses(tuple(Card.ATTACK[card] for card in hand), incoming_damage)
+        assert sorted(ranked) == sorted(expected)
+        keys = [defense_key(hand, mask, preference) for mask in ranked]
+        assert keys == sorted(keys)
+
+def test_candidate_action_mask():
+    # on defend turns the candidates are exactly the legal discards without a card that could be kept
+    rng = random.Random(2)
+    env = RegicideGame_AI()
+    for seed in range(GAMES):
+        random.seed(seed)
+        env.reset()
+        while env.running:
+            candidates = env.candidate_action_mask()
+            legal = env.legal_action_mask()
+            if not env.is_player_turn:
+                hand = env.active_player.hand
+                attack = env.current_enemy.attack
+                minimal = []
+                for action, is_legal in enumerate(legal):
+                    if not is_legal:
+                        minimal.append(False)
+                        continue
+                    values = [Card.ATTACK[hand[position].index] for position in env.int_to_positions[action]]
+                    minimal.append(all(sum(values) - value < attack for value in values))
+                assert candidates == tuple(minimal)
+            else:
+                assert candidates == legal
+            env.step(rng.choice([action for action, candidate in enumerate(candidates) if candidate]))
+
+
+if __name__ == "__main__":
+    test_minimal_defenses()
+    test_ranked_defenses()
+    test_candidate_action_mask()
+    print('test passed')
@@ -0,0 +1,75 @@
+import itertools
+
+from endgame import EndgameSolver
+from materials import Card
+from regicide import GameSnapshot
+from regicideAI import RegicideGame_AI, AIGameSnapshot
+
+# EndgameSolver against plain expectimax over the full game tree on small last king endgames.
+# The brute force tries every legal move, defend turns included, and before each move averages over every order
+# of the whole tavern deck. Hearts are left out, a heart refill would shuffle the discard with the game's generator.
+# ((tavern deck top last, first player's hand, second player's hand, king health, king attack), win probability)
+ENDGAMES = (
+    ((('D3', 'C4'), ('C5', 'D2', 'S6'), ('S3', 'C2', 'D7'), 15, 8), 1.0),
+    ((('C2', 'S3'), ('S2', 'D3'), ('D2', 'C3'), 40, 20), 0.0),
+    ((('C5', 'C9'), ('S8', 'D8'), ('D6', 'C2'), 28, 9), 1 / 2),
+    ((('S10', 'C5', 'D2'), ('C4', 'C2', 'S9', 'D6'), ('C7', 'C9', 'D4'), 38, 16), 1 / 3),
+    ((('D7', 'C8', 'C2'), ('C10', 'CA', 'C3'), ('C4', 'D10', 'D8', 'S8'), 28, 9), 2 / 3),
+    ((('D7', 'C3', 'C8', 'C4'), ('S10', 'D2'), ('D4', 'D8', 'S9', 'S2'), 34, 14), 1 / 24),
+)
+
+
+def cards(names)->list[Card]:
+    return [Card({'C': 'Clubs', 'D': 'Diamonds', 'S': 'Spades'}[name[0]], name[1:]) for name in names]
+
+def endgame(deck, hand_a, hand_b, health:int, attack:int)->AIGameSnapshot:
+    hands = tuple(tuple(sorted(cards(hand), key=lambda card: card.index)) for hand in (hand_a, hand_b))
+    game = GameSnapshot(
+        deck=tuple(cards(deck)), enemies=(), discard=tuple(cards(('C10', 'DJ', 'SQ'))), play_area=(),
+        hands=hands, hand_masks=tuple(sum(1 << card.index for card in hand) for hand in hands),
+        enemy=Card('Hearts', 'K'), enemy_health=health, enemy_attack=attack,
+        active_player_index=0, is_player_turn=True, running=True, game_result=None, turn_number=1,
+    )
+    return AIGameSnapshot(game, 0, 0)
+
+
+def move_value(env:RegicideGame_AI, position:AIGameSnapshot, action:int, memo:dict)->float:
+    """Win probability of action from position, averaged over every order of the tavern deck."""
+    orders = list(itertools.permutations(position.game.deck))
+    total = 0.0
+    for order in orders:
+        env.restore(position)
+        env.deck.cards[:] = order
+        env.step(action)
+        total += brute_force(env, memo)
+    env.restore(position)
+    return total / len(orders)
+
+def brute_force(env:RegicideGame_AI, memo:dict)->float:
+    if not env.running:
+        return 1.0 if env.game_result == 'Win' else 0.0
+    position = env.snapshot()
+    if position.game not in memo:
+        memo[position.game] = max(move_value(env, position, action, memo) for action in env.legal_actions())
+    return memo[position.game]
+
+
+def test_solver_matches_brute_force():
+    env = RegicideGame_AI()
+    solver = EndgameSolver(env.player_names)
+    for position, win_probability in ENDGAMES:
+        root = endgame(*position)
+        env.restore(root)
+        memo = {}
+        expected = brute_force(env, memo)
+        assert abs(expected - win_probability) < 1e-9, (position, expected)
+        result = solver.solve(env, time_limit=None)
+        assert result.exact
+        assert abs(result.win_probability - expected) < 1e-9, (position, result, expected)
+        # the move the solver picks is worth the position's value
+        assert abs(move_value(env, root, result.best_move, memo) - expected) < 1e-9, (position, result)
+
+
+if __name__ == "__main__":
+    test_solver_matches_brute_force()
+    print('test passed')
@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+
+from evaluate import wilson_interval, mean_interval, summarize, play_agent_games, RESULT, DEFEATED, STEPS, INVALID
+from regicideAI import RegicideGame_AI
+
+# 95% Wilson score intervals published in Newcombe (1998), Two-sided confidence intervals for the single
+# proportion, Statistics in Medicine 17, table I, method 3
+NEWCOMBE_WILSON = {
+    (81, 263): (0.2553, 0.3662),
+    (15, 148): (0.0624, 0.1605),
+    (0, 20): (0.0000, 0.1611),
+    (1, 29): (0.0061, 0.1718),
+}
+
+
+def test_wilson_interval():
+    for (successes, n), (low, high) in NEWCOMBE_WILSON.items():
+        interval = wilson_interval(successes, n)
+        assert round(interval[0], 4) == low and round(interval[1], 4) == high, (successes, n, interval)
+    # no successes or no failures, the interval reaches z^2 / (n + z^2) from the edge
+    z2 = 1.959964 ** 2
+    assert np.allclose(wilson_interval(0, 10), (0.0, z2 / (10 + z2)))
+    assert np.allclose(wilson_interval(10, 10), (10 / (10 + z2), 1.0))
+    assert all(math.isnan(bound) for bound in wilson_interval(0, 0))
+
+def test_mean_interval():
+    mean, low, high = mean_interval(np.array([1, 2, 3, 4, 5]))
+    half = 1.959964 * math.sqrt(2.5) / math.sqrt(5)
+    assert mean == 3.0 and np.isclose(low, 3.0 - half) and np.isclose(high, 3.0 + half)
+
+def test_summarize():
+    results = np.zeros((4, 4), dtype=np.int32)
+    results[:, RESULT] = [1, -1, -1, 0]
+    results[:, DEFEATED] = [12, 5, 0, 9]
+    results[:, STEPS] = [40, 30, 10, 5000]
+    results[:, INVALID] = [0, 2, 0, 4]
+    summary = summarize(results)
+    assert summary['games'] == 4 and summary['abandoned'] == 1
+    assert summary['win_rate'][0] == 0.25
+    assert summary['reached_position'][1][0] == 0.75
+    assert summary['reached_position'][9][0] == 0.5
+    assert summary['reached_position'][12][0] == 0.25
+    assert summary['defeated_histogram'] == [1, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1]
+    assert summary['invalid_total'] == 6
+
+class FirstLegal:
+    """Stand in agent that plays the first legal action, to check the agent hook deals the seeded games."""
+    def __init__(self):
+        self.positions = []
+
+    def select_action(self, env:RegicideGame_AI)->int:
+        self.positions.append(env.position_hash())
+        return env.legal_actions()[0]
+
+def test_play_agent_games():
+    agent = FirstLegal()
+    results = play_agent_games(agent, [3, 4])
+    assert results.shape == (2, 4) and (results[:, RESULT] != 0).all() and not results[:, INVALID].any()
+    # replaying seed 3 by hand goes through the same positions
+    env = RegicideGame_AI()
+    env.reset(3)
+    positions = []
+    while env.running:
+        positions.append(env.position_hash())
+        env.step(env.legal_actions()[0])
+    assert agent.positions[:len(positions)] == positions
+    assert results[0, STEPS] == env.steps_taken
+
+
+if __name__ == "__main__":
+    test_wilson_interval()
+    test_mean_interval()
+    test_summarize()
+    test_play_agent_games()
+    print('test passed')
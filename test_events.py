@@ -0,0 +1,21 @@
+from events import EventBus, DeckEmpty
+from materials import Deck
+from regicide import Player
+
+
+def test_unnamed_player_deck_empty():
+    events = EventBus()
+    seen = []
+    events.subscribe(seen.append)
+    deck = Deck(shuffle=False)
+    deck.cards.clear()
+    # a player built without a name still reports the empty deck
+    player = Player(events=events)
+    assert not player.draw_from_deck(deck)
+    assert seen == [DeckEmpty(None)]
+    assert str(player).startswith('None')
+
+
+if __name__ == "__main__":
+    test_unnamed_player_deck_empty()
+    print('test passed')
@@ -0,0 +1,80 @@
+import os
+import random
+import tempfile
+
+from game_record import GameRecorder, GameReplayer, write_records, read_records
+from regicideAI import RegicideGame_AI
+
+# GameReplayer.position(move) against the snapshots taken while the recorded games were played,
+# visited in random order so going back and jumping ahead past checkpoints are both covered
+GAMES = 200
+INTERVAL = 8
+
+
+def test_replay_matches_recording():
+    rng = random.Random(0)
+    env = RegicideGame_AI()
+    recorder = GameRecorder(env)
+    records, snapshots = [], []
+    for game in range(GAMES):
+        recorder.reset(1000 + game)
+        game_snapshots = [env.snapshot()]
+        while env.running:
+            action = rng.choice(env.legal_actions()) if rng.random() < 0.8 else rng.randrange(env.action_space)
+            recorder.step(action)
+            game_snapshots.append(env.snapshot())
+        records.append(recorder.record())
+        snapshots.append(game_snapshots)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.rgr')
+        write_records(path, records[:GAMES // 2])
+        write_records(path, records[GAMES // 2:], append=True)
+        assert list(read_records(path)) == records
+
+    for record, game_snapshots in zip(records, snapshots):
+        replayer = GameReplayer(record, interval=INTERVAL)
+        moves = list(range(len(game_snapshots)))
+        rng.shuffle(moves)
+        for move in moves + [len(replayer), 0]:
+            assert replayer.position(move).snapshot() == game_snapshots[move]
+
+def test_truncated_record():
+    env = RegicideGame_AI()
+    recorder = GameRecorder(env)
+    recorder.reset(7)
+    while env.running:
+        recorder.step(env.legal_actions()[0])
+    record = recorder.record()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.rgr')
+        write_records(path, [record, record])
+        size = os.path.getsize(path)
+        # cut inside the last record's moves, then inside its header
+        for cut in (1, len(record.to_bytes()) - 3):
+            with open(path, 'r+b') as file:
+                file.truncate(size - cut)
+            records = read_records(path)
+            assert next(records) == record
+            try:
+                next(records)
+            except ValueError:
+                pass
+            else:
+                assert False, f'a record cut {cut} bytes short was read'
+
+def test_action_space_limit():
+    env = RegicideGame_AI()
+    env.action_space = 300
+    try:
+        GameRecorder(env)
+    except AssertionError:
+        return
+    assert False, 'actions above 255 would not fit a byte'
+
+
+if __name__ == "__main__":
+    test_replay_matches_recording()
+    test_truncated_record()
+    test_action_space_limit()
+    print('test passed')
@@ -0,0 +1,54 @@
+from concurrent.futures import Future
+
+from inference import InferenceServer, Request
+from model import DQN, n_observations, n_actions
+
+STATE = tuple(range(n_observations))
+
+
+def legal_mask(action:int)->tuple[bool, ...]:
+    return tuple(index == action for index in range(n_actions))
+
+def raises_runtime_error(call)->bool:
+    try:
+        call()
+    except RuntimeError:
+        return True
+    return False
+
+
+def test_act_picks_legal():
+    with InferenceServer(DQN(n_observations, n_actions), device='cpu') as server:
+        for action in (0, 5, n_actions - 1):
+            assert server.act(STATE, legal_mask(action)) == action
+            assert server.act(STATE, legal_mask(action), eps=1.0) == action
+    assert server.decisions == 6
+
+def test_submit_after_close():
+    server = InferenceServer(DQN(n_observations, n_actions), device='cpu')
+    server.close()
+    assert raises_runtime_error(lambda: server.submit(STATE, legal_mask(0)))
+    # closing twice is fine
+    server.close()
+
+def test_pending_requests_fail_on_close():
+    server = InferenceServer(DQN(n_observations, n_actions), max_batch=1, device='cpu')
+    # hold the weights lock so the server stalls evaluating the first request
+    server.lock.acquire()
+    served = server.submit(STATE, legal_mask(3))
+    # a request that got into the queue behind the shutdown sentinel
+    stranded = Future()
+    server.requests.put(None)
+    server.requests.put(Request(STATE, legal_mask(4), 0.0, stranded))
+    server.lock.release()
+    server.thread.join(timeout=10)
+    assert not server.thread.is_alive()
+    assert served.result(timeout=1) == 3
+    assert raises_runtime_error(lambda: stranded.result(timeout=1))
+
+
+if __name__ == "__main__":
+    test_act_picks_legal()
+    test_submit_after_close()
+    test_pending_requests_fail_on_close()
+    print('test passed')
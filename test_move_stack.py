@@ -0,0 +1,41 @@
+import random
+
+from regicideAI import RegicideGame_AI
+
+# RegicideGame_AI.apply()/undo() against snapshot(): a few moves of lookahead from every position of random games,
+# taken back again, must leave the position exactly as it was
+GAMES = 200
+LOOKAHEAD = 4
+
+
+def legal_action(env:RegicideGame_AI, rng:random.Random)->int:
+    return rng.choice([action for action, legal in enumerate(env.legal_action_mask()) if legal])
+
+
+def test_undo_restores_snapshot():
+    rng = random.Random(0)
+    env = RegicideGame_AI()
+    for seed in range(GAMES):
+        random.seed(seed)
+        env.reset()
+        while env.running:
+            before = env.snapshot()
+            state = env.get_state()
+            applied = 0
+            while applied < LOOKAHEAD and env.running:
+                # invalid actions go on the stack too
+                env.apply(legal_action(env, rng) if rng.random() < 0.9 else rng.randrange(env.action_space))
+                applied += 1
+            for _ in range(applied):
+                env.undo()
+            assert not env.move_stack
+            assert env.snapshot() == before
+            assert env.get_state() == state
+            for player in env.players:
+                assert player.hand_mask == sum(1 << card.index for card in player.hand)
+            env.step(legal_action(env, rng))
+
+
+if __name__ == "__main__":
+    test_undo_restores_snapshot()
+    print('test passed')
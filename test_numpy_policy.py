@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from model import DQN, n_observations, n_actions
+from numpy_policy import NumpyDQN, export_policy, quantize_rows, QMAX
+
+
+def policy_and_states(seed:int=0)->tuple[DQN, np.ndarray]:
+    torch.manual_seed(seed)
+    policy_net = DQN(n_observations, n_actions)
+    policy_net.eval()
+    # integer states in the observation's range, like export_policy checks with
+    states = np.random.default_rng(seed).integers(-1, 52, size=(256, n_observations)).astype(np.float32)
+    return policy_net, states
+
+def torch_q_values(policy_net:DQN, states:np.ndarray)->np.ndarray:
+    with torch.no_grad():
+        return policy_net(torch.from_numpy(states)).numpy()
+
+
+def test_float_matches_torch():
+    policy_net, states = policy_and_states()
+    numpy_net = NumpyDQN.from_state_dict(policy_net.state_dict())
+    expected = torch_q_values(policy_net, states)
+    assert np.allclose(numpy_net(states), expected, atol=1e-5)
+    # a single state comes back as a batch of one
+    assert np.allclose(numpy_net(states[0]), expected[:1], atol=1e-5)
+    assert numpy_net.act(states[0]) == expected[0].argmax()
+
+def test_int8_close_to_torch():
+    policy_net, states = policy_and_states()
+    numpy_net = NumpyDQN.from_state_dict(policy_net.state_dict(), quantize=True)
+    assert all(weight.dtype == np.int8 for weight in numpy_net.weights)
+    expected = torch_q_values(policy_net, states)
+    actual = numpy_net(states)
+    assert np.abs(actual - expected).max() < 0.05 * np.abs(expected).max()
+    assert (actual.argmax(1) == expected.argmax(1)).mean() > 0.9
+
+def test_quantize_rows():
+    matrix = np.array([[0.5, -1.0, 0.25], [0.0, 0.0, 0.0]], dtype=np.float32)
+    values, scales = quantize_rows(matrix)
+    # each row's largest magnitude maps to QMAX, an all zero row stays zero
+    assert values[0].tolist() == [64, -QMAX, 32] and not values[1].any()
+    assert np.isclose(scales[0], 1.0 / QMAX)
+    assert np.allclose(values * scales[:, None], matrix, atol=scales[0] / 2)
+
+def test_act_legal_mask():
+    policy_net, states = policy_and_states()
+    numpy_net = NumpyDQN.from_state_dict(policy_net.state_dict())
+    q_values = numpy_net(states[0])[0]
+    legal_mask = np.ones(n_actions, dtype=bool)
+    legal_mask[q_values.argmax()] = False
+    action = numpy_net.act(states[0], legal_mask)
+    assert legal_mask[action] and q_values[action] == q_values[legal_mask].max()
+
+def test_export_round_trip():
+    policy_net, states = policy_and_states()
+    with tempfile.TemporaryDirectory() as directory:
+        for quantize in (False, True):
+            path = os.path.join(directory, f'policy{quantize:d}.npz')
+            check = export_policy(policy_net, path, quantize, states)
+            assert check['argmax_agreement'] > 0.9
+            loaded = NumpyDQN.load(path)
+            assert loaded.quantized == quantize
+            assert np.array_equal(loaded(states), NumpyDQN.from_state_dict(policy_net.state_dict(), quantize)(states))
+        assert check['max_abs_error'] > 0.0
+        assert os.path.getsize(os.path.join(directory, 'policy1.npz')) < os.path.getsize(os.path.join(directory, 'policy0.npz'))
+
+
+if __name__ == "__main__":
+    test_float_matches_torch()
+    test_int8_close_to_torch()
+    test_quantize_rows()
+    test_act_legal_mask()
+    test_export_round_trip()
+    print('test passed')
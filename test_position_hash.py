@@ -0,0 +1,53 @@
+import random
+
+from materials import zobrist_hash, ZOBRIST_ENEMY, ZOBRIST_HEALTH, ZOBRIST_ATTACK, ZOBRIST_PLAYER, \
+    ZOBRIST_DEFENDING, ZOBRIST_RESULT
+from regicideAI import RegicideGame_AI
+
+# RegicideGame.position_hash(), kept up to date as cards move, against a hash recomputed from the whole position
+GAMES = 300
+
+
+def full_hash(env:RegicideGame_AI)->int:
+    result = 0
+    for deck in (env.deck, env.enemies, env.discard, env.play_area):
+        result ^= zobrist_hash(deck.cards, deck.zone)
+    for player in env.players:
+        result ^= zobrist_hash(player.hand, player.zone)
+    enemy = env.current_enemy
+    if enemy:
+        result ^= ZOBRIST_ENEMY[enemy.card.index] ^ ZOBRIST_HEALTH[enemy.health % 64] \
+            ^ ZOBRIST_ATTACK[enemy.attack % 64]
+    result ^= ZOBRIST_PLAYER[env.active_player_index] ^ ZOBRIST_RESULT[env.game_result]
+    if not env.is_player_turn:
+        result ^= ZOBRIST_DEFENDING
+    return result
+
+
+def test_incremental_hash():
+    rng = random.Random(0)
+    env = RegicideGame_AI()
+    for seed in range(GAMES):
+        env.reset(seed)
+        assert env.position_hash() == full_hash(env)
+        while env.running:
+            key = env.position_hash()
+            env.apply(rng.choice(env.legal_actions()))
+            assert env.position_hash() == full_hash(env)
+            env.undo()
+            assert env.position_hash() == key == full_hash(env)
+            env.step(rng.choice(env.legal_actions()) if rng.random() < 0.9 else rng.randrange(env.action_space))
+            assert env.position_hash() == full_hash(env)
+
+def test_hidden_order():
+    # the order of the tavern deck is hidden, rearranging it in place (as endgame.py does) keeps the hash valid
+    env = RegicideGame_AI(seed=0)
+    key = env.position_hash()
+    random.Random(0).shuffle(env.deck.cards)
+    assert env.position_hash() == key == full_hash(env)
+
+
+if __name__ == "__main__":
+    test_incremental_hash()
+    test_hidden_order()
+    print('test passed')
@@ -0,0 +1,143 @@
+import io
+
+import numpy as np
+import torch
+
+from replay import ReplayBuffer, PrioritizedReplayBuffer, SumTree
+
+N_OBSERVATIONS = 5
+N_ACTIONS = 13
+
+
+def transition(step:int)->tuple:
+    """Transition number step, every field derived from it so a slot shows which step it holds."""
+    state = torch.full((1, N_OBSERVATIONS), step)
+    mask = torch.tensor([(step + action) % 3 == 0 for action in range(N_ACTIONS)]).unsqueeze(0)
+    done = step % 4 == 3
+    return state, step % N_ACTIONS, None if done else state + 1, float(step), None if done else mask
+
+
+def test_push_wraps_around():
+    memory = ReplayBuffer(8, N_OBSERVATIONS, N_ACTIONS)
+    for step in range(11):
+        memory.push(*transition(step))
+    assert len(memory) == 8 and memory.position == 3
+    # steps 8, 9, 10 overwrote the oldest slots, 3 .. 7 still hold steps 3 .. 7
+    batch = memory.gather(torch.arange(8))
+    steps = [8, 9, 10, 3, 4, 5, 6, 7]
+    assert batch.rewards.tolist() == [float(step) for step in steps]
+    for row, step in enumerate(steps):
+        state, action, next_state, reward, mask = transition(step)
+        assert batch.states[row].tolist() == state[0].tolist()
+        assert batch.actions[row, 0] == action
+        assert batch.dones[row] == (next_state is None)
+        if next_state is None:
+            assert not batch.next_masks[row].any() and not batch.next_states[row].any()
+        else:
+            assert batch.next_states[row].tolist() == next_state[0].tolist()
+            assert batch.next_masks[row].tolist() == mask[0].tolist()
+
+def test_push_batch_wraps_around():
+    memory = ReplayBuffer(8, N_OBSERVATIONS, N_ACTIONS)
+    for step in range(6):
+        memory.push(*transition(step))
+    states = torch.arange(5).repeat_interleave(N_OBSERVATIONS).view(5, N_OBSERVATIONS) + 100
+    masks = torch.rand((5, N_ACTIONS), generator=torch.Generator().manual_seed(0)) < 0.5
+    slots = memory.push_batch(states, torch.arange(5), states + 1, torch.arange(5) + 100.0,
+                              torch.tensor([False, True, False, False, True]), masks)
+    assert slots.tolist() == [6, 7, 0, 1, 2]
+    assert len(memory) == 8 and memory.position == 3
+    batch = memory.gather(slots)
+    assert batch.states.tolist() == states.float().tolist()
+    assert batch.rewards.tolist() == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert batch.next_masks.tolist() == masks.tolist()
+    # slots the batch didn't reach keep their transitions
+    assert memory.gather(torch.tensor([3, 5])).rewards.tolist() == [3.0, 5.0]
+
+def test_sample_stays_in_filled_slots():
+    memory = ReplayBuffer(64, N_OBSERVATIONS, N_ACTIONS)
+    for step in range(10):
+        memory.push(*transition(step))
+    batch = memory.sample(1000)
+    assert batch.indices.min() >= 0 and batch.indices.max() < 10
+    assert batch.rewards.tolist() == batch.indices.float().tolist()
+
+
+def test_sum_tree():
+    tree = SumTree(5)
+    tree.update([0, 1, 2, 3, 4], [1.0, 2.0, 0.0, 3.0, 0.5])
+    assert tree.total() == 6.5
+    assert tree.get([0, 3, 4]).tolist() == [1.0, 3.0, 0.5]
+    # each leaf owns the prefix sum range [sum before it, sum including it), empty leaves own nothing
+    values = [0.0, 0.999, 1.0, 2.999, 3.0, 5.999, 6.0, 6.499]
+    assert tree.find(values).tolist() == [0, 0, 1, 1, 3, 3, 4, 4]
+    tree.update([1], 0.0)
+    assert tree.total() == 4.5
+    assert tree.find([1.0, 1.5]).tolist() == [3, 3]
+
+def test_prioritized_sampling():
+    memory = PrioritizedReplayBuffer(4, N_OBSERVATIONS, N_ACTIONS, alpha=0.5, beta_start=0.4, beta_steps=10)
+    for step in range(4):
+        memory.push(*transition(step))
+    memory.rng = np.random.default_rng(0)
+    td_errors = torch.tensor([1.0, 4.0, 9.0, 16.0]) - memory.epsilon
+    memory.update_priorities(torch.arange(4), td_errors)
+    # priority ** alpha is 1, 2, 3, 4
+    assert np.allclose(memory.tree.get(range(4)), [1.0, 2.0, 3.0, 4.0])
+    assert np.isclose(memory.max_priority, 16.0)
+
+    counts = np.zeros(4)
+    for _ in range(2000):
+        counts += np.bincount(memory.sample(10).indices.numpy(), minlength=4)
+    assert np.allclose(counts / counts.sum(), [0.1, 0.2, 0.3, 0.4], atol=0.01)
+    # new transitions start at the highest priority seen
+    memory.push(*transition(4))
+    assert np.isclose(memory.tree.get([0])[0], 4.0)
+
+def test_importance_sampling_weights():
+    memory = PrioritizedReplayBuffer(4, N_OBSERVATIONS, N_ACTIONS, alpha=1.0, beta_start=0.5, beta_steps=4)
+    for step in range(4):
+        memory.push(*transition(step))
+    memory.update_priorities(torch.arange(4), torch.tensor([1.0, 2.0, 3.0, 4.0]) - memory.epsilon)
+    for beta in (0.5, 0.625, 0.75, 0.875, 1.0, 1.0):
+        assert np.isclose(memory.beta, beta)
+        batch = memory.sample(8)
+        # (size * P(i)) ** -beta over its batch maximum, the lowest priority in the batch gets weight 1
+        probabilities = (batch.indices.numpy() + 1) / 10
+        expected = (4 * probabilities) ** -beta
+        assert np.allclose(batch.weights.numpy(), expected / expected.max())
+
+def test_state_dict_round_trip():
+    memory = PrioritizedReplayBuffer(8, N_OBSERVATIONS, N_ACTIONS)
+    for step in range(11):
+        memory.push(*transition(step))
+    memory.update_priorities(torch.arange(8), torch.arange(8.0))
+    memory.sample(4)
+    # through torch.save like a checkpoint, and loaded the way model.Trainer does
+    file = io.BytesIO()
+    torch.save(memory.state_dict(), file)
+    file.seek(0)
+    restored = PrioritizedReplayBuffer(8, N_OBSERVATIONS, N_ACTIONS)
+    restored.load_state_dict(torch.load(file, weights_only=True))
+
+    assert (restored.position, len(restored), restored.samples_taken) == (memory.position, len(memory), 1)
+    everything = torch.arange(8)
+    for expected, actual in zip(memory.gather(everything)[:-1], restored.gather(everything)[:-1]):
+        assert torch.equal(expected, actual)
+    assert np.array_equal(memory.tree.tree, restored.tree.tree)
+    # both go on identically, the next write lands on the same slot and the sampler continues its stream
+    memory.push(*transition(11))
+    restored.push(*transition(11))
+    assert torch.equal(memory.sample(6).indices, restored.sample(6).indices)
+    assert np.array_equal(memory.tree.tree, restored.tree.tree)
+
+
+if __name__ == "__main__":
+    test_push_wraps_around()
+    test_push_batch_wraps_around()
+    test_sample_stays_in_filled_slots()
+    test_sum_tree()
+    test_prioritized_sampling()
+    test_importance_sampling_weights()
+    test_state_dict_round_trip()
+    print('test passed')
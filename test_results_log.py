@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+from results_log import ResultsWriter, load_results, row_count, MAGIC, RESULT_DTYPE
+
+
+def write_episodes(path:str, steps, rows:int=None, flush_every:int=4)->ResultsWriter:
+    writer = ResultsWriter(path, flush_every=flush_every, rows=rows)
+    for step in steps:
+        writer.append('Win' if step % 2 else 'Lose', step % 12, step, step // 2, step / 10)
+    return writer
+
+
+def test_buffering():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.bin')
+        writer = write_episodes(path, range(6))
+        # the first 4 went out with the full buffer, 2 wait for the next flush
+        assert row_count(path) == 4 and len(writer) == 6
+        writer.close()
+        results = load_results(path)
+        assert results['Steps'].tolist() == list(range(6))
+        assert results['Result'].tolist() == [-1, 1, -1, 1, -1, 1]
+        del results
+
+def test_resume_truncates():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.bin')
+        write_episodes(path, range(10)).close()
+        # a run resumed from a checkpoint taken after 7 episodes drops the 3 it is about to play again
+        writer = write_episodes(path, range(100, 103), rows=7)
+        writer.close()
+        assert len(writer) == 10
+        assert load_results(path)['Steps'].tolist() == list(range(7)) + [100, 101, 102]
+
+        # rows past the end of the file keep everything
+        write_episodes(path, [200], rows=50).close()
+        assert row_count(path) == 11
+
+def test_partial_row_dropped():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'results.bin')
+        write_episodes(path, range(3)).close()
+        # a crash in the middle of a write leaves part of a row
+        with open(path, 'ab') as file:
+            file.write(b'\x01\x02\x03')
+        assert row_count(path) == 3
+        write_episodes(path, [9]).close()
+        assert os.path.getsize(path) == len(MAGIC) + 4 * RESULT_DTYPE.itemsize
+        assert load_results(path)['Steps'].tolist() == [0, 1, 2, 9]
+
+
+if __name__ == "__main__":
+    test_buffering()
+    test_resume_truncates()
+    test_partial_row_dropped()
+    print('test passed')
@@ -0,0 +1,87 @@
+import random
+
+import numpy as np
+
+from materials import Card, HEARTS
+from regicideAI import RegicideGame_AI, action_positions
+from vector_env import VectorRegicideEnv, RESULT_WIN, RESULT_LOSE
+
+# VectorRegicideEnv against RegicideGame_AI in lockstep: before every move the vector env is set to the scalar game's
+# position, then both play the same action. Heart refills shuffle the discard differently in the two, so the moves
+# that may refill are played but not compared.
+GAMES = 300
+INVALID_RATE = 0.1
+
+
+def copy_position(env:RegicideGame_AI, vector_env:VectorRegicideEnv):
+    """Sets row 0 of vector_env to env's position."""
+    deck = [card.index for card in env.deck.cards]
+    vector_env.deck[0, :] = 0
+    vector_env.deck[0, :len(deck)] = deck
+    vector_env.deck_len[0] = len(deck)
+    castle = [card.index for card in env.enemies.cards]
+    vector_env.castle[0, :] = 0
+    vector_env.castle[0, :len(castle)] = castle
+    vector_env.castle_len[0] = len(castle)
+    vector_env.discard[0] = np.uint64(sum(1 << card.index for card in env.discard.cards))
+    vector_env.play_area[0] = np.uint64(sum(1 << card.index for card in env.play_area.cards))
+    for index, player in enumerate(env.players):
+        vector_env.hands[0, index] = np.uint64(player.hand_mask)
+    enemy = env.current_enemy
+    vector_env.enemy[0] = enemy.card.index
+    vector_env.enemy_health[0] = enemy.health
+    vector_env.enemy_attack[0] = enemy.attack
+    vector_env.active_player[0] = env.active_player_index
+    vector_env.is_player_turn[0] = env.is_player_turn
+    vector_env.running[0] = env.running
+    vector_env.game_result[0] = 0
+    vector_env.steps_taken[0] = env.steps_taken
+    vector_env.invalid_steps_taken[0] = env.invalid_steps_taken
+
+def may_refill(env:RegicideGame_AI, action:int)->bool:
+    """Whether action plays a heart with cards in the discard."""
+    if not env.is_player_turn or not len(env.discard) or action >= env.action_space:
+        return False
+    hand = env.active_player.hand
+    positions = action_positions(env.active_player.hand_limit)[action] or ()
+    return any(position < len(hand) and Card.SUIT[hand[position].index] == HEARTS for position in positions)
+
+
+def test_lockstep():
+    rng = random.Random(0)
+    env = RegicideGame_AI()
+    vector_env = VectorRegicideEnv(1, seed=0)
+    compared = 0
+    for seed in range(GAMES):
+        # games deal from the random module
+        random.seed(seed)
+        env.reset()
+        while env.running:
+            copy_position(env, vector_env)
+            mask = env.legal_action_mask()
+            assert tuple(vector_env.legal_action_mask()[0]) == mask
+            assert list(vector_env.get_state()[0]) == env.get_state()
+            if rng.random() < INVALID_RATE:
+                action = rng.randrange(env.action_space)
+            else:
+                action = rng.choice([action for action, legal in enumerate(mask) if legal])
+            skip = may_refill(env, action)
+            state, reward, done, invalid_action = env.step(action)
+            states, rewards, dones, invalid_actions = vector_env.step(np.array([action]))
+            if skip:
+                continue
+            compared += 1
+            assert rewards[0] == reward and dones[0] == done
+            if done:
+                assert vector_env.final_steps[0] == env.steps_taken
+                assert vector_env.final_enemies[0] == len(env.enemies)
+                assert vector_env.final_result[0] == (RESULT_WIN if env.game_result == 'Win' else RESULT_LOSE)
+            else:
+                assert invalid_actions[0] == invalid_action
+                assert list(states[0]) == state
+    assert compared > GAMES
+
+
+if __name__ == "__main__":
+    test_lockstep()
+    print('test passed')
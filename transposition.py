@@ -0,0 +1,160 @@
+from typing import NamedTuple
+
+# bound of a stored value: exact, or a lower/upper bound from a search cut short
+EXACT, LOWER, UPPER = range(3)
+# replacement policies, what store() does when the slot of a new position holds another one:
+# - 'always': the newest entry wins
+# - 'depth': the entry searched deeper wins, ties go to the newest
+# - 'two_tier': each bucket has a depth preferred slot and an always replaced slot
+REPLACEMENT_POLICIES = ('always', 'depth', 'two_tier')
+
+
+class TTEntry(NamedTuple):
+    value: float
+    depth: int
+    best_move: int
+    bound: int
+
+
+class TranspositionTable:
+    """
+    Bounded cache of search results keyed by RegicideGame.position_hash().
+    The table has a power of two number of slots, a position goes to the slot of its low hash bits and the full
+    hash is kept to tell positions sharing a slot apart. Entries are held in parallel lists preallocated
+    at size, so the table never grows past it.
+    depth is how deep below the position the value was searched, best_move is -1 when there is none.
+    """
+
+    def __init__(self, size:int=1 << 20, policy:str='depth'):
+        assert size > 0 and size & (size - 1) == 0, 'size must be a power of two'
+        assert policy in REPLACEMENT_POLICIES, f'policy must be one of {REPLACEMENT_POLICIES}'
+        assert policy != 'two_tier' or size > 1, 'two_tier needs at least one bucket of two slots'
+        self.size = size
+        self.policy = policy
+        # two_tier buckets are slot pairs, the even slot is depth preferred
+        self.mask = size - 2 if policy == 'two_tier' else size - 1
+        self.keys: list[int | None] = [None] * size
+        self.values = [0.0] * size
+        self.depths = [0] * size
+        self.moves = [-1] * size
+        self.bounds = [EXACT] * size
+        self.used = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __len__(self):
+        return self.used
+
+    def slot_of(self, key:int)->int | None:
+        """Slot holding key, None if it isn't stored."""
+        slot = key & self.mask
+        if self.keys[slot] == key:
+            return slot
+        if self.policy == 'two_tier' and self.keys[slot + 1] == key:
+            return slot + 1
+        return None
+
+    def get(self, key:int, depth:int=0)->TTEntry | None:
+        """Entry of key searched at least depth deep, None if there isn't one."""
+        self.probes += 1
+        slot = self.slot_of(key)
+        if slot is None or self.depths[slot] < depth:
+            return None
+        self.hits += 1
+        return TTEntry(self.values[slot], self.depths[slot], self.moves[slot], self.bounds[slot])
+
+    def __contains__(self, key:int)->bool:
+        return self.slot_of(key) is not None
+
+    def store(self, key:int, value:float, depth:int=0, best_move:int=-1, bound:int=EXACT)->bool:
+        """Stores a search result, returns False if the replacement policy kept the entry already there."""
+        slot = self.slot_of(key)
+        if slot is None:
+            slot = key & self.mask
+            if self.policy == 'depth':
+                if self.keys[slot] is not None and self.depths[slot] > depth:
+                    return False
+            elif self.policy == 'two_tier' and self.keys[slot] is not None:
+                # the depth preferred slot only gives way to deeper results, the rest go to the other slot
+                if self.depths[slot] > depth:
+                    slot += 1
+                else:
+                    self.move_slot(slot, slot + 1)
+            if self.keys[slot] is None:
+                self.used += 1
+            else:
+                self.overwrites += 1
+        elif self.depths[slot] > depth and self.policy != 'always':
+            # a shallower result never replaces a deeper one of the same position
+            return False
+
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+        self.moves[slot] = best_move
+        self.bounds[slot] = bound
+        self.stores += 1
+        return True
+
+    def move_slot(self, source:int, target:int):
+        """Moves the entry of source over target's, a two_tier entry pushed out of its depth preferred slot."""
+        if self.keys[target] is None:
+            self.used += 1
+        else:
+            self.overwrites += 1
+        self.keys[target] = self.keys[source]
+        self.values[target] = self.values[source]
+        self.depths[target] = self.depths[source]
+        self.moves[target] = self.moves[source]
+        self.bounds[target] = self.bounds[source]
+        self.keys[source] = None
+        self.used -= 1
+
+    def best_move(self, key:int)->int:
+        """Best move stored for key, to try first in a search, -1 if unknown."""
+        slot = self.slot_of(key)
+        return -1 if slot is None else self.moves[slot]
+
+    def clear(self):
+        for slot in range(self.size):
+            self.keys[slot] = None
+        self.used = 0
+
+    def stats(self)->dict:
+        return {
+            'size': self.size,
+            'used': self.used,
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from regicideAI import RegicideGame_AI
+
+    # counts how often random lookahead from a real position meets a position it has already seen
+    env = RegicideGame_AI(seed=0)
+    rng = random.Random(0)
+    table = TranspositionTable(1 << 16)
+    root = env.snapshot()
+    start = time.perf_counter()
+    for _ in range(2000):
+        env.restore(root)
+        for depth in range(8):
+            if not env.running:
+                break
+            key = env.position_hash()
+            if table.get(key) is None:
+                table.store(key, 0.0)
+            legal = env.legal_actions()
+            env.step(legal[rng.randrange(len(legal))])
+    stats = table.stats()
+    print(f"{stats['probes']} probes, {stats['hit_rate']:.1%} transpositions, {stats['used']} positions stored, "
+          f'{time.perf_counter() - start:.2f}s')
@@ -0,0 +1,416 @@
+import numpy as np
+from materials import Card, CLUBS, DIAMONDS, HEARTS, SPADES
+from regicideAI import action_positions, BYTE_BITS
+
+# card tables as arrays, indexed by card index
+CARD_ATTACK = np.array(Card.ATTACK, dtype=np.int16)
+CARD_HEALTH = np.array(Card.HEALTH, dtype=np.int16)
+CARD_SUIT = np.array(Card.SUIT, dtype=np.int8)
+CARD_VALUE = np.array(Card.VALUE_ORDER, dtype=np.int8)
+CARD_BIT = np.left_shift(np.uint64(1), np.arange(52, dtype=np.uint64))
+TAVERN_CARDS = np.array([index for index in range(52) if Card.HEALTH[index] == 0], dtype=np.int8)
+# set bits of each byte, popcount for NumPy before 2.0, which has no np.bitwise_count
+BYTE_COUNT = BYTE_BITS.sum(axis=1, dtype=np.int16)
+# castle ranks from the bottom of the castle deck up, kings are fought last
+CASTLE_RANKS = np.array([12, 11, 10], dtype=np.int8)
+
+# values stored in VectorRegicideEnv.game_result
+RESULT_NONE, RESULT_WIN, RESULT_LOSE = 0, 1, -1
+
+
+def mask_bits(masks:np.ndarray)->np.ndarray:
+    """Expands an array of 52 bit card masks into a (len, 52) bool array."""
+    return (masks[:, None] & CARD_BIT) != 0
+
+def mask_count(masks:np.ndarray)->np.ndarray:
+    """Number of cards in each card mask."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks).astype(np.int16)
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return BYTE_COUNT[masks.view(np.uint8)].reshape(*masks.shape, 8).sum(axis=-1, dtype=np.int16)
+
+def cards_to_mask(cards:np.ndarray, keep:np.ndarray)->np.ndarray:
+    """ORs the bits of cards (rows of card indices) where keep is True into one mask per row."""
+    bits = np.where(keep, CARD_BIT[np.maximum(cards, 0)], np.uint64(0))
+    return np.bitwise_or.reduce(bits, axis=1)
+
+
+class VectorRegicideEnv:
+    """
+    Runs num_envs games of RegicideGame_AI in lockstep, with the whole game state held in NumPy arrays.
+
+    Same rules, rewards, action space (RegicideGame_AI.int_to_icmd) and observation layout
+    (RegicideGame_AI.get_state()) as the single game env.
+    Finished games are reset automatically inside step(), the returned observation for those rows
+    is the first state of the new game. The finished game's stats are kept in the final_* arrays.
+
+    Piles:
+    - deck and castle are card index arrays with a length, the top card is at index length - 1.
+    - discard and play area are card masks, their order never matters since the discard
+      is shuffled before a card is taken from it.
+    - hands are card masks, so the sorted hand is the set bits in increasing order.
+    """
+
+    def __init__(self, num_envs:int, num_players:int=2, hand_limit:int=7, seed=None):
+        assert num_players * hand_limit <= len(TAVERN_CARDS), 'Not enough tavern cards to deal starting hands'
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.hand_limit = hand_limit
+        self.rng = np.random.default_rng(seed)
+
+        positions = action_positions(hand_limit)
+        self.action_space = len(positions)
+        # action_uses[a, p] is True when action a plays the card at hand position p
+        self.action_uses = np.zeros((self.action_space, hand_limit), dtype=bool)
+        self.action_last_position = np.full(self.action_space, -1, dtype=np.int16)
+        for action, action_positions_ in enumerate(positions):
+            if action_positions_:
+                self.action_uses[action, list(action_positions_)] = True
+                self.action_last_position[action] = action_positions_[-1]
+        self.action_size = self.action_uses.sum(axis=1)
+        self.action_uses_float = self.action_uses.astype(np.float32)
+        self.observation_size = 8 + num_players + hand_limit
+
+        n = num_envs
+        self.deck = np.zeros((n, 52), dtype=np.int8)
+        self.deck_len = np.zeros(n, dtype=np.int16)
+        self.castle = np.zeros((n, 12), dtype=np.int8)
+        self.castle_len = np.zeros(n, dtype=np.int16)
+        self.discard = np.zeros(n, dtype=np.uint64)
+        self.play_area = np.zeros(n, dtype=np.uint64)
+        self.hands = np.zeros((n, num_players), dtype=np.uint64)
+        self.enemy = np.zeros(n, dtype=np.int8)
+        self.enemy_health = np.zeros(n, dtype=np.int16)
+        self.enemy_attack = np.zeros(n, dtype=np.int16)
+        self.active_player = np.zeros(n, dtype=np.int16)
+        self.is_player_turn = np.zeros(n, dtype=bool)
+        self.running = np.zeros(n, dtype=bool)
+        self.game_result = np.zeros(n, dtype=np.int8)
+        self.steps_taken = np.zeros(n, dtype=np.int32)
+        self.invalid_steps_taken = np.zeros(n, dtype=np.int32)
+
+        # stats of the games that finished on the last step, only valid where the returned done is True
+        self.final_result = np.zeros(n, dtype=np.int8)
+        self.final_enemies = np.zeros(n, dtype=np.int16)
+        self.final_steps = np.zeros(n, dtype=np.int32)
+        self.final_invalid_steps = np.zeros(n, dtype=np.int32)
+
+        self.all_rows = np.arange(n)
+        self.reset()
+
+    def reset(self)->np.ndarray:
+        """Starts a new game in every env and returns the observations."""
+        self.reset_rows(self.all_rows)
+        return self.get_state()
+
+    def reset_rows(self, rows:np.ndarray):
+        """Starts a new game in the given envs."""
+        r = len(rows)
+        if r == 0:
+            return
+        # shuffled tavern deck
+        order = np.argsort(self.rng.random((r, len(TAVERN_CARDS))), axis=1)
+        self.deck[rows, :len(TAVERN_CARDS)] = TAVERN_CARDS[order]
+        self.deck_len[rows] = len(TAVERN_CARDS)
+        # castle deck, suits shuffled within each rank
+        suits = np.argsort(self.rng.random((r, len(CASTLE_RANKS), 4)), axis=2)
+        self.castle[rows] = (suits * 13 + CASTLE_RANKS[None, :, None]).reshape(r, 12)
+        self.castle_len[rows] = 12
+
+        self.discard[rows] = 0
+        self.play_area[rows] = 0
+        self.hands[rows] = 0
+        for player in range(self.num_players):
+            top = len(TAVERN_CARDS) - player * self.hand_limit
+            cards = self.deck[rows, top - self.hand_limit:top]
+            self.hands[rows, player] = cards_to_mask(cards, np.ones(cards.shape, dtype=bool))
+            self.deck_len[rows] -= self.hand_limit
+
+        self.active_player[rows] = 0
+        self.is_player_turn[rows] = True
+        self.running[rows] = True
+        self.game_result[rows] = RESULT_NONE
+        self.steps_taken[rows] = 0
+        self.invalid_steps_taken[rows] = 0
+        self.next_enemy(rows)
+
+    def active_hands(self, rows:np.ndarray)->np.ndarray:
+        return self.hands[rows, self.active_player[rows]]
+
+    def hand_cards(self, rows:np.ndarray)->np.ndarray:
+        """Sorted card indices of the active player's hand, padded with -1 to hand_limit."""
+        bits = mask_bits(self.active_hands(rows))
+        # stable sort puts held cards first, in increasing card order
+        cards = np.argsort(~bits, axis=1, kind='stable')[:, :self.hand_limit].astype(np.int16)
+        cards[np.arange(self.hand_limit)[None, :] >= bits.sum(axis=1)[:, None]] = -1
+        return cards
+
+    def max_defense(self, rows:np.ndarray)->np.ndarray:
+        """RegicideGame.Player.calc_max_defense for the active player of each env."""
+        return mask_bits(self.active_hands(rows)) @ CARD_ATTACK
+
+    def get_state(self)->np.ndarray:
+        """Observation of every env, one row in the RegicideGame_AI.get_state() layout."""
+        rows = self.all_rows
+        state = np.empty((self.num_envs, self.observation_size), dtype=np.int16)
+        state[:, 0] = self.deck_len
+        state[:, 1] = mask_count(self.discard)
+        state[:, 2] = self.castle_len
+        state[:, 3] = self.enemy
+        state[:, 4] = self.enemy_health
+        state[:, 5] = self.enemy_attack
+        state[:, 6] = self.is_player_turn
+        state[:, 7] = self.active_player
+        state[:, 8:8 + self.num_players] = mask_count(self.hands)
+        state[:, 8 + self.num_players:] = self.hand_cards(rows)
+        return state
+
+    def legal_action_mask(self)->np.ndarray:
+        """(num_envs, action_space) bool array, RegicideGame_AI.legal_action_mask() for every env."""
+        rows = self.all_rows
+        cards = self.hand_cards(rows)
+        held = cards >= 0
+        in_hand = (self.action_last_position[None, :] >= 0) & \
+            (self.action_last_position[None, :] < held.sum(axis=1)[:, None])
+
+        # attack multicard rules, only aces and 2 to 5 can be played with other cards.
+        # rank_counts[:, v - 1, a] is how many cards of value v action a would play
+        values = np.where(held, CARD_VALUE[np.maximum(cards, 0)], 0)
+        low_ranks = (values[:, None, :] == np.arange(1, 6)[None, :, None]).astype(np.float32)
+        rank_counts = low_ranks @ self.action_uses_float.T
+        size = self.action_size[None, :]
+        same_value = rank_counts == size[:, None, :]
+        attack_legal = (size == 1) | \
+            ((size == 2) & ((rank_counts[:, 0] > 0) | same_value[:, 1:5].any(axis=1))) | \
+            ((size == 3) & same_value[:, 1:3].any(axis=1)) | \
+            ((size == 4) & same_value[:, 1])
+
+        # defense must block the enemy attack
+        attacks = np.where(held, CARD_ATTACK[np.maximum(cards, 0)], 0)
+        defend_legal = attacks.astype(np.float32) @ self.action_uses_float.T >= self.enemy_attack[:, None]
+
+        legal = np.where(self.is_player_turn[:, None], attack_legal, defend_legal)
+        return legal & in_hand & self.running[:, None]
+
+    @staticmethod
+    def follows_multicard_rules(played:np.ndarray)->np.ndarray:
+        """regicide.follows_multicard_rules for an array of played card masks."""
+        rank_counts = mask_bits(played).reshape(-1, 4, 13).sum(axis=1)
+        size = rank_counts.sum(axis=1)
+        ranks_used = (rank_counts > 0).sum(axis=1)
+        value = rank_counts.argmax(axis=1) + 1
+        return (size == 1) | \
+            ((size == 2) & (rank_counts[:, 0] > 0)) | \
+            ((ranks_used == 1) & (value >= 2) & (value <= 5) & (size * value <= 10))
+
+    def step(self, actions)->tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Plays one action in every env, same as RegicideGame_AI.step().
+        Returns (states, rewards, dones, invalid_actions) arrays.
+        """
+        actions = np.asarray(actions)
+        rows = self.all_rows
+        self.steps_taken += 1
+        reward = np.zeros(self.num_envs, dtype=np.float32)
+
+        last_position = self.action_last_position[actions]
+        count = mask_count(self.active_hands(rows))
+        is_yield = last_position < 0
+        # trying to play a card that doesn't exist, nothing else happens this step
+        missing_card = ~is_yield & (last_position >= count)
+
+        cards = self.hand_cards(rows)
+        uses = self.action_uses[actions]
+        played = cards_to_mask(cards, uses & (cards >= 0))
+        played_attack = mask_bits(played) @ CARD_ATTACK
+
+        playable = ~missing_card & ~is_yield
+        attack = playable & self.is_player_turn & self.follows_multicard_rules(played)
+        defend = playable & ~self.is_player_turn & (played_attack >= self.enemy_attack)
+        invalid = ~(attack | defend)
+        reward[invalid] = -10
+        self.invalid_steps_taken += invalid
+
+        # player attacks
+        attack_rows = rows[attack]
+        if len(attack_rows):
+            self.hands[attack_rows, self.active_player[attack_rows]] &= ~played[attack_rows]
+            self.play_area[attack_rows] |= played[attack_rows]
+            self.attack_enemy(attack_rows, played[attack_rows])
+            reward[attack_rows] = self.max_defense(attack_rows) # larger reward for keeping larger cards
+            self.is_player_turn[attack_rows] = False
+            defeated = attack_rows[self.check_enemy_defeated(attack_rows)]
+            reward[defeated] += 50
+            self.is_player_turn[defeated] = True
+
+        # player defends
+        defend_rows = rows[defend]
+        if len(defend_rows):
+            self.hands[defend_rows, self.active_player[defend_rows]] &= ~played[defend_rows]
+            self.discard[defend_rows] |= played[defend_rows]
+            self.next_player(defend_rows)
+            self.is_player_turn[defend_rows] = True
+            reward[defend_rows] = self.max_defense(defend_rows) # larger reward for keeping larger cards
+
+        # forced moves, same loop as RegicideGame_AI.step
+        live = rows[~missing_card]
+        self.check_no_cards(live)
+        forced = live
+        while len(forced):
+            forced = forced[self.running[forced]]
+            turn = self.is_player_turn[forced]
+            forced = np.concatenate([
+                self.check_auto_attack(forced[turn]),
+                self.check_auto_defend(forced[~turn]),
+            ])
+            self.check_no_cards(forced)
+        self.check_no_cards(live)
+
+        done = ~self.running
+        reward[done & (self.game_result == RESULT_WIN)] = 1000
+        reward[done & (self.game_result == RESULT_LOSE)] = -1000
+
+        done_rows = rows[done]
+        self.final_result[done_rows] = self.game_result[done_rows]
+        self.final_enemies[done_rows] = self.castle_len[done_rows]
+        self.final_steps[done_rows] = self.steps_taken[done_rows]
+        self.final_invalid_steps[done_rows] = self.invalid_steps_taken[done_rows]
+        self.reset_rows(done_rows)
+
+        return self.get_state(), reward, done, invalid
+
+    def next_player(self, rows:np.ndarray):
+        self.active_player[rows] = (self.active_player[rows] + 1) % self.num_players
+
+    def attack_enemy(self, rows:np.ndarray, played:np.ndarray):
+        """RegicideGame.attack_enemy, deals damage and applies suit effects."""
+        bits = mask_bits(played)
+        cards_value = (bits @ CARD_ATTACK).astype(np.int16)
+        suits_played = bits.reshape(-1, 4, 13).any(axis=2)
+        # enemies are immune to their own suit
+        effects = suits_played & (CARD_SUIT[self.enemy[rows]][:, None] != np.arange(4)[None, :])
+
+        self.enemy_health[rows] -= cards_value * np.where(effects[:, CLUBS], 2, 1).astype(np.int16)
+
+        spades = effects[:, SPADES]
+        self.enemy_attack[rows[spades]] = np.maximum(
+            self.enemy_attack[rows[spades]] - cards_value[spades], 0)
+
+        # important to apply hearts before diamonds
+        hearts = effects[:, HEARTS]
+        self.refill_tavern(rows[hearts], cards_value[hearts])
+        diamonds = effects[:, DIAMONDS]
+        self.deal_to_players(rows[diamonds], cards_value[diamonds])
+
+    def shuffled_order(self, bits:np.ndarray)->np.ndarray:
+        """Card indices of each row, set cards first in random order."""
+        keys = np.where(bits, self.rng.random(bits.shape), 2.0)
+        return np.argsort(keys, axis=1)
+
+    def refill_tavern(self, rows:np.ndarray, number:np.ndarray):
+        """RegicideGame.refill_tavern, shuffles the discard then moves number cards onto the tavern deck."""
+        if len(rows) == 0:
+            return
+        bits = mask_bits(self.discard[rows])
+        order = self.shuffled_order(bits)
+        moved = np.minimum(number, bits.sum(axis=1))
+        take = np.arange(52)[None, :] < moved[:, None]
+        take_row, take_pos = np.nonzero(take)
+        env_rows = rows[take_row]
+        self.deck[env_rows, self.deck_len[env_rows] + take_pos] = order[take_row, take_pos]
+        self.deck_len[rows] += moved.astype(np.int16)
+        self.discard[rows] &= ~cards_to_mask(order, take)
+
+    def deal_to_players(self, rows:np.ndarray, number:np.ndarray):
+        """RegicideGame.deal_to_players, number cards dealt one at a time starting with the active player."""
+        for i in range(int(number.max(initial=0))):
+            dealing = rows[number > i]
+            player = (self.active_player[dealing] + i) % self.num_players
+            can_draw = (mask_count(self.hands[dealing, player]) < self.hand_limit) & (self.deck_len[dealing] > 0)
+            dealing, player = dealing[can_draw], player[can_draw]
+            self.deck_len[dealing] -= 1
+            self.hands[dealing, player] |= CARD_BIT[self.deck[dealing, self.deck_len[dealing]]]
+
+    def check_enemy_defeated(self, rows:np.ndarray)->np.ndarray:
+        """RegicideGame.check_enemy_defeated, returns a bool per row, True if the enemy was defeated."""
+        health = self.enemy_health[rows]
+        defeated = health <= 0
+
+        # exact damage, defeated enemy goes to the bottom of the tavern deck (where add_card_on_top puts it)
+        exact = rows[health == 0]
+        self.deck[exact, 1:] = self.deck[exact, :-1]
+        self.deck[exact, 0] = self.enemy[exact]
+        self.deck_len[exact] += 1
+
+        overkill = rows[health < 0]
+        self.discard[overkill] |= CARD_BIT[self.enemy[overkill]]
+
+        self.next_enemy(rows[defeated])
+        return defeated
+
+    def next_enemy(self, rows:np.ndarray):
+        """RegicideGame.next_enemy, draws the next castle card or wins the game."""
+        has_enemy = self.castle_len[rows] > 0
+        fighting = rows[has_enemy]
+        self.discard[fighting] |= self.play_area[fighting]
+        self.play_area[fighting] = 0
+        self.castle_len[fighting] -= 1
+        enemy = self.castle[fighting, self.castle_len[fighting]]
+        self.enemy[fighting] = enemy
+        self.enemy_health[fighting] = CARD_HEALTH[enemy]
+        self.enemy_attack[fighting] = CARD_ATTACK[enemy]
+
+        won = rows[~has_enemy]
+        self.running[won] = False
+        self.game_result[won] = RESULT_WIN
+        self.enemy[won] = -1
+        self.enemy_health[won] = 0
+        self.enemy_attack[won] = 0
+
+    def check_auto_attack(self, rows:np.ndarray)->np.ndarray:
+        """RegicideGame_AI.check_auto_attack for rows on the player's turn, returns the rows that made a forced move."""
+        count = mask_count(self.active_hands(rows))
+        total = mask_count(self.hands[rows]).sum(axis=1)
+
+        # no cards, forced to yield
+        empty = rows[count == 0]
+        self.is_player_turn[empty] = False
+
+        # only card left between all players, attack with it
+        last = rows[(count == 1) & (total == 1)]
+        if len(last):
+            played = self.active_hands(last)
+            self.hands[last, self.active_player[last]] = 0
+            self.play_area[last] |= played
+            self.attack_enemy(last, played)
+            self.is_player_turn[last] = False
+            self.is_player_turn[last[self.check_enemy_defeated(last)]] = True
+
+        return np.concatenate([empty, last])
+
+    def check_auto_defend(self, rows:np.ndarray)->np.ndarray:
+        """RegicideGame_AI.check_auto_defend for rows on the enemy's turn, returns the rows that made a forced move."""
+        attack = self.enemy_attack[rows]
+        no_attack = attack <= 0
+
+        max_defense = self.max_defense(rows)
+        lose = ~no_attack & (max_defense < attack)
+        self.running[rows[lose]] = False
+        self.game_result[rows[lose]] = RESULT_LOSE
+
+        count = mask_count(self.active_hands(rows))
+        all_cards = ~no_attack & ~lose & ((count == 1) | (max_defense == attack))
+        spent = rows[all_cards]
+        # same as Player.play_all_cards, the cards are not added to any pile
+        self.hands[spent, self.active_player[spent]] = 0
+
+        forced = rows[no_attack | all_cards]
+        self.is_player_turn[forced] = True
+        self.next_player(forced)
+        return forced
+
+    def check_no_cards(self, rows:np.ndarray):
+        """RegicideGame_AI.check_no_cards, a running game where no player has cards is lost."""
+        out = rows[self.running[rows] & (self.hands[rows] == 0).all(axis=1)]
+        self.running[out] = False
+        self.game_result[out] = RESULT_LOSE